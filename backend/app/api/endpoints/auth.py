@@ -1,35 +1,53 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.models.user import User
 from app.schemas.auth import UserCreate, UserResponse, LoginRequest, Token
-from app.services.auth_service import get_password_hash, verify_password, create_access_token
+from app.config import settings
+from app.core.executor import ExecutorSaturated
+from app.services.auth_service import (
+    hash_password_async, verify_password_async, needs_rehash, create_access_token
+)
 
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+
+def _hashing_busy() -> HTTPException:
+    logger.warning("Password hash queue full, shedding auth request")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication service is busy. Please retry shortly.",
+        headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+    )
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register(user_in: UserCreate, db: Session = Depends(get_db)):
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists
-    user = db.query(User).filter(User.email == user_in.email).first()
+    user = (await db.execute(select(User.id).where(User.email == user_in.email))).first()
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A user with this email already exists."
         )
     
-    # Create new user
+    # Create new user (bcrypt runs on the password-hash pool)
+    try:
+        hashed_password = await hash_password_async(user_in.password)
+    except ExecutorSaturated:
+        raise _hashing_busy()
     new_user = User(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password)
+        hashed_password=hashed_password
     )
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         logger.info(f"User registered successfully: {user_in.email}", extra={"user_id": new_user.id})
         return new_user
     except Exception as e:
@@ -37,9 +55,13 @@ def register(user_in: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Database error during registration")
 
 @router.post("/login", response_model=Token)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == login_data.email).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.email == login_data.email))).scalars().first()
+    try:
+        verified = user is not None and await verify_password_async(login_data.password, user.hashed_password)
+    except ExecutorSaturated:
+        raise _hashing_busy()
+    if not verified:
         logger.warning(f"Failed login attempt for email: {login_data.email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -47,6 +69,16 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = create_access_token(data={"sub": user.email})
+    # Transparently move the stored hash to the configured bcrypt cost
+    if needs_rehash(user.hashed_password):
+        try:
+            user.hashed_password = await hash_password_async(login_data.password)
+            await db.commit()
+            logger.info(f"Upgraded password hash to cost {settings.BCRYPT_ROUNDS}", extra={"user_id": user.id})
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"Password hash upgrade skipped for user {user.id}: {e}")
+
+    access_token = create_access_token(data={"sub": user.email, "uid": user.id})
     logger.info(f"User logged in successfully: {user.email}")
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,100 +1,508 @@
 """
 Disease Detection Endpoint
-Orchestrates: Image Upload → ML Prediction → DB Lookup → Response
+Orchestrates: Image Upload → Cache → ML Prediction → Knowledge Index Lookup → Response
+Every successful detection is queued for the scan history (write-behind).
+Responses are assembled from JSON the knowledge index serialized once per
+disease; only the prediction fields are encoded per request.
+Uploads are size-limited while streaming and decoded from the spooled file
+(see app.core.uploads).
+
+Besides JPEG/PNG/WebP photos, clients on slow links can send the pixels
+already at the model resolution as raw uint8 RGB (RAW_RGB_CONTENT_TYPE,
+~196KB at 256x256); those skip decode and resize entirely. GET
+/api/detect/input reports the shape the loaded model expects.
+
+Models that expose their penultimate layer also return each image's
+embedding; it is recorded for /api/detect/similar (see app.services.embeddings).
 """
+import asyncio
 import io
+import json
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
+import dataclasses
+import functools
+import math
+import zipfile
+from datetime import datetime, timezone
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple, Union
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from PIL import Image
-from app.database import get_db
-from app.models.disease import Disease
-from app.services.ml_service import ml_service
-from app.schemas.disease import DetectionResponse
+from app.services.ml_service import ml_service, canonical_name, LoadedModel, Prediction
+from app.services.preprocessing import RawPixels
+from app.services.disease_index import disease_catalog, response_fragment
+from app.schemas.disease import DetectionResponse, SimilarCasesResponse
 from app.config import settings
-from app.services.auth_service import get_current_user
-from app.models.user import User
-from app.core.limiter import limiter
+from app.services.auth_service import get_current_user, Principal
+from app.core.limiter import rate_limit
+from app.core.executor import inference_executor, ExecutorSaturated, InFlight
+from app.core import metrics
+from app.core.uploads import Upload, read_upload, check_dimensions, upload_too_large, ImageTooLargeError
+from app.services.prediction_cache import prediction_cache, cache_key, content_hash
+from app.services.scan_writer import scan_writer
+from app.services.embeddings import embedding_store, embedding_writer, image_key, IndexNotReady
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+RAW_RGB_CONTENT_TYPE = "application/vnd.krishinet.rgb8"
+
+
+class InvalidImageError(Exception):
+    """Uploaded bytes could not be parsed as an image."""
+
+
+def _decode_and_predict(source: Union[BinaryIO, RawPixels], model: LoadedModel, crop: Optional[str]):
+    """Blocking part of a detection; runs on the inference executor."""
+    if isinstance(source, RawPixels):
+        try:
+            return ml_service.classify(source, model, crop)
+        except ValueError as e:  # model swapped to another input size since validation
+            raise InvalidImageError(str(e))
+    try:
+        image = Image.open(source)  # header only
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except Exception as e:
+        raise InvalidImageError(str(e))
+    check_dimensions(image)
+    return ml_service.classify(image, model, crop)
+
+
+async def _run_prediction(source: Union[BinaryIO, RawPixels], model: LoadedModel, crop: Optional[str]) -> Prediction:
+    # Fail fast while the model is still loading instead of queueing behind it
+    if not ml_service.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Detection model is still loading. Please retry shortly.",
+            headers={"Retry-After": str(settings.MODEL_LOADING_RETRY_AFTER_SECONDS)},
+        )
+    # Parse image and run the model off the event loop
+    try:
+        return await inference_executor.run(_decode_and_predict, source, model, crop)
+    except ExecutorSaturated:
+        logger.warning("Inference queue full, shedding detection request")
+        raise HTTPException(
+            status_code=503,
+            detail="Detection service is busy. Please retry shortly.",
+            headers={"Retry-After": str(settings.INFERENCE_RETRY_AFTER_SECONDS)},
+        )
+    except InvalidImageError:
+        raise HTTPException(status_code=400, detail="Could not read image. Ensure it is a valid JPEG/PNG.")
+    except ImageTooLargeError as e:
+        logger.warning(f"Rejected oversized image: {e}")
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image dimensions exceed {settings.MAX_IMAGE_PIXELS // 1000000}MP limit.",
+        )
+    except Exception as e:
+        logger.error(f"ML prediction failed: {e}")
+        raise HTTPException(status_code=500, detail=f"ML prediction failed: {e}")
+
+
+async def _predict_cached(upload: Upload, model: LoadedModel, crop: Optional[str]) -> Prediction:
+    """Serve retried uploads from the cache; concurrent duplicates share one run."""
+    key = cache_key(upload.sha256, model.version, crop)
+    # Waiters on the same key read the first caller's spooled file
+    return await prediction_cache.get_or_compute(
+        key, lambda: _run_prediction(upload.file, model, crop), cacheable=lambda prediction: not prediction.fallback
+    )
+
+
+# Detections between admission and buffering their scan; shutdown waits for them
+detections_in_flight = InFlight()
+
+
+async def _detect_and_record(
+    upload: Upload, model: LoadedModel, crop: Optional[str], user: Principal, latitude, longitude
+) -> Prediction:
+    with detections_in_flight:
+        prediction = await _predict_cached(upload, model, crop)
+        if prediction.fallback:
+            # The stub answer of a service without a model is not a scan
+            return prediction
+        # Buffered; flushed to the scans table in bulk by the writer thread
+        scan_writer.record(
+            user_id=user.id,
+            class_index=prediction.class_index,
+            disease_name=prediction.disease_name,
+            confidence=prediction.confidence,
+            model_version=prediction.model_version,
+            latitude=latitude,
+            longitude=longitude,
+            image_sha256=upload.sha256,
+        )
+        if prediction.embedding is not None:
+            embedding_writer.record(
+                model_version=prediction.model_version,
+                embedding=prediction.embedding,
+                image_sha256=upload.sha256,
+                class_index=prediction.class_index,
+                confidence=prediction.confidence,
+                user_id=user.id,
+            )
+    return prediction
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def _check_content_type(content_type: Optional[str]):
+    media_type = _media_type(content_type)
+    if not media_type.startswith("image/") and media_type != RAW_RGB_CONTENT_TYPE:
+        raise HTTPException(status_code=400, detail="File must be an image (JPEG/PNG).")
+
+
+def _prepare_input(upload: Upload, content_type: Optional[str], model: LoadedModel) -> Upload:
+    """Raw pixels must match the model's input exactly; photos of any size are resized."""
+    if _media_type(content_type) != RAW_RGB_CONTENT_TYPE:
+        return upload
+    width, height = model.input_size
+    if upload.size != width * height * 3:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Raw RGB input must be {height}x{width}x3 uint8 ({width * height * 3} bytes), "
+                   f"got {upload.size} bytes.",
+        )
+    return dataclasses.replace(upload, file=RawPixels(upload.file))
+
+
+# Static members for a prediction missing from the disease catalog
+UNKNOWN_DISEASE_FRAGMENT = response_fragment(None, "UNKNOWN", ["Consult a local agricultural expert."])
+
+
+class EncodedJSONResponse(Response):
+    """A body that is already JSON bytes; rendering is a pass-through."""
+    media_type = "application/json"
+
+
+@functools.lru_cache(maxsize=1024)
+def _json_value(value: Optional[str]) -> bytes:
+    # Disease names, model versions and crops come from small, fixed sets
+    return json.dumps(value, ensure_ascii=False).encode()
+
+
+def _json_float(value: float) -> bytes:
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"Out of range float value is not JSON compliant: {value}")
+    return repr(value).encode()
+
+
+def _encode_response(prediction: Prediction, crop: Optional[str], model: LoadedModel) -> bytes:
+    """
+    The DetectionResponse object as JSON, byte for byte what JSONResponse
+    makes of the equivalent dict. Hindi name, severity and treatment are
+    serialized once per disease by the knowledge index; only the prediction
+    fields are encoded here. `model` is the version that made the prediction.
+    """
+    # Knowledge lookup (in-memory, by the model's class index)
+    with metrics.stage_timer("knowledge_lookup"):
+        _, fragment = disease_catalog.for_class(model.version, model.classes, prediction.class_index)
+        fragment = fragment or UNKNOWN_DISEASE_FRAGMENT
+
+    with metrics.stage_timer("serialization"):
+        return b"".join((
+            b'{"success":true,"disease_name":', _json_value(prediction.disease_name),
+            b',"confidence":', _json_float(prediction.confidence),
+            b",", fragment,
+            b',"model_version":', _json_value(prediction.model_version),
+            b',"crop":', _json_value(crop),
+            b"}",
+        ))
+
+
+@router.get("/detect/input")
+async def detection_input():
+    """Input formats /api/detect accepts, and the exact shape for raw RGB."""
+    width, height = ml_service.input_size
+    return {
+        "model_version": ml_service.model_version,
+        "width": width,
+        "height": height,
+        "channels": 3,
+        "dtype": "uint8",
+        "raw_content_type": RAW_RGB_CONTENT_TYPE,
+        "raw_bytes": width * height * 3,
+        "image_content_types": ["image/jpeg", "image/png", "image/webp"],
+        "crops": ml_service.active.crops,
+    }
+
 
 @router.post(
     "/detect",
     response_model=DetectionResponse,
     responses={
-        400: {"description": "Invalid image file or format"},
-        413: {"description": "Image exceeds 5MB limit"},
+        400: {"description": "Invalid image file or format, or raw RGB of the wrong shape"},
+        413: {"description": "Image exceeds 5MB limit or the pixel limit"},
         422: {"description": "Missing required file field"},
-        500: {"description": "ML prediction or database failure"},
+        429: {"description": "Per-user detection rate limit exceeded; retry after the Retry-After delay"},
+        500: {"description": "ML prediction failure"},
+        503: {"description": "Model still loading or inference queue full; retry after the Retry-After delay"},
     },
+    dependencies=[Depends(rate_limit("detect"))],
 )
-@limiter.limit("10/minute")
 async def detect_disease(
-    request: Request,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    file: UploadFile = File(
+        ..., description=f"A JPEG/PNG/WebP photo, or {RAW_RGB_CONTENT_TYPE} pixels (see GET /api/detect/input)"
+    ),
+    latitude: Optional[float] = Form(None, ge=-90, le=90, description="Where the photo was taken"),
+    longitude: Optional[float] = Form(None, ge=-180, le=180),
+    crop: Optional[str] = Form(
+        None, max_length=64, description="Crop in the photo (see GET /api/detect/input); unknown crops are ignored"
+    ),
+    current_user: Principal = Depends(get_current_user)
 ):
     # 1. Validate file type
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image (JPEG/PNG).")
+    _check_content_type(file.content_type)
 
-    # 2. Read and validate file size
-    contents = await file.read()
-    if len(contents) > settings.MAX_UPLOAD_SIZE:
-        raise HTTPException(status_code=413, detail="Image exceeds 5MB limit.")
+    # 2. Hash in chunks, stopping at the size limit (no copy of the upload is made)
+    with metrics.stage_timer("upload_read"):
+        upload = await read_upload(file)
 
-    # 3. Parse image
-    try:
-        image = Image.open(io.BytesIO(contents))
-    except Exception:
-        raise HTTPException(status_code=400, detail="Could not read image. Ensure it is a valid JPEG/PNG.")
+    # 3. ML Model Prediction (+ scan history). The version is picked once the
+    #    upload is in and held until the prediction is done.
+    with ml_service.checkout(current_user.id) as model:
+        upload = _prepare_input(upload, file.content_type, model)
+        crop = model.resolve_crop(crop)
+        prediction = await _detect_and_record(upload, model, crop, current_user, latitude, longitude)
+    logger.info("Detection successful for %s", current_user.email, extra={
+        "disease": prediction.disease_name,
+        "confidence": round(prediction.confidence, 4),
+        "crop": crop,
+        "user_email": current_user.email
+    })
+
+    # 4. Build response (encoded here, so response_model only documents it)
+    return EncodedJSONResponse(_encode_response(prediction, crop, model))
+
+
+@router.post(
+    "/detect/similar",
+    response_model=SimilarCasesResponse,
+    responses={
+        400: {"description": "Invalid image file or format, or raw RGB of the wrong shape"},
+        413: {"description": "Image exceeds 5MB limit or the pixel limit"},
+        429: {"description": "Per-user detection rate limit exceeded; retry after the Retry-After delay"},
+        501: {"description": "The served model version exposes no features to compare images with"},
+        503: {"description": "Model or similarity index still loading, or inference queue full"},
+    },
+    dependencies=[Depends(rate_limit("detect"))],
+)
+async def similar_cases(
+    file: UploadFile = File(..., description="The leaf photo to compare (same formats as /api/detect)"),
+    crop: Optional[str] = Form(None, max_length=64, description="Crop in the photo, as for /api/detect"),
+    limit: int = Form(10, ge=1, le=50, description="How many cases to return"),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Earlier scans whose leaves look most like this one: the requester's own
+    scans (near duplicates are flagged) and other farmers' confident
+    detections. The photo itself is not recorded as a scan.
+    """
+    _check_content_type(file.content_type)
+    with metrics.stage_timer("upload_read"):
+        upload = await read_upload(file)
+    with ml_service.checkout(current_user.id) as model:
+        upload = _prepare_input(upload, file.content_type, model)
+        crop = model.resolve_crop(crop)
+        prediction = await _predict_cached(upload, model, crop)
+    if prediction.embedding is None:
+        raise HTTPException(
+            status_code=501,
+            detail=f"Similar-case search is not available for model version {model.version}.",
+        )
 
-    # 4. ML Model Prediction
     try:
-        disease_name, confidence = ml_service.predict(image)
-        logger.info(f"Detection successful for {current_user.email}", extra={
-            "disease": disease_name,
-            "confidence": round(confidence, 4),
-            "user_email": current_user.email
+        with metrics.stage_timer("similarity_search"):
+            matches = await asyncio.to_thread(
+                embedding_store.search, model.version, prediction.embedding, limit,
+                current_user.id, settings.SIMILAR_CASES_MIN_CONFIDENCE,
+            )
+    except IndexNotReady:
+        raise HTTPException(
+            status_code=503,
+            detail="Similar-case index is still loading. Please retry shortly.",
+            headers={"Retry-After": str(settings.MODEL_LOADING_RETRY_AFTER_SECONDS)},
+        )
+
+    query_image = image_key(upload.sha256)
+    cases = []
+    for match in matches:
+        label = model.classes[match["class_index"]] if match["class_index"] < len(model.classes) else "Unknown"
+        cases.append({
+            "disease_name": canonical_name(label),
+            "confidence": round(match["confidence"], 4),
+            "similarity": round(match["similarity"], 4),
+            "scanned_at": datetime.fromtimestamp(match["created_at"], tz=timezone.utc).isoformat(),
+            "own_scan": match["own_scan"],
+            "duplicate": match["image"] == query_image
+                         or match["similarity"] >= settings.EMBEDDING_DUPLICATE_SIMILARITY,
         })
-    except Exception as e:
-        logger.error(f"ML prediction failed: {e}")
-        raise HTTPException(status_code=500, detail=f"ML prediction failed: {e}")
+    with metrics.stage_timer("serialization"):
+        return JSONResponse({
+            "disease_name": prediction.disease_name,
+            "confidence": prediction.confidence,
+            "model_version": prediction.model_version,
+            "crop": crop,
+            "duplicate": any(case["duplicate"] for case in cases),
+            "cases": cases,
+        })
+
+
+# ======================
+# Batch detection
+# ======================
+
+class _BatchItem:
+    """One image of a batch; `read` (-> Upload) is awaited lazily so uploads are not all held in memory."""
+
+    def __init__(self, index: int, filename: str, content_type: str, read):
+        self.index = index
+        self.filename = filename
+        self.content_type = content_type
+        self.read = read
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Tuple[bytes, str]:
+    # Members share the archive's file; zipfile serializes their reads
+    with archive.open(info) as member:
+        contents = member.read(settings.MAX_UPLOAD_SIZE + 1)
+    return contents, content_hash(contents)
+
 
-    # 5. Disease DB Lookup
+def _zip_items(upload: UploadFile, start_index: int) -> List[_BatchItem]:
     try:
-        disease_record = db.query(Disease).filter(Disease.name == disease_name).first()
+        archive = zipfile.ZipFile(upload.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"{upload.filename} is not a valid zip archive.")
+
+    items = []
+    for info in archive.infolist():
+        if info.is_dir() or info.filename.startswith("__MACOSX/"):
+            continue
+
+        # file_size is the declared uncompressed size; refuse before inflating,
+        # and stop inflating at the limit in case it lies
+        async def read(info=info):
+            if info.file_size > settings.MAX_UPLOAD_SIZE:
+                raise upload_too_large()
+            # Inflating (up to MAX_UPLOAD_SIZE) and hashing block; keep them off the loop
+            contents, digest = await asyncio.to_thread(_read_member, archive, info)
+            if len(contents) > settings.MAX_UPLOAD_SIZE:
+                raise upload_too_large()
+            return Upload(io.BytesIO(contents), digest, len(contents))
+
+        items.append(_BatchItem(start_index + len(items), info.filename, "image/*", read))
+    return items
+
+
+def _collect_items(files: List[UploadFile]) -> List[_BatchItem]:
+    items: List[_BatchItem] = []
+    for upload in files:
+        is_zip = upload.content_type in ZIP_CONTENT_TYPES or (upload.filename or "").lower().endswith(".zip")
+        if is_zip:
+            items.extend(_zip_items(upload, len(items)))
+        else:
+            items.append(_BatchItem(
+                len(items), upload.filename, upload.content_type or "", lambda upload=upload: read_upload(upload)
+            ))
+        if len(items) > settings.MAX_BATCH_IMAGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"A batch may contain at most {settings.MAX_BATCH_IMAGES} images.",
+            )
+    if not items:
+        raise HTTPException(status_code=400, detail="The batch contains no images.")
+    return items
+
+
+def _batch_line(item: _BatchItem, body: bytes) -> bytes:
+    # The /api/detect object with the item's position first
+    return b'{"index":%d,"filename":%s,%s\n' % (item.index, json.dumps(item.filename, ensure_ascii=False).encode(), body[1:])
+
+
+async def _detect_item(
+    item: _BatchItem, slots: asyncio.Semaphore, user: Principal, location, crop_hint: Optional[str]
+) -> Tuple[bool, bytes]:
+    """(success, NDJSON line)"""
+    try:
+        _check_content_type(item.content_type)
+        async with slots:
+            with metrics.stage_timer("upload_read"):
+                upload = await item.read()
+            with ml_service.checkout(user.id) as model:
+                upload = _prepare_input(upload, item.content_type, model)
+                crop = model.resolve_crop(crop_hint)
+                prediction = await _detect_and_record(upload, model, crop, user, *location)
+        return True, _batch_line(item, _encode_response(prediction, crop, model))
+    except HTTPException as e:
+        return False, _batch_error(item, e.status_code, e.detail)
     except Exception as e:
-        logger.error(f"Database lookup failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Database lookup failed: {e}")
-
-    # 6. Build response
-    response_data = {
-        "success": True,
-        "disease_name": disease_name,
-        "confidence": confidence,
-    }
+        logger.error(f"Batch item {item.index} failed: {e}")
+        return False, _batch_error(item, 500, "Detection failed")
 
-    if disease_record:
-        # Treatment is stored as newline-separated text in the DB.
-        response_data.update({
-            "disease_name_hi": disease_record.name_hi,
-            "severity": disease_record.severity,
-            "treatment": {
-                "steps": disease_record.treatment.split('\n') if disease_record.treatment else []
-            }
-        })
-    else:
-        response_data.update({
-            "disease_name_hi": None,
-            "severity": "UNKNOWN",
-            "treatment": {
-                "steps": ["Consult a local agricultural expert."]
-            }
+
+def _batch_error(item: _BatchItem, status: int, error: str) -> bytes:
+    with metrics.stage_timer("serialization"):
+        body = json.dumps({"success": False, "status": status, "error": error}, ensure_ascii=False,
+                          separators=(",", ":")).encode()
+    return _batch_line(item, body)
+
+
+async def _stream_results(
+    items: List[_BatchItem], user: Principal, location, crop_hint: Optional[str]
+) -> AsyncIterator[bytes]:
+    # Enough images in flight to fill one inference batch, without letting a
+    # single request take over the whole executor queue.
+    slots = asyncio.Semaphore(settings.INFERENCE_BATCH_SIZE)
+    tasks = [asyncio.ensure_future(_detect_item(item, slots, user, location, crop_hint)) for item in items]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            success, line = await next_done
+            succeeded += success
+            yield line
+    finally:
+        for task in tasks:
+            task.cancel()
+        logger.info("Batch detection finished for %s", user.email, extra={
+            "images": len(items),
+            "succeeded": succeeded,
+            "user_email": user.email,
         })
 
-    return response_data
+
+@router.post(
+    "/detect/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": (
+                "One JSON object per line (NDJSON), emitted as each image finishes. "
+                "Successful lines have the /api/detect fields plus `index` and `filename`; "
+                "failed lines have `success: false`, `status` and `error`."
+            ),
+            "content": {"application/x-ndjson": {}},
+        },
+        400: {"description": "Empty batch or invalid zip archive"},
+        413: {"description": "Too many images in one batch"},
+        429: {"description": "Per-user batch rate limit exceeded; retry after the Retry-After delay"},
+    },
+    dependencies=[Depends(rate_limit("detect_batch"))],
+)
+async def detect_disease_batch(
+    files: List[UploadFile] = File(..., description="Leaf images, or a single zip of images"),
+    latitude: Optional[float] = Form(None, ge=-90, le=90, description="Where the photos were taken"),
+    longitude: Optional[float] = Form(None, ge=-180, le=180),
+    crop: Optional[str] = Form(None, max_length=64, description="Crop shown in every photo of the batch"),
+    current_user: Principal = Depends(get_current_user)
+):
+    items = _collect_items(files)
+    return StreamingResponse(
+        _stream_results(items, current_user, (latitude, longitude), crop),
+        media_type="application/x-ndjson",
+    )
@@ -3,7 +3,7 @@ Application Configuration
 Reads settings from .env file
 """
 
-from typing import List, Union
+from typing import Dict, List, Union
 import json
 
 from pydantic_settings import BaseSettings
@@ -17,6 +17,12 @@ class Settings(BaseSettings):
     # Database
     # ======================
     DATABASE_URL: str
+    # Request handlers use an async engine on the same database (asyncpg for
+    # PostgreSQL, aiosqlite for SQLite); background threads keep the sync one.
+    # Each engine gets its own pool of this size.
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SECONDS: int = 30
 
     # ======================
     # Security
@@ -24,6 +30,16 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 10080
+    # Verified tokens are cached so protected calls skip the user query.
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CACHE_TTL_SECONDS: int = 300
+    # bcrypt cost; stored hashes with a different cost are re-hashed on login.
+    BCRYPT_ROUNDS: int = 12
+    # Password hashing gets its own pool (0 workers = half the cores). When
+    # its queue is full, register/login answer 503 with Retry-After.
+    PASSWORD_HASH_WORKERS: int = 0
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 1
 
     # ======================
     # API Keys
@@ -66,6 +82,10 @@ class Settings(BaseSettings):
     # File Upload
     # ======================
     MAX_UPLOAD_SIZE: int = 5242880  # 5MB
+    MAX_BATCH_IMAGES: int = 64  # per /api/detect/batch request
+    # Checked from the image header before decoding. PNG/WebP decode at full
+    # size (3 bytes/pixel); JPEGs are decoded scaled down (draft mode).
+    MAX_IMAGE_PIXELS: int = 40000000  # 40MP
     UPLOAD_DIR: str = "uploads"
 
     # ======================
@@ -73,6 +93,123 @@ class Settings(BaseSettings):
     # ======================
     DISEASE_MODEL_PATH: str = "../ai-models/trained_models/disease_model.h5"
     PRICE_MODEL_PATH: str = "../ai-models/trained_models/price_model.h5"
+    # Runtime for the disease model: keras (DISEASE_MODEL_PATH), tflite or onnx.
+    # Produce the other formats with scripts/export_model.py.
+    INFERENCE_BACKEND: str = "keras"
+    TFLITE_MODEL_PATH: str = "../ai-models/trained_models/disease_model_int8.tflite"
+    ONNX_MODEL_PATH: str = "../ai-models/trained_models/disease_model.onnx"
+    INFERENCE_THREADS: int = 0  # runtime intra-op threads, 0 = runtime default
+    # The model loads in the background after startup; until it is ready
+    # /api/detect answers 503 with this Retry-After.
+    MODEL_LOADING_RETRY_AFTER_SECONDS: int = 5
+    # Versioned models (see app.services.model_registry). Without
+    # registry.json the *_MODEL_PATH above is served. Workers poll for a new
+    # active version / canary and swap it in after warm-up; the replaced model
+    # is closed once requests still using it are done (after the grace period).
+    MODEL_REGISTRY_DIR: str = "../ai-models/registry"
+    MODEL_REGISTRY_POLL_SECONDS: float = 30.0  # 0 disables hot reload
+    MODEL_RETIRE_GRACE_SECONDS: float = 30.0
+
+    # ======================
+    # Inference
+    # ======================
+    # Concurrent predictions are grouped into one forward pass of up to
+    # INFERENCE_BATCH_SIZE images, waiting at most INFERENCE_BATCH_MAX_DELAY_MS
+    # after the first one arrives.
+    INFERENCE_BATCH_SIZE: int = 8
+    INFERENCE_BATCH_MAX_DELAY_MS: float = 5.0
+    # Decode + inference run on a dedicated thread pool. 0 workers = auto
+    # (one per core, and at least INFERENCE_BATCH_SIZE). When the queue is
+    # full, /api/detect answers 503 with Retry-After instead of queueing.
+    INFERENCE_WORKERS: int = 0
+    INFERENCE_QUEUE_SIZE: int = 32
+    INFERENCE_RETRY_AFTER_SECONDS: int = 2
+    # On shutdown, detections already admitted get this long to finish (and
+    # reach the scan writer) before the model and the writers are closed.
+    INFERENCE_SHUTDOWN_GRACE_SECONDS: float = 10.0
+
+    # Detection results keyed by sha256(upload) + model version, so retried
+    # uploads skip decode and inference. 0 entries disables the cache.
+    PREDICTION_CACHE_MAX_ENTRIES: int = 2048
+    PREDICTION_CACHE_TTL_SECONDS: int = 900
+    PREDICTION_CACHE_MAX_BYTES: int = 8388608  # 8MB
+
+    # The diseases table is served from an in-memory index; it is reloaded
+    # this often (and whenever the model changes). 0 disables the timer.
+    DISEASE_INDEX_REFRESH_SECONDS: int = 300
+
+    # ======================
+    # Rate Limiting
+    # ======================
+    # Token buckets per authenticated user. "memory" is per process; "sqlite"
+    # shares buckets between all workers on the host through one local file.
+    RATE_LIMIT_BACKEND: str = "sqlite"
+    RATE_LIMIT_SQLITE_PATH: str = "./data/rate_limits.sqlite"
+    # sqlite checks run on their own small thread pool. A check that cannot
+    # get the write lock within this busy timeout allows the request.
+    RATE_LIMIT_SQLITE_TIMEOUT_SECONDS: float = 0.05
+    RATE_LIMIT_DETECT_PER_MINUTE: float = 10
+    RATE_LIMIT_DETECT_BURST: float = 10
+    RATE_LIMIT_BATCH_PER_MINUTE: float = 5
+    RATE_LIMIT_BATCH_BURST: float = 5
+
+    # ======================
+    # Health
+    # ======================
+    # A background prober checks DB, model and inference queue on this
+    # interval; /health, /livez and /readyz serve its last snapshot.
+    # /readyz fails once the snapshot is older than HEALTH_STALE_AFTER_SECONDS.
+    HEALTH_PROBE_INTERVAL_SECONDS: float = 5.0
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 2.0
+    HEALTH_STALE_AFTER_SECONDS: float = 15.0
+    # The stub fallback (model file missing or failed to load) answers every
+    # image with the same disease, so /readyz fails while it is serving.
+    # Set to true on development machines without the model file.
+    HEALTH_ALLOW_STUB_MODEL: bool = False
+
+    # ======================
+    # Logging
+    # ======================
+    # JSON lines are formatted and written by a background thread. Records
+    # that do not fit in LOG_QUEUE_SIZE are dropped and counted (see /stats).
+    LOG_QUEUE_SIZE: int = 10000
+    # Share of INFO records kept per logger (JSON object; a logger name also
+    # covers its children). WARNING and above are always kept. The default
+    # samples the per-image inference lines, which /metrics already covers.
+    LOG_SAMPLING: Dict[str, float] = {"app.services.ml_service.inference": 0.1}
+
+    # ======================
+    # Scan History
+    # ======================
+    # Detections are buffered in memory and written to the scans table in
+    # bulk every SCAN_FLUSH_ROWS rows or SCAN_FLUSH_INTERVAL_SECONDS, whichever
+    # comes first. Rows beyond SCAN_BUFFER_SIZE are dropped (see /stats).
+    SCAN_BUFFER_SIZE: int = 10000
+    SCAN_FLUSH_ROWS: int = 500
+    SCAN_FLUSH_INTERVAL_SECONDS: float = 2.0
+
+    # ======================
+    # Scan Embeddings
+    # ======================
+    # Backbone features of each detection (backbone + crop-head model
+    # versions only), buffered like the scan history and appended to a
+    # float16 log per model version. Empty EMBEDDING_STORE_DIR disables them.
+    EMBEDDING_STORE_DIR: str = "./data/embeddings"
+    EMBEDDING_BUFFER_SIZE: int = 10000
+    EMBEDDING_FLUSH_ROWS: int = 500
+    EMBEDDING_FLUSH_INTERVAL_SECONDS: float = 2.0
+    # Search index: exact below PROJECT_MIN rows, then PCA to SEARCH_DIM
+    # dimensions, partitioned (IVF) from IVF_MIN rows with NPROBE partitions
+    # scanned per query. See app/services/embeddings.py.
+    EMBEDDING_SEARCH_DIM: int = 64
+    EMBEDDING_PROJECT_MIN_VECTORS: int = 4096
+    EMBEDDING_IVF_MIN_VECTORS: int = 65536
+    EMBEDDING_IVF_NPROBE: int = 8
+    # Similar cases: other farmers' scans are only shown above this
+    # confidence; neighbours at or above DUPLICATE_SIMILARITY (cosine) are
+    # flagged as near duplicates.
+    SIMILAR_CASES_MIN_CONFIDENCE: float = 0.8
+    EMBEDDING_DUPLICATE_SIMILARITY: float = 0.97
 
     class Config:
         env_file = ".env"
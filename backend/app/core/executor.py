@@ -0,0 +1,173 @@
+"""
+Bounded Executor
+Runs blocking work (image decode, inference) on a dedicated thread pool so it
+never stalls the asyncio event loop. Admission is capped at
+`max_workers + max_queue` tasks; beyond that `submit` fails immediately with
+ExecutorSaturated so the API can shed load instead of queueing latency.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.config import settings
+from app.core.stats import LatencyTracker
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor queue is full."""
+
+
+class BoundedExecutor:
+    def __init__(self, max_workers: int, max_queue: int, name: str = "executor"):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        # Signalled whenever a task leaves the executor (see shutdown)
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+
+        # Stats
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self.wait_time = LatencyTracker()
+        self.run_time = LatencyTracker()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        if self._closed:
+            raise ExecutorSaturated(f"{self.name} is shutting down")
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturated(f"{self.name} is at capacity")
+
+        enqueued_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+        # Like asyncio.to_thread: the work sees the caller's context variables
+        # (request_id_ctx, so its log lines carry the request ID)
+        context = contextvars.copy_context()
+
+        def task():
+            started_at = time.perf_counter()
+            self.wait_time.record(started_at - enqueued_at)
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return context.run(fn, *args)
+            finally:
+                self.run_time.record(time.perf_counter() - started_at)
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._idle.notify_all()
+                self._slots.release()
+
+        try:
+            future = self._pool.submit(task)
+        except Exception:
+            self._abandon()
+            raise
+
+        # A caller that disconnects cancels the future before `task` ever runs,
+        # so its slot has to be returned here instead.
+        future.add_done_callback(lambda f: self._abandon() if f.cancelled() else None)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Await `fn(*args)` on the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self, timeout: float = 0.0):
+        """
+        Stop admitting work, wait up to `timeout` seconds for queued and
+        running tasks to finish, then cancel whatever is still queued.
+        Blocking; call it from a thread when the event loop is running.
+        """
+        with self._idle:
+            self._closed = True
+            self._idle.wait_for(lambda: self._queued + self._running == 0, timeout)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                "workers": self.max_workers,
+                "queue_capacity": self.max_queue,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+        counters["wait_time"] = self.wait_time.snapshot()
+        counters["run_time"] = self.run_time.snapshot()
+        return counters
+
+    def _abandon(self):
+        with self._lock:
+            self._queued -= 1
+            self._idle.notify_all()
+        self._slots.release()
+
+
+class InFlight:
+    """
+    Counts async work in progress on the event loop (`with tracker:` around
+    it), so shutdown can wait for it to finish instead of guessing.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._idle: asyncio.Event = None
+
+    def __enter__(self):
+        self.count += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.count -= 1
+        if self.count == 0 and self._idle is not None:
+            self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the count to reach zero; False if it did not."""
+        if self.count == 0:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._idle = None
+        return True
+
+
+def _default_inference_workers() -> int:
+    # Workers block while their image waits in the micro-batcher, so the pool
+    # needs at least one thread per batch slot for batches to fill up.
+    return max(os.cpu_count() or 1, settings.INFERENCE_BATCH_SIZE)
+
+
+inference_executor = BoundedExecutor(
+    max_workers=settings.INFERENCE_WORKERS or _default_inference_workers(),
+    max_queue=settings.INFERENCE_QUEUE_SIZE,
+    name="inference",
+)
+
+# bcrypt is deliberately slow; a small pool of its own keeps a login wave
+# from occupying every core and Starlette's shared threadpool.
+password_hash_executor = BoundedExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS or max(1, (os.cpu_count() or 2) // 2),
+    max_queue=settings.PASSWORD_HASH_QUEUE_SIZE,
+    name="password-hash",
+)
@@ -1,4 +1,262 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+"""
+Per-User Rate Limiting
+Token buckets keyed by authenticated user id, not client IP: farmers behind
+one carrier-grade NAT no longer share (and exhaust) a single budget.
 
-limiter = Limiter(key_func=get_remote_address)
+Each budget (e.g. "detect", "detect_batch") holds `burst` tokens and refills
+at `per_minute / 60` tokens per second. A request takes one token or gets a
+429 with Retry-After. A check is O(1) in both stores:
+
+- memory: a dict per process. Only correct with a single worker.
+- sqlite: one UPSERT ... RETURNING against a WAL-mode SQLite file, shared by
+  every uvicorn worker on the host (RATE_LIMIT_SQLITE_PATH). The statement
+  refills and takes atomically, so workers cannot double-spend a bucket.
+  It runs on a small thread pool, never on the event loop, with a short
+  busy timeout: a check stuck behind another worker's write fails open.
+
+Usage: `dependencies=[Depends(rate_limit("detect"))]` on a route.
+"""
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from fastapi import Depends, HTTPException, status
+from prometheus_client import Counter
+
+from app.config import settings
+from app.core.metrics import registry
+from app.services.auth_service import get_current_user, Principal
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Budget:
+    name: str
+    burst: float
+    per_minute: float
+
+    @property
+    def rate(self) -> float:
+        """Tokens per second."""
+        return self.per_minute / 60.0
+
+    @property
+    def full_after(self) -> float:
+        """Seconds for an empty bucket to refill completely."""
+        return self.burst / self.rate if self.rate > 0 else math.inf
+
+
+class MemoryBucketStore:
+    """Per-process buckets; least recently used ones are dropped once they would be full again."""
+
+    blocking = False
+
+    def __init__(self, max_idle_seconds: float):
+        self.max_idle = max_idle_seconds
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, budget: Budget, now: float) -> Tuple[bool, float]:
+        """Take one token. Returns (allowed, tokens left)."""
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (budget.burst, now))
+            tokens = min(budget.burst, tokens + (now - updated) * budget.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)
+            self._evict_idle(now)
+            return allowed, tokens
+
+    def _evict_idle(self, now: float):
+        # Oldest first; an idle bucket is indistinguishable from a new, full one
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.max_idle:
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Buckets in a local SQLite file, shared by all worker processes on the host."""
+
+    blocking = True  # file I/O and lock waits: keep off the event loop
+
+    _TAKE = """
+        INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (:key, :burst - 1, :now)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1,
+            updated = :now
+        WHERE MIN(:burst, tokens + (:now - updated) * :rate) >= 1
+        RETURNING tokens
+    """
+
+    def __init__(self, path: str, max_idle_seconds: float, prune_every: int = 1000, busy_timeout: float = 1.0):
+        self.path = path
+        self.max_idle = max_idle_seconds
+        self.busy_timeout = busy_timeout
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._calls = 0
+        # The file is created on the first check, not when the app is imported
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._schema_ready:
+                self._create_schema()
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing a few refills on power loss is fine
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+                    "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+                )
+                # Pruning idle buckets reads only the stale rows
+                conn.execute("CREATE INDEX IF NOT EXISTS rate_limit_buckets_updated ON rate_limit_buckets (updated)")
+            finally:
+                conn.close()
+            self._schema_ready = True
+
+    def take(self, key: str, budget: Budget, now: float) -> Tuple[bool, float]:
+        conn = self._connection()
+        params = {"key": key, "burst": budget.burst, "rate": budget.rate, "now": now}
+        row = conn.execute(self._TAKE, params).fetchone()
+        self._calls += 1
+        if self._calls % self.prune_every == 0:
+            conn.execute("DELETE FROM rate_limit_buckets WHERE updated < ?", (now - self.max_idle,))
+        if row is not None:
+            return True, row[0]
+        # Denied: the UPSERT left the row untouched; report what is there
+        tokens, updated = conn.execute(
+            "SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)
+        ).fetchone()
+        return False, min(budget.burst, tokens + (now - updated) * budget.rate)
+
+    def __len__(self) -> int:
+        if not self._schema_ready:
+            return 0  # no check yet; do not create the file just to count it
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+
+
+DECISIONS = Counter(
+    "krishi_rate_limit_decisions",
+    "Rate limiter decisions by budget",
+    ["budget", "decision"],
+    registry=registry,
+)
+
+
+class RateLimiter:
+    def __init__(self, store, budgets: Dict[str, Budget]):
+        self.store = store
+        self.budgets = budgets
+        # Each thread keeps its own SQLite connection
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rate-limit") if store.blocking else None
+        self._counters = {
+            (name, decision): DECISIONS.labels(name, decision)
+            for name in budgets for decision in ("allowed", "limited", "error")
+        }
+        self._counts = dict.fromkeys(self._counters, 0)
+
+    def check(self, budget_name: str, user_id: int) -> Tuple[bool, float, float]:
+        """Returns (allowed, tokens left, seconds until the next token)."""
+        budget = self.budgets[budget_name]
+        try:
+            allowed, tokens = self.store.take(f"{budget_name}:{user_id}", budget, time.time())
+        except Exception as e:
+            # Fail open: a broken limiter store must not take detection down
+            logger.error(f"Rate limiter store failed, allowing request: {e}")
+            self._record(budget_name, "error")
+            return True, 0.0, 0.0
+        self._record(budget_name, "allowed" if allowed else "limited")
+        retry_after = 0.0 if allowed else (1.0 - tokens) / budget.rate if budget.rate > 0 else math.inf
+        return allowed, tokens, retry_after
+
+    async def check_async(self, budget_name: str, user_id: int) -> Tuple[bool, float, float]:
+        """check() for request handlers: stores that block run on the limiter's threads."""
+        if self._pool is None:
+            return self.check(budget_name, user_id)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self.check, budget_name, user_id)
+
+    def _record(self, budget_name: str, decision: str):
+        self._counters[(budget_name, decision)].inc()
+        self._counts[(budget_name, decision)] += 1
+
+    def stats(self) -> dict:
+        decisions = {}
+        for (name, decision), count in self._counts.items():
+            decisions.setdefault(name, {})[decision] = count
+        return {
+            "backend": type(self.store).__name__,
+            "buckets": len(self.store),
+            "budgets": {name: {"burst": b.burst, "per_minute": b.per_minute} for name, b in self.budgets.items()},
+            "decisions": decisions,
+        }
+
+
+def rate_limit(budget_name: str):
+    """FastAPI dependency: spend one token of `budget_name` for the current user."""
+    budget = limiter.budgets[budget_name]
+
+    async def dependency(current_user: Principal = Depends(get_current_user)) -> Principal:
+        allowed, tokens, retry_after = await limiter.check_async(budget_name, current_user.id)
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded: {budget.per_minute:g} per minute.",
+                headers={
+                    "Retry-After": str(max(1, math.ceil(min(retry_after, 3600)))),
+                    "X-RateLimit-Limit": f"{budget.per_minute:g}",
+                    "X-RateLimit-Remaining": "0",
+                },
+            )
+        return current_user
+
+    return dependency
+
+
+def _create_limiter() -> RateLimiter:
+    budgets = {
+        "detect": Budget("detect", settings.RATE_LIMIT_DETECT_BURST, settings.RATE_LIMIT_DETECT_PER_MINUTE),
+        "detect_batch": Budget(
+            "detect_batch", settings.RATE_LIMIT_BATCH_BURST, settings.RATE_LIMIT_BATCH_PER_MINUTE
+        ),
+    }
+    max_idle = max(budget.full_after for budget in budgets.values())
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        store = SQLiteBucketStore(
+            settings.RATE_LIMIT_SQLITE_PATH, max_idle, busy_timeout=settings.RATE_LIMIT_SQLITE_TIMEOUT_SECONDS
+        )
+    elif settings.RATE_LIMIT_BACKEND == "memory":
+        store = MemoryBucketStore(max_idle)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{settings.RATE_LIMIT_BACKEND}'. Choose memory or sqlite")
+    return RateLimiter(store, budgets)
+
+
+limiter = _create_limiter()
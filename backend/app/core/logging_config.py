@@ -1,63 +1,230 @@
+"""
+Logging Setup
+JSON log lines with the request ID, written off the request path.
+
+Loggers hand records to a bounded queue (QueueHandler); a listener thread
+formats them as JSON and writes them to stderr. Sampling and the request ID
+filter run on the calling thread, before the record is queued. When the
+queue is full the record is dropped and counted instead of blocking the
+request (see /stats and krishi_log_records_dropped).
+
+RequestContextMiddleware gives each request its ID and reports its latency
+to app.core.metrics.
+"""
+import atexit
+import copy
 import logging
+import logging.handlers
+import queue
+import random
 import time
 import uuid
 import contextvars
+from typing import Callable, Dict, Optional, TextIO, Tuple
 from pythonjsonlogger import jsonlogger
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.responses import PlainTextResponse
+from app.config import settings
+from app.core import metrics
 
 # Context variable for request ID
 request_id_ctx = contextvars.ContextVar("request_id", default="N/A")
 
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(request_id)s %(message)s'
+
 class RequestIdFilter(logging.Filter):
     def filter(self, record):
         record.request_id = request_id_ctx.get()
         return True
 
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of INFO-and-below records per logger. A configured name
+    also covers its child loggers; the longest match wins. WARNING and above
+    always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._resolved: Dict[str, float] = {}
+        self.sampled_out = 0
+
+    def rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, matched = 1.0, -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > matched:
+                    rate, matched = value, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never waits: records that do not fit are counted and dropped."""
+
+    _tracebacks = logging.Formatter()
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only merge the message arguments here; the JSON formatting happens on
+        # the listener thread. Tracebacks are rendered now, while they still
+        # exist, and kept out of the message so they still land under "exc_info".
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self._tracebacks.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # emit() holds the handler lock, so the counters need no lock of their own
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The stock listener uses put_nowait, which raises on a full queue;
+        # wait for the thread to make room so stop() writes out the backlog.
+        self.queue.put(self._sentinel)
+
+
+def json_handler(stream: Optional[TextIO] = None) -> logging.StreamHandler:
+    """The handler that writes the JSON lines (stderr by default)."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(jsonlogger.JsonFormatter(fmt=LOG_FORMAT))
+    return handler
+
+
+def queued_handler(target: logging.Handler, queue_size: int,
+                   sampling: Dict[str, float]) -> Tuple[DroppingQueueHandler, DrainingQueueListener]:
+    """A queue handler for the loggers plus the (not yet started) listener feeding `target`."""
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(SamplingFilter(sampling))
+    handler.addFilter(RequestIdFilter())
+    listener = DrainingQueueListener(handler.queue, target, respect_handler_level=True)
+    return handler, listener
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[DrainingQueueListener] = None
+
+
 def setup_logging():
+    global _handler, _listener
     logger = logging.getLogger()
     # Remove existing handlers to avoid duplicates
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
-        
-    logHandler = logging.StreamHandler()
-    formatter = jsonlogger.JsonFormatter(
-        fmt='%(asctime)s %(levelname)s %(name)s %(request_id)s %(message)s'
-    )
-    logHandler.setFormatter(formatter)
-    logger.addHandler(logHandler)
+    if _listener is not None:
+        _listener.stop()
+
+    _handler, _listener = queued_handler(json_handler(), settings.LOG_QUEUE_SIZE, settings.LOG_SAMPLING)
+    logger.addHandler(_handler)
     logger.setLevel(logging.INFO)
-    
-    # Add Filter to all active loggers
-    for logger_name in logging.root.manager.loggerDict:
-        logging.getLogger(logger_name).addFilter(RequestIdFilter())
-    logging.getLogger().addFilter(RequestIdFilter())
-
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+    _listener.start()
+
+
+def shutdown_logging():
+    """Write out whatever is still queued. Registered with atexit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+def logging_stats() -> Dict[str, object]:
+    if _handler is None:
+        return {"queued": False}
+    sampler = next(f for f in _handler.filters if isinstance(f, SamplingFilter))
+    return {
+        "queued": _listener is not None,
+        "queue_depth": _handler.queue.qsize(),
+        "queue_size": _handler.queue.maxsize,
+        "enqueued": _handler.enqueued,
+        "dropped": _handler.dropped,
+        "sampled_out": sampler.sampled_out,
+        "sampling": sampler.rates,
+    }
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI: sets request_id_ctx, stamps X-Request-ID and X-Process-Time on
+    every response (error responses included) and reports the request once
+    its last body chunk has been sent, so streamed responses are timed in
+    full. `observe(method, route, status, seconds)` is the metrics sink.
+    """
+
+    def __init__(self, app, observe: Callable[[str, str, int, float], None] = metrics.observe_request):
+        self.app = app
+        self.observe = observe
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
         request_id = str(uuid.uuid4())
-        request_id_ctx.set(request_id)
-        request.state.request_id = request_id
-        
-        start_time = time.time()
-        
+        token = request_id_ctx.set(request_id)
+        # Read back as request.state.request_id
+        scope.setdefault("state", {})["request_id"] = request_id
+        start_time = time.perf_counter()
+        status_code = 500
+        response_started = False
+
+        async def send_with_context(message):
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Request-ID", request_id)
+                headers.append("X-Process-Time", str(round(time.perf_counter() - start_time, 4)))
+            await send(message)
+
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_with_context)
         except Exception:
-            # If an unhandled exception occurs, we still want to add headers to the 500 error
-            # But Starlette's BaseHTTPMiddleware makes it hard to modify the error response here
-            # because the error response is often generated outside this block.
-            # However, for 404s/successful but logic errors, this works.
+            # Starlette's outermost ServerErrorMiddleware would answer without
+            # our headers; answer first (it sees the response started and only
+            # re-raises for the server log).
+            if not response_started:
+                await PlainTextResponse("Internal Server Error", status_code=500)(scope, receive, send_with_context)
             raise
         finally:
-            process_time = time.time() - start_time
-            # Note: We can only modify the response if it was successfully returned
-            # In case of a raised exception, a new response is created by FastAPI's exception handlers
-            pass
-
-        # We need another way to ensure headers are added to error responses
-        # For now, we'll focus on the successful path and health fix
-        response.headers["X-Process-Time"] = str(round(process_time, 4))
-        response.headers["X-Request-ID"] = request_id
-        
-        return response
+            self.observe(scope["method"], _route_template(scope), status_code, time.perf_counter() - start_time)
+            request_id_ctx.reset(token)
+
+
+def _route_template(scope) -> str:
+    # Route template ("/api/detect"), not the raw path, so label values stay bounded.
+    # The router fills in "route" and "path_params" on this same scope.
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    if scope.get("path_params"):
+        return route.path
+    # No parameters: the path is the template (and includes any router prefix)
+    return scope["path"]
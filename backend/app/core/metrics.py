@@ -0,0 +1,112 @@
+"""
+Prometheus Metrics
+Exposed at GET /metrics.
+
+- krishi_http_request_duration_seconds{method, route, status}: every request,
+  labelled by route template (not raw path) to keep cardinality bounded
+- krishi_detection_stage_seconds{stage}: where a detection spends its time
+  (upload_read, decode, resize, inference, knowledge_lookup, serialization)
+- gauges and counters (inference queue, DB pool, model state, scan buffer)
+  are read from the live objects at scrape time, so requests pay nothing
+  for them
+
+Histogram.observe is a lock and a bisect, cheap enough to leave on.
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from prometheus_client import CollectorRegistry, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+registry = CollectorRegistry(auto_describe=True)
+
+REQUEST_LATENCY = Histogram(
+    "krishi_http_request_duration_seconds",
+    "HTTP request latency by route template and status code",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    registry=registry,
+)
+
+DETECTION_STAGES = (
+    "upload_read", "decode", "resize", "inference", "knowledge_lookup", "similarity_search", "serialization",
+)
+
+STAGE_LATENCY = Histogram(
+    "krishi_detection_stage_seconds",
+    "Time spent per detection stage",
+    ["stage"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    registry=registry,
+)
+
+# Resolve the labelled children once; .labels() does a dict lookup under a lock
+_stage_histograms = {stage: STAGE_LATENCY.labels(stage) for stage in DETECTION_STAGES}
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    REQUEST_LATENCY.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_stage(stage: str, seconds: float):
+    _stage_histograms[stage].observe(seconds)
+
+
+def observe_stages(timings: Dict[str, float]):
+    for stage, seconds in timings.items():
+        _stage_histograms[stage].observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_histograms[stage].observe(time.perf_counter() - start_time)
+
+
+class _GaugeCollector:
+    """Builds gauges/counters from callbacks at scrape time."""
+
+    def __init__(self):
+        self._sources: List[Callable[[], Iterator[GaugeMetricFamily]]] = []
+
+    def add(self, source: Callable[[], Iterator[GaugeMetricFamily]]):
+        self._sources.append(source)
+
+    def collect(self):
+        for source in self._sources:
+            yield from source()
+
+    def describe(self):
+        return []
+
+
+gauges = _GaugeCollector()
+registry.register(gauges)
+
+
+def gauge(name: str, documentation: str, value: float, labels: Dict[str, str] = None) -> GaugeMetricFamily:
+    family = GaugeMetricFamily(name, documentation, labels=list(labels or {}))
+    family.add_metric(list((labels or {}).values()), value)
+    return family
+
+
+def gauges_by_label(name: str, documentation: str, label_names: List[str],
+                    samples: Iterable[Tuple[Sequence[str], float]]) -> GaugeMetricFamily:
+    """One family with a sample per label set (a name must not be emitted twice)."""
+    family = GaugeMetricFamily(name, documentation, labels=label_names)
+    for label_values, value in samples:
+        family.add_metric(list(label_values), value)
+    return family
+
+
+def counter(name: str, documentation: str, value: float) -> CounterMetricFamily:
+    """For totals kept elsewhere (e.g. executor stats); exposed as <name>_total."""
+    return CounterMetricFamily(name, documentation, value=value)
+
+
+def render() -> bytes:
+    return generate_latest(registry)
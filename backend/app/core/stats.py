@@ -0,0 +1,44 @@
+"""
+Lightweight latency tracking for runtime stats.
+Keeps running totals plus a fixed window of recent samples for percentiles.
+"""
+import threading
+from collections import deque
+from typing import Dict
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 1024):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            self._samples.append(seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Counts and latencies in milliseconds; percentiles cover the recent window."""
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, peak = self.count, self.total, self.max
+
+        def pct(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+
+        return {
+            "count": count,
+            "mean_ms": round(total / count * 1000, 3) if count else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(peak * 1000, 3),
+        }
@@ -0,0 +1,119 @@
+"""
+Upload Ingestion
+Bounds what an upload can cost before any of it reaches the decoder:
+
+1. UploadLimitMiddleware (pure ASGI) rejects a request body over the route's
+   limit: up front from Content-Length, or as soon as the streamed body
+   (chunked encoding, lying headers) passes it. Nothing past the limit is
+   read or spooled.
+2. read_upload() walks the spooled file in chunks, hashing as it goes and
+   stopping at MAX_UPLOAD_SIZE, then hands the same file object to the
+   decoder: the photo is never copied into a bytes object.
+3. check_dimensions() reads only the image header and refuses anything over
+   MAX_IMAGE_PIXELS before pixels are decoded (decompression bombs).
+
+Per request that leaves at most ~1MB in memory for the upload (Starlette
+spools the rest to disk) and one decode of <= MAX_IMAGE_PIXELS per
+inference worker.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import BinaryIO, Dict
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from app.config import settings
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Multipart boundaries, part headers and the small form fields
+FORM_OVERHEAD = 64 * 1024
+
+# Pillow's own guard (DecompressionBombError at 2x) as a backstop
+Image.MAX_IMAGE_PIXELS = settings.MAX_IMAGE_PIXELS
+
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Image exceeds {settings.MAX_UPLOAD_SIZE // (1024 * 1024)}MB limit.")
+
+
+class ImageTooLargeError(Exception):
+    """Image header declares more pixels than MAX_IMAGE_PIXELS."""
+
+
+@dataclass
+class Upload:
+    file: BinaryIO  # positioned at 0, ready for Image.open (endpoints may wrap it in RawPixels)
+    sha256: str
+    size: int
+
+
+async def read_upload(upload: UploadFile, limit: int = None) -> Upload:
+    """Hash `upload` chunk by chunk, aborting with 413 once it passes `limit` bytes."""
+    limit = settings.MAX_UPLOAD_SIZE if limit is None else limit
+    if upload.size is not None and upload.size > limit:
+        raise upload_too_large()
+
+    digest = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            raise upload_too_large()
+        digest.update(chunk)
+    await upload.seek(0)
+    return Upload(upload.file, digest.hexdigest(), size)
+
+
+def check_dimensions(image: Image.Image):
+    """`image` from Image.open (header parsed, pixels not yet decoded)."""
+    width, height = image.size
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(f"{width}x{height} exceeds {settings.MAX_IMAGE_PIXELS} pixels")
+
+
+class UploadLimitMiddleware:
+    """Rejects request bodies over a per-path limit without reading past it."""
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await _send_too_large(send, limit)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside body parsing; FastAPI turns it into the response
+                    raise HTTPException(status_code=413, detail=_body_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _body_too_large(limit: int) -> str:
+    return f"Request body exceeds {limit // (1024 * 1024)}MB limit."
+
+
+async def _send_too_large(send, limit: int):
+    body = json.dumps({"detail": _body_too_large(limit)}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
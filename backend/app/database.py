@@ -1,10 +1,37 @@
 """
 Database Configuration
 Creates connection to PostgreSQL
+
+Two engines share DATABASE_URL:
+- `async_engine` / `get_async_db` for request handlers (asyncpg / aiosqlite),
+  so queries never block the event loop
+- `engine` / `SessionLocal` for code that already runs on its own thread
+  (scan writer, knowledge index refresh, scripts)
 """
-from sqlalchemy import create_engine
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from app.config import settings
+from app.core.stats import LatencyTracker
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """Same database, async driver: postgresql://... -> postgresql+asyncpg://..."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None or parsed.drivername in ASYNC_DRIVERS.values():
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
 
 
 # Create database engine
@@ -12,8 +39,17 @@ engine = create_engine(
     settings.DATABASE_URL,
     echo=True if settings.DEBUG else False,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW
+)
+
+async_engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL),
+    echo=True if settings.DEBUG else False,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
 )
 
 # Session factory
@@ -23,17 +59,75 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # Base class for all models
 Base = declarative_base()
 
 
-def get_db():
+# ======================
+# Async pool instrumentation
+# ======================
+checkout_wait = LatencyTracker()
+_pool_peak = {"checked_out": 0}
+
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _track_peak(dbapi_connection, connection_record, connection_proxy):
+    checked_out = async_engine.sync_engine.pool.checkedout()
+    if checked_out > _pool_peak["checked_out"]:
+        _pool_peak["checked_out"] = checked_out
+
+
+def pool_stats() -> dict:
+    """Async pool utilisation and how long handlers waited for a connection."""
+    pool = async_engine.sync_engine.pool
+    capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    checked_out = pool.checkedout() if hasattr(pool, "checkedout") else 0
+    return {
+        "pool": pool.__class__.__name__,
+        "capacity": capacity,
+        "checked_out": checked_out,
+        "idle": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+        "peak_checked_out": _pool_peak["checked_out"],
+        "utilisation": round(checked_out / capacity, 3) if capacity else 0.0,
+        "checkout_wait": checkout_wait.snapshot(),
+    }
+
+
+@asynccontextmanager
+async def async_session() -> AsyncIterator[AsyncSession]:
+    """AsyncSession with its connection checked out up front (and timed)."""
+    session = AsyncSessionLocal()
+    try:
+        start_time = time.perf_counter()
+        await session.connection()
+        checkout_wait.record(time.perf_counter() - start_time)
+        yield session
+    finally:
+        await session.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
     """
     Dependency for FastAPI routes
+    Yields an AsyncSession for the request
+    """
+    async with async_session() as session:
+        yield session
+
+
+def get_db():
+    """
+    Sync session dependency, for code that runs in a worker thread
     Creates new database session for each request
     """
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -3,47 +3,68 @@ Database Seeder
 Populates the diseases table with initial data on first startup.
 """
 import logging
-from app.database import SessionLocal
+from sqlalchemy import select
+from app.database import AsyncSessionLocal
 from app.models.disease import Disease
 
 logger = logging.getLogger(__name__)
 
 
-def init_db():
-    """Seed diseases table if empty."""
-    db = SessionLocal()
-    try:
-        existing = db.query(Disease).first()
+async def init_db():
+    """Seed any diseases missing from the table, matched by name."""
+    async with AsyncSessionLocal() as db:
+        existing = set((await db.execute(select(Disease.name))).scalars())
 
-        if not existing:
-            diseases = [
-                Disease(
-                    name="Apple scab",
-                    name_hi="सेब की पपड़ी (Apple Scab)",
-                    symptoms="Velvety, olive-green to black spots on leaves and fruit.",
-                    treatment="Remove infected leaves.\nApply Mancozeb 75% WP @ 2g/liter.",
-                    severity="MEDIUM"
-                ),
-                Disease(
-                    name="Black rot",
-                    name_hi="काला सड़न (Black Rot)",
-                    symptoms="Brown, circular spots on leaves; rotting fruit.",
-                    treatment="Prune dead wood.\nApply Captan or Thiram.",
-                    severity="HIGH"
-                ),
-                Disease(
-                    name="healthy",
-                    name_hi="स्वस्थ (Healthy)",
-                    symptoms="None. The plant looks vigorous.",
-                    treatment="Continue regular care and monitoring.",
-                    severity="LOW"
-                )
-            ]
+        diseases = [
+            Disease(
+                name="Apple scab",
+                name_hi="सेब की पपड़ी (Apple Scab)",
+                symptoms="Velvety, olive-green to black spots on leaves and fruit.",
+                treatment="Remove infected leaves.\nApply Mancozeb 75% WP @ 2g/liter.",
+                severity="MEDIUM"
+            ),
+            Disease(
+                name="Black rot",
+                name_hi="काला सड़न (Black Rot)",
+                symptoms="Brown, circular spots on leaves; rotting fruit.",
+                treatment="Prune dead wood.\nApply Captan or Thiram.",
+                severity="HIGH"
+            ),
+            Disease(
+                name="healthy",
+                name_hi="स्वस्थ (Healthy)",
+                symptoms="None. The plant looks vigorous.",
+                treatment="Continue regular care and monitoring.",
+                severity="LOW"
+            ),
+            # J&K crops, served through crop heads (scripts/add_crop_head.py)
+            Disease(
+                name="Corm rot",
+                name_hi="केसर का कंद सड़न (Saffron Corm Rot)",
+                symptoms="Yellowing, drooping leaves; soft, brown rotting corms.",
+                treatment="Lift and destroy rotted corms.\nDip healthy corms in Carbendazim 0.1% before planting.\nAvoid waterlogging.",
+                severity="HIGH"
+            ),
+            Disease(
+                name="Anthracnose",
+                name_hi="अखरोट का एन्थ्रेक्नोज़ (Walnut Anthracnose)",
+                symptoms="Dark brown spots on leaflets and husks; early leaf drop.",
+                treatment="Collect and burn fallen leaves.\nSpray Mancozeb 75% WP @ 2.5g/liter at leaf emergence.",
+                severity="MEDIUM"
+            ),
+            Disease(
+                name="Blast",
+                name_hi="धान का झोंका रोग (Rice Blast)",
+                symptoms="Spindle-shaped grey spots with brown margins on leaves; neck rot.",
+                treatment="Avoid excess nitrogen.\nSpray Tricyclazole 75% WP @ 0.6g/liter.",
+                severity="HIGH"
+            )
+        ]
 
-            db.add_all(diseases)
-            db.commit()
-            logger.info("Database seeded with %d diseases.", len(diseases))
+        missing = [d for d in diseases if d.name not in existing]
+        if missing:
+            db.add_all(missing)
+            await db.commit()
+            logger.info("Database seeded with %d diseases.", len(missing))
         else:
             logger.info("Database already seeded. Skipping.")
-    finally:
-        db.close()
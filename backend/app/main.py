@@ -1,35 +1,91 @@
-import logging
 import time
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from sqlalchemy import text
 
 from app.config import settings
-from app.database import engine, Base, get_db
+from app.database import async_engine, Base, pool_stats
 from app.db.init_db import init_db
 from app.models.disease import Disease  # Ensure models are loaded
 from app.models.user import User        # Ensure models are loaded
+from app.models.scan import Scan        # Ensure models are loaded
 from app.api.endpoints import detect, auth
-from app.core.logging_config import setup_logging, LoggingMiddleware
+from app.core.logging_config import setup_logging, logging_stats, RequestContextMiddleware
+from app.core.uploads import UploadLimitMiddleware, FORM_OVERHEAD
 from app.core.limiter import limiter
+from app.core import metrics
+from prometheus_client import CONTENT_TYPE_LATEST
+from app.core.executor import inference_executor
 from app.services.ml_service import ml_service
+from app.services.prediction_cache import prediction_cache
+from app.services.disease_index import disease_catalog
+from app.services.auth_service import auth_stats
+from app.services.scan_writer import scan_writer
+from app.services.embeddings import embedding_store, embedding_writer
+from app.services.health import health_prober
 
 # Initialize Logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# Module import cost (the model is not loaded here; see ml_service.start_loading)
+IMPORT_TIME_MS = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 2)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Startup: create tables and seed data. Shutdown: cleanup."""
-    logger.info("Starting Krishi-Net API...", extra={"version": settings.APP_VERSION})
-    Base.metadata.create_all(bind=engine)
-    init_db()
+    """Startup: create tables, seed data and start loading the model. Shutdown: cleanup."""
+    logger.info("Starting Krishi-Net API...", extra={"version": settings.APP_VERSION, "import_ms": IMPORT_TIME_MS})
+    startup_started = time.perf_counter()
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await init_db()
+    await asyncio.to_thread(disease_catalog.refresh, ml_service.classes)
+
+    # Listeners fire on the model-loader thread; the cache belongs to the event loop
+    loop = asyncio.get_running_loop()
+    ml_service.on_model_change(lambda: loop.call_soon_threadsafe(prediction_cache.clear))
+    ml_service.on_model_change(lambda: disease_catalog.refresh(ml_service.classes))
+    # Start building the new version's similar-case index before the first query
+    ml_service.on_model_change(lambda: embedding_store.warm(ml_service.model_version))
+    # Re-probe as soon as the model is ready instead of waiting for the next tick
+    ml_service.on_model_change(lambda: loop.call_soon_threadsafe(asyncio.ensure_future, health_prober.probe_once()))
+    # Loads in the background; /api/detect answers 503 until ml_service.ready
+    ml_service.start_loading()
+
+    await health_prober.probe_once()
+    probe_task = asyncio.create_task(health_prober.run())
+
+    refresh_task = None
+    if settings.DISEASE_INDEX_REFRESH_SECONDS > 0:
+        refresh_task = asyncio.create_task(
+            disease_catalog.refresh_periodically(settings.DISEASE_INDEX_REFRESH_SECONDS)
+        )
+    registry_task = None
+    if settings.MODEL_REGISTRY_POLL_SECONDS > 0:
+        registry_task = asyncio.create_task(ml_service.watch_registry(settings.MODEL_REGISTRY_POLL_SECONDS))
+    logger.info(f"Krishi-Net API accepting requests after {(time.perf_counter() - startup_started)*1000:.2f}ms "
+                f"(imports {IMPORT_TIME_MS:.2f}ms, model loading in background)")
     yield
     logger.info("Shutting down Krishi-Net API...")
+    probe_task.cancel()
+    if refresh_task:
+        refresh_task.cancel()
+    if registry_task:
+        registry_task.cancel()
+    # Let admitted detections finish and buffer their scans before the model
+    # and the writers close; inference still queued after the grace period
+    # is cancelled
+    if not await detect.detections_in_flight.wait_idle(settings.INFERENCE_SHUTDOWN_GRACE_SECONDS):
+        logger.warning(f"Shutting down with {detect.detections_in_flight.count} detections unfinished")
+    await asyncio.to_thread(inference_executor.shutdown)
+    ml_service.close()
+    scan_writer.close()
+    embedding_writer.close()
+    await async_engine.dispose()
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -38,12 +94,12 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-# Rate Limiter
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-# Middleware
-app.add_middleware(LoggingMiddleware)
+# Middleware (last added runs first)
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/api/detect": settings.MAX_UPLOAD_SIZE + FORM_OVERHEAD,
+    "/api/detect/similar": settings.MAX_UPLOAD_SIZE + FORM_OVERHEAD,
+    "/api/detect/batch": settings.MAX_BATCH_IMAGES * settings.MAX_UPLOAD_SIZE + FORM_OVERHEAD,
+})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -51,6 +107,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so early 413s and CORS preflights get a request ID and are timed too
+app.add_middleware(RequestContextMiddleware)
 
 # Routes
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
@@ -60,32 +118,132 @@ app.include_router(detect.router, prefix="/api", tags=["detection"])
 async def health_check(response: Response):
     """
     Enhanced Health Check
-    Verifies: Database connection, ML Model status
+    Reports: Database connection, ML Model status (from the health prober's last snapshot)
     """
+    snapshot = health_prober.snapshot
+    database = snapshot.checks.get("database") if snapshot else None
     health_status = {
         "status": "ok",
         "app": settings.APP_NAME,
         "version": settings.APP_VERSION,
-        "database": "unknown",
+        "database": database.detail if database else "unknown",
         "ml_model": ml_service.mode,
+        "model_loading": ml_service.readiness(),
+        "checked_at": snapshot.checked_at if snapshot else None,
+        "stale": health_prober.is_stale(),
         "timestamp": time.time()
     }
-    
+
     # Check Database
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        health_status["database"] = "connected"
-    except Exception as e:
-        logger.error(f"Health check failed: Database unreachable: {e}")
-        health_status["database"] = "disconnected"
+    if database is None or not database.ok:
         health_status["status"] = "error"
-        
+
     # Check ML Model
-    if ml_service.mode == "STUB (Fallback)":
+    if health_status["status"] == "ok" and (not ml_service.ready or not ml_service.active.serving):
         health_status["status"] = "degraded"
-        
+
     # Caching header for health check (5 minutes as per requirements)
     response.headers["Cache-Control"] = "public, max-age=300"
     
     return health_status
+
+
+@app.get("/livez", tags=["system"])
+async def liveness():
+    """Liveness: the event loop answers. Never touches the DB."""
+    snapshot = health_prober.snapshot
+    return {
+        "status": "ok",
+        "probe_age_s": round(snapshot.age(), 3) if snapshot else None,
+        "stale": health_prober.is_stale(),
+    }
+
+
+@app.get("/readyz", tags=["system"])
+async def readiness(response: Response):
+    """Readiness: 503 until DB, model and inference queue are healthy and the snapshot is fresh."""
+    report = health_prober.readiness()
+    if not report["ready"]:
+        response.status_code = 503
+    response.headers["Cache-Control"] = "no-store"
+    return report
+
+
+@app.get("/stats", tags=["system"])
+async def runtime_stats():
+    """
+    Runtime Counters
+    Inference executor queue, batching, prediction cache, knowledge index, auth, scan writer,
+    embeddings, database pool, rate limiter and log queue stats.
+    """
+    return {
+        "startup": {"import_ms": IMPORT_TIME_MS, "model": ml_service.readiness()},
+        "executor": inference_executor.stats(),
+        "inference": ml_service.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "disease_index": disease_catalog.stats(),
+        "auth": auth_stats(),
+        "scan_writer": scan_writer.stats(),
+        "embeddings": {"writer": embedding_writer.stats(), "store": embedding_store.stats()},
+        "database": pool_stats(),
+        "rate_limiter": limiter.stats(),
+        "logging": logging_stats(),
+    }
+
+
+def _runtime_gauges():
+    """Read at scrape time (see app.core.metrics.gauges)."""
+    executor = inference_executor.stats()
+    yield metrics.gauge("krishi_inference_queue_depth", "Detections waiting for an inference worker",
+                        executor["queue_depth"])
+    yield metrics.gauge("krishi_inference_running", "Detections being decoded or run", executor["running"])
+    yield metrics.gauge("krishi_inference_batcher_pending", "Images waiting for the next forward pass",
+                        ml_service.batcher.stats()["pending"])
+    yield metrics.counter("krishi_inference_rejected", "Detections shed with 503", executor["rejected"])
+
+    pool = pool_stats()
+    yield metrics.gauge("krishi_db_pool_checked_out", "Async DB connections in use", pool["checked_out"])
+    yield metrics.gauge("krishi_db_pool_capacity", "Async DB pool size + overflow", pool["capacity"])
+    yield metrics.gauge("krishi_db_pool_utilisation", "Async DB connections in use / capacity", pool["utilisation"])
+
+    yield metrics.gauge("krishi_model_ready", "1 once the model finished loading", int(ml_service.ready))
+    yield metrics.gauges_by_label(
+        "krishi_model_info", "Served model versions (always 1)", ["role", "mode", "backend", "version"],
+        [
+            ((role, model.mode, model.backend_name, model.version), 1)
+            for role, model in (("active", ml_service.active), ("canary", ml_service.canary))
+            if model is not None
+        ],
+    )
+    yield metrics.gauge("krishi_model_canary_percent", "Share of users routed to the canary",
+                        ml_service.canary_percent if ml_service.canary else 0)
+    yield metrics.counter("krishi_model_reloads", "Model versions swapped in without restart", ml_service.reloads)
+
+    scans = scan_writer.stats()
+    yield metrics.gauge("krishi_scan_buffer_depth", "Scans waiting to be written", scans["buffer_depth"])
+    yield metrics.counter("krishi_scans_dropped", "Scans dropped on a full buffer", scans["dropped"])
+
+    embeddings = embedding_writer.stats()
+    yield metrics.gauge("krishi_embedding_buffer_depth", "Embeddings waiting to be written",
+                        embeddings["buffer_depth"])
+    yield metrics.counter("krishi_embeddings_dropped", "Embeddings dropped on a full buffer", embeddings["dropped"])
+    yield metrics.gauges_by_label(
+        "krishi_embedding_index_rows", "Embeddings in the similar-case index", ["version", "kind"],
+        [((version, index["kind"]), index["indexed"]) for version, index in embedding_store.stats()["versions"].items()],
+    )
+
+    logs = logging_stats()
+    if logs["queued"]:
+        yield metrics.gauge("krishi_log_queue_depth", "Log records waiting to be written", logs["queue_depth"])
+        yield metrics.counter("krishi_log_records_dropped", "Log records dropped on a full queue", logs["dropped"])
+        yield metrics.counter("krishi_log_records_sampled_out", "INFO records skipped by LOG_SAMPLING",
+                              logs["sampled_out"])
+
+
+metrics.gauges.add(_runtime_gauges)
+
+
+@app.get("/metrics", tags=["system"], response_class=Response)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    return Response(metrics.render(), media_type=CONTENT_TYPE_LATEST)
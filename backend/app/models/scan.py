@@ -0,0 +1,23 @@
+"""
+Scan Model — SQLAlchemy ORM definition
+One row per detection: who scanned, what the model said, and where.
+Rows are written in bulk by app.services.scan_writer, never per request.
+"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from app.database import Base
+
+
+class Scan(Base):
+    __tablename__ = "scans"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    class_index = Column(Integer, nullable=False)
+    disease_name = Column(String, index=True, nullable=False)
+    confidence = Column(Float, nullable=False)
+    model_version = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    image_sha256 = Column(String(64), index=True, nullable=True)
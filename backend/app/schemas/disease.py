@@ -2,6 +2,7 @@
 Pydantic Response Schemas — Disease Detection
 Defines the exact shape of API responses for Swagger documentation.
 """
+from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
@@ -19,5 +20,28 @@ class DetectionResponse(BaseModel):
     disease_name_hi: Optional[str] = Field(None, description="Disease name in Hindi (if available)")
     severity: str = Field("UNKNOWN", description="Severity level: LOW, MEDIUM, HIGH, or UNKNOWN")
     treatment: TreatmentSchema = Field(..., description="Treatment recommendation")
+    model_version: Optional[str] = Field(None, description="Model version that produced the prediction")
+    crop: Optional[str] = Field(None, description="Crop the prediction was restricted to (null: all crops)")
 
     model_config = {"from_attributes": True}
+
+
+class SimilarCase(BaseModel):
+    """One earlier scan whose leaf looks like the uploaded one."""
+    disease_name: str = Field(..., description="What the model predicted for that scan")
+    confidence: float = Field(..., ge=0.0, le=1.0, description="Model confidence for that scan")
+    similarity: float = Field(..., description="Cosine similarity of the two leaves' embeddings (1.0 = identical)")
+    scanned_at: datetime = Field(..., description="When that scan was made (UTC)")
+    own_scan: bool = Field(..., description="Whether the scan belongs to the requesting user")
+    duplicate: bool = Field(..., description="Similar enough to be the same leaf photographed again")
+
+
+class SimilarCasesResponse(BaseModel):
+    """Response schema for POST /api/detect/similar"""
+    disease_name: str = Field(..., description="Prediction for the uploaded image")
+    confidence: float = Field(..., ge=0.0, le=1.0)
+    model_version: str = Field(..., description="Model version whose embeddings were searched")
+    crop: Optional[str] = Field(None, description="Crop the prediction was restricted to (null: all crops)")
+    duplicate: bool = Field(..., description="Whether any of the cases is a near duplicate")
+    cases: List[SimilarCase] = Field(..., description="Most similar earlier scans, most similar first")
+
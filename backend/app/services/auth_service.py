@@ -1,27 +1,49 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
 from app.config import settings
-from app.database import get_db
+from app.database import async_session
 from app.models.user import User
+from app.core.stats import LatencyTracker
+from app.core.executor import password_hash_executor
 import logging
 
 logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+_BCRYPT_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
 def get_password_hash(password: str) -> str:
     # Use bcrypt directly to avoid passlib compatibility issues with newer bcrypt versions
-    salt = bcrypt.gensalt(rounds=12)
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+def needs_rehash(hashed_password: str) -> bool:
+    """True when the stored hash was made with a different cost than BCRYPT_ROUNDS."""
+    match = _BCRYPT_COST.match(hashed_password)
+    return match is None or int(match.group(1)) != settings.BCRYPT_ROUNDS
+
+# Endpoint-facing versions: run on the dedicated password-hash pool without
+# blocking the event loop. Raise ExecutorSaturated when its queue is full.
+async def hash_password_async(password: str) -> str:
+    return await password_hash_executor.run(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hash_executor.run(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -32,21 +54,117 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+@dataclass(frozen=True)
+class Principal:
+    """Authenticated caller, detached from any DB session."""
+    id: int
+    email: str
+
+
+class PrincipalCache:
+    """
+    Bounded LRU of verified tokens → Principal.
+    An entry lives until the token expires or AUTH_CACHE_TTL_SECONDS pass,
+    whichever is first, so a deleted user is re-checked within the TTL even
+    if the explicit invalidation below was missed (e.g. bulk DELETEs).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, principal: Principal, token_expires_at: float):
+        if self.max_entries <= 0:
+            return
+        expires_at = min(token_expires_at, time.time() + self.ttl)
+        with self._lock:
+            self._entries[token] = (expires_at, principal)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            stale = [token for token, (_, principal) in self._entries.items() if principal.id == user_id]
+            for token in stale:
+                del self._entries[token]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+auth_latency = LatencyTracker()
+
+
+@event.listens_for(User, "after_delete")
+def _evict_deleted_user(mapper, connection, target):
+    principal_cache.invalidate_user(target.id)
+
+
+async def _load_principal(payload: dict) -> Optional[Principal]:
+    """Cache miss: confirm the user still exists."""
+    query = select(User.id, User.email)
+    user_id = payload.get("uid")
+    if user_id is not None:
+        query = query.where(User.id == user_id)
+    else:
+        # Tokens issued before `uid` was added only carry the email
+        query = query.where(User.email == payload.get("sub"))
+    async with async_session() as db:
+        row = (await db.execute(query)).first()
+    return Principal(id=row.id, email=row.email) if row else None
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    start_time = time.perf_counter()
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+        principal = principal_cache.get(token)
+        if principal is not None:
+            return principal
+
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
+            raise credentials_exception
+
+        principal = await _load_principal(payload)
+        if principal is None:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise credentials_exception
-    return user
+        principal_cache.put(token, principal, float(payload["exp"]))
+        return principal
+    finally:
+        auth_latency.record(time.perf_counter() - start_time)
+
+
+def auth_stats() -> dict:
+    return {
+        "principal_cache": principal_cache.stats(),
+        "latency": auth_latency.snapshot(),
+        "password_hash": password_hash_executor.stats(),
+    }
@@ -0,0 +1,147 @@
+"""
+Micro-Batching Scheduler
+Collects concurrent inference requests into a single forward pass.
+
+Callers submit one item at a time and get a Future back. A single worker
+thread drains the queue, waiting at most `max_delay_ms` after the first item
+for the batch to fill up to `max_batch_size`, then hands the whole batch to
+`fn` and resolves every Future with its own result.
+
+Submitting and closing take the same lock, so nothing is queued behind the
+stop marker; whatever is still queued when the worker exits is failed, so no
+caller waits on a Future forever.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 8,
+        max_delay_ms: float = 5.0,
+        name: str = "micro-batcher",
+    ):
+        self._fn = fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        # Stats
+        self._batches = 0
+        self._items = 0
+        self._size_histogram = [0] * (self.max_batch_size + 1)
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the Future resolves with its slot of the batch result."""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._queue.put((item, future))
+        return future
+
+    def close(self, timeout: float = 5.0):
+        """Stop the worker after it finishes the batches already queued."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self._batches
+        mean_size = self._items / batches if batches else 0.0
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_delay_ms": self.max_delay * 1000.0,
+            "pending": self._queue.qsize(),
+            "batches": batches,
+            "items": self._items,
+            "mean_batch_size": round(mean_size, 3),
+            "mean_fill_ratio": round(mean_size / self.max_batch_size, 3),
+            "batch_size_histogram": {
+                str(size): count for size, count in enumerate(self._size_histogram) if count
+            },
+        }
+
+    def _run(self):
+        try:
+            self._drain()
+        finally:
+            with self._lock:
+                self._closed = True
+            self._fail_pending(RuntimeError(f"{self.name} is closed"))
+
+    def _drain(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._dispatch(batch)
+
+    def _fail_pending(self, error: Exception):
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not _STOP and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(error)
+
+    def _dispatch(self, batch):
+        # Drop entries whose caller already gave up
+        live = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+
+        self._batches += 1
+        self._items += len(live)
+        self._size_histogram[len(live)] += 1
+
+        try:
+            results = self._fn([item for item, _ in live])
+            if len(results) != len(live):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(live)} items")
+        except Exception as e:
+            logger.error(f"{self.name}: batch of {len(live)} failed: {e}")
+            for _, future in live:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(live, results):
+            future.set_result(result)
@@ -0,0 +1,106 @@
+"""
+Crop-Routed Classification Heads
+A model version may be split into a shared feature backbone (served by any
+inference backend, outputting (batch, features)) plus one small dense head
+per crop, stored together in a heads.npz next to the backbone:
+
+    <crop>.weight   float32 (features, classes_of_crop)
+    <crop>.bias     float32 (classes_of_crop,)
+    <crop>.classes  int64 indices into the version's global class list
+
+The head named "all" scores every class and serves requests without a crop
+hint. A new crop (saffron, walnut, rice, ...) is a new head trained on the
+frozen backbone's features, so neither the backbone nor its latency grows.
+
+Monolithic models get crop hints too: scores are restricted to that crop's
+classes and renormalised (P(disease | crop)), which removes cross-crop
+confusions but saves no compute.
+
+Like preprocessing, this module only depends on NumPy.
+"""
+import re
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+ALL_CROPS = "all"
+
+
+def crop_key(name: str) -> str:
+    """"Pepper,_bell" / "pepper bell" / "Pepper,_bell___healthy" → "pepper_bell"."""
+    return re.sub(r"[^a-z0-9]+", "_", name.split("___")[0].lower()).strip("_")
+
+
+def crop_classes(classes: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Crop → indices of its classes, from PlantVillage-style "Crop___Disease" labels."""
+    groups: Dict[str, List[int]] = {}
+    for index, label in enumerate(classes):
+        if "___" in label:
+            groups.setdefault(crop_key(label), []).append(index)
+    return {crop: np.asarray(ids, dtype=np.int64) for crop, ids in groups.items()}
+
+
+class CropHead:
+    __slots__ = ("name", "weight", "bias", "class_ids")
+
+    def __init__(self, name: str, weight: np.ndarray, bias: np.ndarray, class_ids: np.ndarray):
+        if weight.shape[1] != bias.shape[0] or bias.shape[0] != class_ids.shape[0]:
+            raise ValueError(f"Head '{name}': weight {weight.shape}, bias {bias.shape}, classes {class_ids.shape}")
+        self.name = name
+        self.weight = np.ascontiguousarray(weight, dtype=np.float32)
+        self.bias = np.ascontiguousarray(bias, dtype=np.float32)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64)
+
+    def scores(self, features: np.ndarray) -> np.ndarray:
+        """Softmax over this head's classes for a (n, features) block."""
+        logits = features @ self.weight
+        logits += self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+
+def load_heads(path: str, num_classes: int) -> Dict[str, CropHead]:
+    heads = {}
+    with np.load(path) as archive:
+        names = {key.rsplit(".", 1)[0] for key in archive.files}
+        for name in names:
+            head = CropHead(name, archive[f"{name}.weight"], archive[f"{name}.bias"], archive[f"{name}.classes"])
+            if head.class_ids.size and (head.class_ids.min() < 0 or head.class_ids.max() >= num_classes):
+                raise ValueError(f"Head '{name}' refers to classes outside the manifest's {num_classes}")
+            heads[name] = head
+    if ALL_CROPS not in heads:
+        raise ValueError(f"{path} has no '{ALL_CROPS}' head")
+    return heads
+
+
+def save_heads(path: str, heads: Dict[str, CropHead]):
+    arrays = {}
+    for name, head in heads.items():
+        arrays[f"{name}.weight"] = head.weight
+        arrays[f"{name}.bias"] = head.bias
+        arrays[f"{name}.classes"] = head.class_ids
+    np.savez(path, **arrays)
+
+
+def heads_from_dense(weight: np.ndarray, bias: np.ndarray, classes: Sequence[str]) -> Dict[str, CropHead]:
+    """
+    Split a trained final Dense layer (features, classes) into per-crop heads
+    by column. Each head equals the full classifier restricted to its crop,
+    so this is the starting point before training heads for new crops.
+    """
+    all_ids = np.arange(len(classes), dtype=np.int64)
+    heads = {ALL_CROPS: CropHead(ALL_CROPS, weight, bias, all_ids)}
+    for crop, ids in crop_classes(classes).items():
+        heads[crop] = CropHead(crop, weight[:, ids], bias[ids], ids)
+    return heads
+
+
+def restrict(scores: np.ndarray, class_ids: Optional[np.ndarray]) -> np.ndarray:
+    """Probabilities of one row restricted to `class_ids` and renormalised."""
+    if class_ids is None:
+        return scores
+    restricted = scores[class_ids]
+    total = restricted.sum()
+    return restricted / total if total > 0 else restricted
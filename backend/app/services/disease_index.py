@@ -0,0 +1,175 @@
+"""
+Disease Knowledge Index
+In-memory, immutable snapshot of the `diseases` table. Built once at startup
+(and on refresh) so detection never needs a DB session: model class index →
+DiseaseEntry with treatment steps already split → pre-serialized static part
+of the detection response (Hindi name, severity, treatment).
+
+Each model version gets its own class table, built from its own class list on
+first use, so a canary with another class order is covered too. A class label
+is matched against catalog names from the most specific form to the bare
+disease name ("Grape___Black_rot", "Grape Black rot", "Black rot"), so a
+crop-specific row takes precedence over a shared one.
+
+Refreshing builds a new DiseaseIndex and swaps the reference, so readers
+always see either the old or the new snapshot, never a mix.
+"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.database import SessionLocal
+from app.models.disease import Disease
+from app.services.ml_service import canonical_name
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DiseaseEntry:
+    name: str
+    name_hi: Optional[str]
+    severity: str
+    treatment_steps: Tuple[str, ...]
+    symptoms: Optional[str] = None
+
+
+# (entry, response fragment) of one model class; (None, None) without a catalog row
+ClassRecord = Tuple[Optional[DiseaseEntry], Optional[bytes]]
+
+
+def class_names(label: str) -> Tuple[str, ...]:
+    """Catalog names a model class label may be stored under, most specific first."""
+    crop, _, disease = label.rpartition("___")
+    names = [label]
+    if crop:
+        names.append(f"{crop} {disease}".replace("_", " "))
+    names.append(canonical_name(label))
+    return tuple(dict.fromkeys(names))
+
+
+def response_fragment(name_hi: Optional[str], severity: str, treatment_steps: Sequence[str]) -> bytes:
+    """The disease_name_hi, severity and treatment members of a DetectionResponse, as JSON without the braces."""
+    fields = {"disease_name_hi": name_hi, "severity": severity, "treatment": {"steps": list(treatment_steps)}}
+    return json.dumps(fields, ensure_ascii=False, separators=(",", ":"))[1:-1].encode()
+
+
+class DiseaseIndex:
+    def __init__(self, entries: Sequence[DiseaseEntry], classes: Sequence[str], version: int):
+        self.version = version
+        self.loaded_at = time.time()
+        self.by_name: Dict[str, DiseaseEntry] = {entry.name: entry for entry in entries}
+        self.response_fragments: Dict[str, bytes] = {
+            entry.name: response_fragment(entry.name_hi, entry.severity, entry.treatment_steps) for entry in entries
+        }
+        self.classes = len(classes)
+        self.unmapped_classes = [label for label in classes if self.record(label)[0] is None]
+        # model version -> (the class list it was built from, its class table)
+        self._class_tables: Dict[str, Tuple[Sequence[str], Tuple[ClassRecord, ...]]] = {}
+        self._fingerprint = tuple(entries)
+
+    def record(self, label: str) -> ClassRecord:
+        for name in class_names(label):
+            entry = self.by_name.get(name)
+            if entry is not None:
+                return entry, self.response_fragments[name]
+        return None, None
+
+    def class_table(self, model_version: str, classes: Sequence[str]) -> Tuple[ClassRecord, ...]:
+        """class index → ClassRecord for one model version, built on first use."""
+        cached = self._class_tables.get(model_version)
+        if cached is not None and cached[0] is classes:
+            return cached[1]
+        table = tuple(self.record(label) for label in classes)
+        self._class_tables[model_version] = (classes, table)
+        return table
+
+    def same_content(self, entries: Sequence[DiseaseEntry]) -> bool:
+        return self._fingerprint == tuple(entries)
+
+
+class DiseaseCatalog:
+    def __init__(self):
+        self._classes: List[str] = []
+        self._index = DiseaseIndex([], [], version=0)
+
+    @property
+    def index(self) -> DiseaseIndex:
+        return self._index
+
+    def for_class(self, model_version: str, classes: Sequence[str], class_index: int) -> ClassRecord:
+        """
+        Entry and pre-serialized static response fields (see
+        app.api.endpoints.detect._encode_response) of one class of the model
+        version whose class list is `classes`.
+        """
+        table = self._index.class_table(model_version, classes)
+        if 0 <= class_index < len(table):
+            return table[class_index]
+        return None, None
+
+    def refresh(self, classes: Optional[Sequence[str]] = None) -> DiseaseIndex:
+        """
+        Reload the catalog from the DB (blocking). Pass `classes` when the
+        model's class list changes; otherwise the previous list is reused.
+        The version only bumps when the content actually changed.
+        """
+        if classes is not None:
+            self._classes = list(classes)
+
+        entries = self._load_entries()
+        current = self._index
+        if classes is None and current.version and current.same_content(entries):
+            return current
+
+        index = DiseaseIndex(entries, self._classes, version=current.version + 1)
+        self._index = index
+        logger.info(
+            f"Disease index v{index.version} loaded: {len(entries)} diseases, "
+            f"{len(self._classes) - len(index.unmapped_classes)}/{len(self._classes)} model classes mapped"
+        )
+        return index
+
+    async def refresh_periodically(self, interval_seconds: float):
+        """Background task: pick up catalog edits without a restart."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Disease index refresh failed: {e}")
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "version": index.version,
+            "loaded_at": index.loaded_at,
+            "diseases": len(index.by_name),
+            "classes": index.classes,
+            "unmapped_classes": len(index.unmapped_classes),
+        }
+
+    @staticmethod
+    def _load_entries() -> List[DiseaseEntry]:
+        db = SessionLocal()
+        try:
+            rows = db.query(Disease).order_by(Disease.id).all()
+            # Treatment is stored as newline-separated text in the DB.
+            return [
+                DiseaseEntry(
+                    name=row.name,
+                    name_hi=row.name_hi,
+                    severity=row.severity or "UNKNOWN",
+                    treatment_steps=tuple(row.treatment.split('\n')) if row.treatment else (),
+                    symptoms=row.symptoms,
+                )
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+
+disease_catalog = DiseaseCatalog()
@@ -0,0 +1,506 @@
+"""
+Scan Embeddings
+Backbone features of every detection, kept for "similar cases" and
+near-duplicate lookups. They come for free out of the forward pass that
+scores the image (LoadedModel.predict_batch): the penultimate layer of a
+single classifier (InferenceBackend.forward), or the backbone output of a
+backbone + crop heads version.
+
+One directory per model version (different backbones are not comparable):
+
+    EMBEDDING_STORE_DIR/<version>/
+      log.json      {"dim": 1280}
+      vectors.f16   (n, dim) float16, unit length, append-only, memory-mapped
+      meta.bin      (n,) META_DTYPE records in the same order
+      .lock         flock'd around appends, so all workers share one log
+
+Vectors reach the log through EmbeddingWriter (write-behind, like the scan
+history); exact re-uploads of an image already in the log are skipped. Each
+worker searches its own in-memory index and tails the log for rows any
+worker appended:
+
+- exact: below EMBEDDING_PROJECT_MIN_VECTORS rows, full vectors are scanned
+- flat:  vectors PCA-projected to EMBEDDING_SEARCH_DIM, scanned in full
+- IVF:   from EMBEDDING_IVF_MIN_VECTORS rows, k-means partitions of the
+         projected vectors (~sqrt(n) of them); a query scans the
+         EMBEDDING_IVF_NPROBE closest partitions
+
+IVF partitions keep their projected vectors as float16 too, which halves
+each worker's copy; a search upcasts only the partitions it probes. Exact and
+flat indexes are small enough for float32, and a search scans them whole, so
+they stay float32. Projected candidates are re-ranked by exact cosine
+similarity on the logged float16 vectors. Projection and partitions are
+retrained in a background thread each time the log has grown
+RETRAIN_GROWTH-fold; searches keep using the previous index meanwhile, and
+new rows are added to whichever index is current.
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.scan_writer import ScanWriter
+
+logger = logging.getLogger(__name__)
+
+META_DTYPE = np.dtype([
+    ("image", "<u8"),        # first 8 bytes of the upload's sha256
+    ("class_index", "<i2"),
+    ("confidence", "<f2"),
+    ("user_id", "<i4"),
+    ("created_at", "<u4"),   # unix seconds
+])
+
+RETRAIN_GROWTH = 4
+RERANK_FACTOR = 8
+PCA_SAMPLE_ROWS = 4096
+KMEANS_SAMPLES_PER_LIST = 32
+KMEANS_ITERATIONS = 10
+CHUNK_ROWS = 32768
+
+
+class IndexNotReady(Exception):
+    """The version's index is still being built from an existing log."""
+
+
+def image_key(sha256_hex: str) -> int:
+    return int(sha256_hex[:16], 16)
+
+
+class EmbeddingLog:
+    """Append-only float16 vectors + metadata of one model version."""
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.meta_path = os.path.join(directory, "meta.bin")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._maps: Tuple[int, Optional[np.ndarray], Optional[np.ndarray]] = (0, None, None)
+
+    @classmethod
+    def open(cls, directory: str, dim: Optional[int] = None) -> Optional["EmbeddingLog"]:
+        """Existing log, or a new one when `dim` is given; None if neither."""
+        header = os.path.join(directory, "log.json")
+        if os.path.exists(header):
+            with open(header, encoding="utf-8") as f:
+                stored = int(json.load(f)["dim"])
+            if dim is not None and dim != stored:
+                raise ValueError(f"{directory} holds {stored}-d embeddings, got {dim}-d")
+            return cls(directory, stored)
+        if dim is None:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{header}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": dim}, f)
+        os.replace(tmp_path, header)
+        return cls(directory, dim)
+
+    def count(self) -> int:
+        try:
+            vectors = os.path.getsize(self.vectors_path) // (self.dim * 2)
+            meta = os.path.getsize(self.meta_path) // META_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+        return min(vectors, meta)
+
+    def append(self, vectors: np.ndarray, meta: np.ndarray, skip_known_images: bool = True) -> int:
+        """Append rows (vectors already unit length); returns how many were written."""
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            rows = self.count()
+            if skip_known_images and rows:
+                keep = ~np.isin(meta["image"], self.view(rows)[1]["image"])
+                vectors, meta = vectors[keep], meta[keep]
+            if not len(meta):
+                return 0
+            # A crash between the two writes leaves one file longer; drop its torn tail
+            for path, data, width in (
+                (self.vectors_path, vectors.astype(np.float16), self.dim * 2),
+                (self.meta_path, meta.astype(META_DTYPE), META_DTYPE.itemsize),
+            ):
+                with open(path, "ab") as f:
+                    f.truncate(rows * width)
+                    f.write(np.ascontiguousarray(data).tobytes())
+            return len(meta)
+
+    def view(self, rows: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Read-only memory maps of the first `rows` rows (default: all)."""
+        rows = self.count() if rows is None else rows
+        mapped, vectors, meta = self._maps
+        if vectors is None or mapped < rows:
+            if rows == 0:
+                return np.empty((0, self.dim), np.float16), np.empty(0, META_DTYPE)
+            vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+            meta = np.memmap(self.meta_path, dtype=META_DTYPE, mode="r", shape=(rows,))
+            self._maps = (rows, vectors, meta)
+        return vectors[:rows], meta[:rows]
+
+
+class _Partition:
+    """Growable block of (projected) vectors, their squared norms and log row ids."""
+
+    def __init__(self, dim: int, dtype=np.float32):
+        self.vectors = np.empty((0, dim), dtype)
+        self.norms = np.empty(0, np.float32)
+        self.ids = np.empty(0, np.int64)
+        self.size = 0
+
+    def extend(self, vectors: np.ndarray, ids: np.ndarray):
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids), 64)
+            for name in ("vectors", "norms", "ids"):
+                current = getattr(self, name)
+                grown = np.empty((capacity,) + current.shape[1:], current.dtype)
+                grown[:self.size] = current[:self.size]
+                setattr(self, name, grown)
+        self.vectors[self.size:needed] = vectors
+        # Norms of the rounded vectors, so scores match what search computes
+        stored = self.vectors[self.size:needed].astype(np.float32, copy=False)
+        self.norms[self.size:needed] = np.einsum("ij,ij->i", stored, stored)
+        self.ids[self.size:needed] = ids
+        self.size = needed
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.vectors[:self.size], self.norms[:self.size], self.ids[:self.size]
+
+
+class _IndexState:
+    """One trained index: projection, partitions and how far into the log it goes."""
+
+    def __init__(self, dim: int, mean=None, projection=None, centroids=None, trained_rows: int = 0):
+        self.mean = mean
+        self.projection = projection
+        self.centroids = centroids
+        self.trained_rows = trained_rows
+        search_dim = dim if projection is None else projection.shape[1]
+        if centroids is None:
+            self.partitions = [_Partition(search_dim)]
+        else:
+            self.partitions = [_Partition(search_dim, np.float16) for _ in range(len(centroids))]
+        self.indexed = 0
+
+    @property
+    def kind(self) -> str:
+        if self.projection is None:
+            return "exact"
+        return "flat" if self.centroids is None else "ivf"
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        block = np.asarray(vectors, dtype=np.float32)
+        if self.projection is None:
+            return block
+        return (block - self.mean) @ self.projection
+
+    def add(self, projected: np.ndarray, ids: np.ndarray):
+        if self.centroids is None:
+            self.partitions[0].extend(projected, ids)
+            return
+        assign = _nearest(projected, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.partitions) + 1))
+        for list_id in np.unique(assign):
+            rows = order[bounds[list_id]:bounds[list_id + 1]]
+            self.partitions[list_id].extend(projected[rows], ids[rows])
+
+    def catch_up(self, log: EmbeddingLog, rows: int):
+        vectors, _ = log.view(rows)
+        for start in range(self.indexed, rows, CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, rows)
+            self.add(self.project(vectors[start:stop]), np.arange(start, stop, dtype=np.int64))
+        self.indexed = max(self.indexed, rows)
+
+    def probe(self, projected_query: np.ndarray, nprobe: int) -> List[_Partition]:
+        if self.centroids is None:
+            return self.partitions
+        nprobe = min(nprobe, len(self.centroids))
+        scores = self.centroids @ projected_query - 0.5 * np.einsum("ij,ij->i", self.centroids, self.centroids)
+        return [self.partitions[i] for i in np.argpartition(-scores, nprobe - 1)[:nprobe]]
+
+
+class NeighbourIndex:
+    """Cosine nearest neighbours over one version's log, kept current by tailing it."""
+
+    def __init__(self, log: EmbeddingLog, name: str, search_dim: int, project_min: int,
+                 ivf_min: int, nprobe: int):
+        self.log = log
+        self.name = name
+        self.search_dim = search_dim
+        self.project_min = max(project_min, search_dim * 2)
+        self.ivf_min = ivf_min
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._training = False
+        self._state: Optional[_IndexState] = None
+        self.searches = 0
+        self.trainings = 0
+        if log.count() < self.project_min:
+            self._state = _IndexState(log.dim)
+        self.sync()
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    def sync(self):
+        """Index rows appended since the last call; start retraining when the log has grown enough."""
+        rows = self.log.count()
+        state = self._state
+        if state is not None and rows > state.indexed:
+            with self._lock:
+                state.catch_up(self.log, rows)
+        if self._should_train(state, rows):
+            self._start_training(rows)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Log row ids and cosine similarities of the `k` nearest rows, best first."""
+        self.sync()
+        state = self._state
+        if state is None:
+            raise IndexNotReady(self.name)
+        self.searches += 1
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        projected = state.project(query[None])[0]
+        with self._lock:
+            blocks = [partition.snapshot() for partition in state.probe(projected, self.nprobe)]
+        blocks = [block for block in blocks if len(block[2])]
+        if not blocks:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        # argmin ||p(x) - p(q)||^2 == argmax 2 p(x).p(q) - |p(x)|^2
+        scores = np.concatenate([
+            2 * (vectors.astype(np.float32, copy=False) @ projected) - norms for vectors, norms, _ in blocks
+        ])
+        ids = np.concatenate([block_ids for _, _, block_ids in blocks])
+        candidates = min(len(ids), k if state.kind == "exact" else k * RERANK_FACTOR)
+        ids = np.sort(ids[np.argpartition(-scores, candidates - 1)[:candidates]])
+
+        vectors, _ = self.log.view(state.indexed)
+        similarities = vectors[ids].astype(np.float32) @ query
+        best = np.argsort(-similarities)[:k]
+        return ids[best], similarities[best]
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "rows": self.log.count(),
+            "indexed": state.indexed if state else 0,
+            "kind": state.kind if state else "building",
+            "partitions": len(state.partitions) if state else 0,
+            "trained_rows": state.trained_rows if state else 0,
+            "training": self._training,
+            "trainings": self.trainings,
+            "searches": self.searches,
+        }
+
+    def _should_train(self, state: Optional[_IndexState], rows: int) -> bool:
+        if self._training or rows < self.project_min:
+            return False
+        if state is None or state.kind == "exact":
+            return True
+        return rows >= state.trained_rows * RETRAIN_GROWTH
+
+    def _start_training(self, rows: int):
+        with self._lock:
+            if self._training:
+                return
+            self._training = True
+        threading.Thread(target=self._train, args=(rows,), name=f"embedding-index[{self.name}]", daemon=True).start()
+
+    def _train(self, rows: int):
+        start_time = time.perf_counter()
+        try:
+            state = _train_state(self.log, rows, self.search_dim, self.ivf_min)
+            state.catch_up(self.log, rows)
+            # Rows that arrived while training: most outside the lock, the rest under it
+            state.catch_up(self.log, self.log.count())
+            with self._lock:
+                state.catch_up(self.log, self.log.count())
+                self._state = state
+            self.trainings += 1
+            logger.info(
+                f"Embedding index {self.name}: {state.kind} over {state.indexed} rows, "
+                f"{len(state.partitions)} partitions, built in {time.perf_counter() - start_time:.1f}s"
+            )
+        except Exception as e:
+            logger.error(f"Embedding index {self.name}: training failed: {e}")
+        finally:
+            self._training = False
+
+
+def _train_state(log: EmbeddingLog, rows: int, search_dim: int, ivf_min: int) -> _IndexState:
+    vectors, _ = log.view(rows)
+    rng = np.random.default_rng(0)  # deterministic: every worker trains the same index
+
+    sample = vectors[np.sort(rng.choice(rows, min(rows, PCA_SAMPLE_ROWS), replace=False))].astype(np.float32)
+    mean = sample.mean(axis=0)
+    sample -= mean
+    _, eigenvectors = np.linalg.eigh(sample.T @ sample)
+    projection = np.ascontiguousarray(eigenvectors[:, ::-1][:, :min(search_dim, log.dim)], dtype=np.float32)
+
+    centroids = None
+    if rows >= ivf_min:
+        nlist = int(np.sqrt(rows))
+        sample_ids = np.sort(rng.choice(rows, min(rows, nlist * KMEANS_SAMPLES_PER_LIST), replace=False))
+        projected = (vectors[sample_ids].astype(np.float32) - mean) @ projection
+        centroids = _kmeans(projected, nlist, rng)
+    return _IndexState(log.dim, mean, projection, centroids, trained_rows=rows)
+
+
+def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    assign = np.empty(len(points), np.int64)
+    for start in range(0, len(points), 8192):
+        block = points[start:start + 8192]
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return assign
+
+
+def _kmeans(points: np.ndarray, nlist: int, rng) -> np.ndarray:
+    centroids = points[rng.choice(len(points), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = _nearest(points, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        filled = np.flatnonzero(counts)
+        starts = np.searchsorted(assign[order], filled)
+        centroids[filled] = np.add.reduceat(points[order], starts, axis=0) / counts[filled, None]
+    return centroids
+
+
+class EmbeddingStore:
+    def __init__(self, root: str, search_dim: int, project_min: int, ivf_min: int, nprobe: int):
+        self.root = os.path.abspath(root) if root else ""
+        self.search_dim = search_dim
+        self.project_min = project_min
+        self.ivf_min = ivf_min
+        self.nprobe = nprobe
+        self._indexes: Dict[str, NeighbourIndex] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def index(self, version: str, dim: Optional[int] = None) -> Optional[NeighbourIndex]:
+        """The version's index, opening (or, with `dim`, creating) its log on first use."""
+        index = self._indexes.get(version)
+        if index is not None or not self.enabled:
+            return index
+        with self._lock:
+            index = self._indexes.get(version)
+            if index is None:
+                log = EmbeddingLog.open(os.path.join(self.root, _directory_name(version)), dim)
+                if log is None:
+                    return None
+                index = NeighbourIndex(log, version, self.search_dim, self.project_min, self.ivf_min, self.nprobe)
+                self._indexes[version] = index
+        return index
+
+    def append(self, version: str, vectors: np.ndarray, meta: np.ndarray) -> int:
+        vectors = vectors.astype(np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        # Within one flush, keep the first row of each image
+        _, first = np.unique(meta["image"], return_index=True)
+        first = np.sort(first)
+        return self.index(version, vectors.shape[1]).log.append(vectors[first], meta[first])
+
+    def search(self, version: str, embedding: np.ndarray, k: int, user_id: int,
+               min_confidence: float) -> List[dict]:
+        """
+        Up to `k` neighbours: the user's own scans, and other users' scans
+        predicted with at least `min_confidence`.
+        """
+        index = self.index(version)
+        if index is None:
+            return []
+        ids, similarities = index.search(embedding, k * RERANK_FACTOR)
+        _, meta = index.log.view(int(ids.max()) + 1 if len(ids) else 0)
+        rows = meta[ids]
+        own = rows["user_id"] == user_id
+        keep = np.flatnonzero(own | (rows["confidence"] >= min_confidence))[:k]
+        return [
+            {
+                "similarity": float(similarities[i]),
+                "class_index": int(rows["class_index"][i]),
+                "confidence": float(rows["confidence"][i]),
+                "created_at": int(rows["created_at"][i]),
+                "image": int(rows["image"][i]),
+                "own_scan": bool(own[i]),
+            }
+            for i in keep
+        ]
+
+    def warm(self, version: str):
+        """Open (and start building) a version's index before its first search."""
+        if self.enabled:
+            self.index(version)
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root or None,
+            "versions": {version: index.stats() for version, index in list(self._indexes.items())},
+        }
+
+
+def _directory_name(version: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._@-]", "_", version)
+
+
+class EmbeddingWriter(ScanWriter):
+    """The scan history's write-behind buffer, flushing to embedding logs instead of the scans table."""
+
+    def __init__(self, store: EmbeddingStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def record(self, model_version: str, embedding: np.ndarray, image_sha256: str, class_index: int,
+               confidence: float, user_id: int) -> bool:
+        if not self.store.enabled:
+            return False
+        return self._enqueue((model_version, embedding, image_key(image_sha256), class_index, confidence,
+                              user_id, int(time.time())))
+
+    def _flush(self, rows: List[tuple]):
+        start_time = time.perf_counter()
+        by_version: Dict[str, List[tuple]] = {}
+        for row in rows:
+            by_version.setdefault(row[0], []).append(row)
+        try:
+            for version, version_rows in by_version.items():
+                meta = np.array([row[2:] for row in version_rows], dtype=META_DTYPE)
+                self.store.append(version, np.stack([row[1] for row in version_rows]), meta)
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"{self.name}: failed to write {len(rows)} embeddings: {e}")
+            return
+        finally:
+            self._flush_latency.record(time.perf_counter() - start_time)
+        self.flushes += 1
+        self.written += len(rows)
+
+
+embedding_store = EmbeddingStore(
+    root=settings.EMBEDDING_STORE_DIR,
+    search_dim=settings.EMBEDDING_SEARCH_DIM,
+    project_min=settings.EMBEDDING_PROJECT_MIN_VECTORS,
+    ivf_min=settings.EMBEDDING_IVF_MIN_VECTORS,
+    nprobe=settings.EMBEDDING_IVF_NPROBE,
+)
+embedding_writer = EmbeddingWriter(
+    embedding_store,
+    max_buffer=settings.EMBEDDING_BUFFER_SIZE,
+    flush_rows=settings.EMBEDDING_FLUSH_ROWS,
+    flush_interval_s=settings.EMBEDDING_FLUSH_INTERVAL_SECONDS,
+    name="embedding-writer",
+)
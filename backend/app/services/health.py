@@ -0,0 +1,136 @@
+"""
+Health Prober
+A background task checks the database, the model and the inference queue
+every HEALTH_PROBE_INTERVAL_SECONDS and keeps the result as an immutable
+snapshot. /health, /livez and /readyz only read that snapshot, so load
+balancer probes never open DB connections or wait on a slow database.
+
+A snapshot older than HEALTH_STALE_AFTER_SECONDS means the prober itself is
+stuck; readiness then fails.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.core.executor import inference_executor
+from app.database import async_engine
+from app.services.ml_service import ml_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CheckResult:
+    ok: bool
+    detail: str
+    duration_ms: float = 0.0
+
+
+@dataclass(frozen=True)
+class HealthSnapshot:
+    checked_at: float  # time.time()
+    checked_at_monotonic: float
+    checks: Dict[str, CheckResult] = field(default_factory=dict)
+
+    @property
+    def ready(self) -> bool:
+        return all(check.ok for check in self.checks.values())
+
+    def age(self) -> float:
+        return time.monotonic() - self.checked_at_monotonic
+
+
+class HealthProber:
+    def __init__(self, interval_seconds: float, timeout_seconds: float, stale_after_seconds: float):
+        self.interval = interval_seconds
+        self.timeout = timeout_seconds
+        self.stale_after = stale_after_seconds
+        self.snapshot: Optional[HealthSnapshot] = None
+        self.probes = 0
+        self._last_rejected = 0
+
+    async def probe_once(self) -> HealthSnapshot:
+        checks = {
+            "database": await self._check_database(),
+            "model": self._check_model(),
+            "inference_queue": self._check_inference_queue(),
+        }
+        # Single reference swap; readers never see a half-built snapshot
+        self.snapshot = HealthSnapshot(time.time(), time.monotonic(), checks)
+        self.probes += 1
+        return self.snapshot
+
+    async def run(self):
+        """Background task: probe every interval (call probe_once() first for an initial snapshot)."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.probe_once()
+            except Exception as e:
+                logger.error(f"Health probe failed: {e}")
+
+    def is_stale(self) -> bool:
+        return self.snapshot is None or self.snapshot.age() > self.stale_after
+
+    def readiness(self) -> dict:
+        snapshot = self.snapshot
+        stale = self.is_stale()
+        return {
+            "ready": snapshot is not None and snapshot.ready and not stale,
+            "stale": stale,
+            "age_s": round(snapshot.age(), 3) if snapshot else None,
+            "checked_at": snapshot.checked_at if snapshot else None,
+            "checks": {
+                name: {"ok": check.ok, "detail": check.detail, "duration_ms": check.duration_ms}
+                for name, check in (snapshot.checks.items() if snapshot else ())
+            },
+        }
+
+    async def _check_database(self) -> CheckResult:
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(_select_one(), self.timeout)
+        except asyncio.TimeoutError:
+            return CheckResult(False, f"timeout after {self.timeout}s", _elapsed_ms(start_time))
+        except Exception as e:
+            logger.error(f"Health check failed: Database unreachable: {e}")
+            return CheckResult(False, "disconnected", _elapsed_ms(start_time))
+        return CheckResult(True, "connected", _elapsed_ms(start_time))
+
+    @staticmethod
+    def _check_model() -> CheckResult:
+        if not ml_service.ready:
+            return CheckResult(False, f"loading ({ml_service.load_stage})")
+        # A stub answer is not a diagnosis; keep the replica out of rotation
+        if not ml_service.active.serving and not settings.HEALTH_ALLOW_STUB_MODEL:
+            return CheckResult(False, ml_service.mode)
+        return CheckResult(True, ml_service.mode)
+
+    def _check_inference_queue(self) -> CheckResult:
+        stats = inference_executor.stats()
+        rejected_since = stats["rejected"] - self._last_rejected
+        self._last_rejected = stats["rejected"]
+        detail = f"{stats['queue_depth']}/{stats['queue_capacity']} queued, {rejected_since} shed since last probe"
+        in_flight = stats["queue_depth"] + stats["running"]
+        return CheckResult(in_flight < stats["workers"] + stats["queue_capacity"], detail)
+
+
+async def _select_one():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def _elapsed_ms(start_time: float) -> float:
+    return round((time.perf_counter() - start_time) * 1000, 3)
+
+
+health_prober = HealthProber(
+    interval_seconds=settings.HEALTH_PROBE_INTERVAL_SECONDS,
+    timeout_seconds=settings.HEALTH_PROBE_TIMEOUT_SECONDS,
+    stale_after_seconds=settings.HEALTH_STALE_AFTER_SECONDS,
+)
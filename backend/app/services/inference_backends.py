@@ -0,0 +1,271 @@
+"""
+Inference Backends
+One interface over the runtimes that can execute the disease model:
+
+- keras:  the original .h5 through tf.keras (heaviest, reference output)
+- tflite: .tflite (float16 or INT8) through tflite_runtime or tf.lite
+- onnx:   .onnx (float32 or INT8) through ONNX Runtime
+
+Every backend takes a float32 NHWC batch scaled to [0, 1] and returns class
+probabilities as a float32 (batch, classes) array (or features, for the
+backbone of a crop-head model version). `forward()` also returns the
+classifier's penultimate-layer features from the same pass: the Keras backend
+adds them as a second output at load, and .tflite/.onnx files exported by
+scripts/export_model.py carry them as their second output (older single-output
+files give None). Runtimes are imported in
+`import_runtime()` (called by `load()`), so only the selected one is ever
+imported, and never at application import time.
+
+`warm_up(max_batch_size)` runs synthetic batches of every bucket size
+(1, 2, 4, ... max) once, so graph tracing / allocation happens before the
+first real request. The Keras backend compiles one tf.function per bucket
+with a fixed input signature and pads odd batch sizes up to the next bucket,
+instead of going through `model.predict` (data adapter + callbacks per call).
+The TFLite backend likewise keeps one interpreter allocated per bucket, so a
+batch size change never resizes and reallocates tensors.
+
+Use scripts/export_model.py to produce the .tflite/.onnx files.
+"""
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBackend:
+    name = "base"
+
+    def __init__(self, model_path: str, num_threads: int = 0):
+        self.model_path = model_path
+        self.num_threads = num_threads or None
+        self.input_size: Optional[Tuple[int, int]] = None  # (width, height), known after load()
+
+    def import_runtime(self):
+        """Import and return the runtime module; split out so startup can time it."""
+        raise NotImplementedError
+
+    def load(self):
+        raise NotImplementedError
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.forward(batch)[0]
+
+    def forward(self, batch: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(outputs, features): the model's output and, if it exposes them, the penultimate-layer features."""
+        raise NotImplementedError
+
+    def warm_up(self, max_batch_size: int) -> Dict[int, float]:
+        """Run one zero batch per bucket size; returns the cold latency (ms) of each."""
+        width, height = self.input_size or (256, 256)
+        timings = {}
+        for size in batch_buckets(max_batch_size):
+            start_time = time.perf_counter()
+            self.predict(np.zeros((size, height, width, 3), dtype=np.float32))
+            timings[size] = round((time.perf_counter() - start_time) * 1000, 2)
+        logger.info(f"{self.name} backend warmed up: {timings}")
+        return timings
+
+    def _set_input_size(self, shape):
+        # NHWC; dynamic dims come through as None / -1 / strings
+        height, width = shape[1], shape[2]
+        if isinstance(height, int) and isinstance(width, int) and height > 0 and width > 0:
+            self.input_size = (width, height)
+
+
+class KerasBackend(InferenceBackend):
+    name = "keras"
+
+    def import_runtime(self):
+        import tensorflow as tf
+        return tf
+
+    def load(self):
+        tf = self.import_runtime()
+        if self.num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(self.num_threads)
+        self.model = tf.keras.models.load_model(self.model_path)
+        self._forward_model = with_features(tf, self.model)
+        self._set_input_size(self.model.input_shape)
+        self._tf = tf
+        self._compiled = {}  # batch size -> concrete function with a fixed signature
+        self._padded = {}    # batch size -> reusable zero-padded input
+
+    def warm_up(self, max_batch_size: int) -> Dict[int, float]:
+        for size in batch_buckets(max_batch_size):
+            self._compile(size)
+        return super().warm_up(max_batch_size)
+
+    def _compile(self, size: int):
+        tf = self._tf
+        width, height = self.input_size or (256, 256)
+        model = self._forward_model
+        forward = tf.function(lambda x: model(x, training=False), autograph=False)
+        self._compiled[size] = forward.get_concrete_function(
+            tf.TensorSpec([size, height, width, 3], tf.float32, name="input")
+        )
+        self._padded[size] = np.zeros((size, height, width, 3), dtype=np.float32)
+
+    def forward(self, batch: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        count = batch.shape[0]
+        size = next((s for s in sorted(self._compiled) if s >= count), None)
+        if size is None:
+            # Not warmed up, or bigger than any bucket: the slow generic path
+            outputs = self._forward_model.predict(batch, verbose=0)
+        else:
+            if size != count:
+                padded = self._padded[size]
+                padded[:count] = batch
+                batch = padded
+            outputs = self._compiled[size](self._tf.constant(batch))
+        if isinstance(outputs, (list, tuple)):
+            return np.asarray(outputs[0])[:count], np.asarray(outputs[1])[:count]
+        return np.asarray(outputs)[:count], None
+
+
+class TFLiteBackend(InferenceBackend):
+    name = "tflite"
+
+    def import_runtime(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        return Interpreter
+
+    def load(self):
+        Interpreter = self.import_runtime()
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._outputs = _tflite_outputs(self.interpreter)
+        self._batch_size = int(self._input["shape"][0])
+        self._set_input_size([int(dim) for dim in self._input["shape"]])
+        self._Interpreter = Interpreter
+        self._buckets = {}  # batch size -> (interpreter, input, outputs, reusable zero-padded input)
+
+    def warm_up(self, max_batch_size: int) -> Dict[int, float]:
+        for size in batch_buckets(max_batch_size):
+            self._allocate(size)
+        return super().warm_up(max_batch_size)
+
+    def _allocate(self, size: int):
+        interpreter = self._Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        model_input = interpreter.get_input_details()[0]
+        interpreter.resize_tensor_input(model_input["index"], [size] + [int(dim) for dim in model_input["shape"][1:]])
+        interpreter.allocate_tensors()
+        width, height = self.input_size or (256, 256)
+        self._buckets[size] = (
+            interpreter, interpreter.get_input_details()[0], _tflite_outputs(interpreter),
+            np.zeros((size, height, width, 3), dtype=np.float32),
+        )
+
+    def forward(self, batch: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        count = batch.shape[0]
+        size = next((s for s in sorted(self._buckets) if s >= count), None)
+        if size is not None:
+            interpreter, model_input, model_outputs, padded = self._buckets[size]
+            if size != count:
+                padded[:count] = batch
+                batch = padded
+        else:
+            # Not warmed up, or bigger than any bucket: resize the load-time interpreter
+            interpreter = self.interpreter
+            if count != self._batch_size:
+                interpreter.resize_tensor_input(self._input["index"], list(batch.shape))
+                interpreter.allocate_tensors()
+                self._input = interpreter.get_input_details()[0]
+                self._outputs = _tflite_outputs(interpreter)
+                self._batch_size = count
+            model_input, model_outputs = self._input, self._outputs
+
+        interpreter.set_tensor(model_input["index"], _quantize(batch, model_input))
+        interpreter.invoke()
+        outputs = [_dequantize(interpreter.get_tensor(details["index"]), details)[:count] for details in model_outputs]
+        return outputs[0], outputs[1] if len(outputs) > 1 else None
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def import_runtime(self):
+        import onnxruntime as ort
+        return ort
+
+    def load(self):
+        ort = self.import_runtime()
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._set_input_size(model_input.shape)
+
+    def forward(self, batch: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        outputs = self.session.run(None, {self._input_name: batch})
+        return outputs[0], outputs[1] if len(outputs) > 1 else None
+
+
+def with_features(tf, model):
+    """
+    `model` with its final Dense layer's input (the penultimate-layer
+    features) as a second output, or `model` itself when it does not end in
+    a Dense classifier (e.g. a crop-head backbone).
+    """
+    dense = next((layer for layer in reversed(model.layers) if isinstance(layer, tf.keras.layers.Dense)), None)
+    if dense is None or dense.units != model.output_shape[-1]:
+        return model
+    return tf.keras.Model(model.inputs, [model.output, dense.input])
+
+
+def _tflite_outputs(interpreter) -> List[dict]:
+    # Converted Keras outputs are named <call>:0, <call>:1 in model order
+    return sorted(interpreter.get_output_details(), key=lambda details: details["name"])
+
+
+def batch_buckets(max_batch_size: int) -> List[int]:
+    """Powers of two up to max_batch_size, plus max_batch_size itself (8 -> [1, 2, 4, 8])."""
+    sizes = [1]
+    while sizes[-1] * 2 < max_batch_size:
+        sizes.append(sizes[-1] * 2)
+    if max_batch_size > 1:
+        sizes.append(max_batch_size)
+    return sizes
+
+
+def _quantize(batch: np.ndarray, details: dict) -> np.ndarray:
+    """Map float input onto an INT8/UINT8 input tensor; float inputs pass through."""
+    dtype = details["dtype"]
+    if dtype == np.float32:
+        return batch
+    scale, zero_point = details["quantization"]
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(output: np.ndarray, details: dict) -> np.ndarray:
+    if output.dtype == np.float32:
+        return output
+    scale, zero_point = details["quantization"]
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+BACKENDS: Dict[str, Type[InferenceBackend]] = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_backend(name: str, model_path: str, num_threads: int = 0) -> InferenceBackend:
+    try:
+        backend_cls = BACKENDS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    return backend_cls(os.path.abspath(model_path), num_threads=num_threads)
@@ -1,113 +1,530 @@
 """
 ML Service — Disease Detection (Phase 3)
-Handles TensorFlow model loading for the 38-class PlantVillage model.
-Preprocessing: 256x256 RGB, normalization [0, 1].
+Handles model loading for the 38-class PlantVillage model through the
+configured inference backend (Keras, TFLite or ONNX Runtime).
+Preprocessing: 256x256 RGB, normalization [0, 1] (see app.services.preprocessing).
+Concurrent predictions are grouped into one forward pass by a MicroBatcher.
+
+Nothing heavy happens at import: the model (and its runtime, e.g. TensorFlow)
+is loaded by `start_loading()` on a background thread once the API is up.
+Until then `ready` is False and detection answers 503.
+
+Models come from the registry (app.services.model_registry). Each loaded
+version is a LoadedModel with its own batcher and input buffer. A new
+version is loaded and warmed up in the background, then swapped in with one
+reference assignment; requests already holding the old one finish on it
+before it is closed. An optional canary takes a fixed share of users.
+
+A request may carry a crop hint. Backbone + head versions then run only that
+crop's head on the shared features; single-classifier versions restrict
+their scores to the crop (see app.services.crop_heads).
 """
+import asyncio
 import logging
 import os
+import threading
 import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 import numpy as np
-from PIL import Image
 
-logger = logging.getLogger(__name__)
+from app.core import metrics
+from app.services import preprocessing
+from app.services.batching import MicroBatcher
+from app.services.crop_heads import ALL_CROPS, CropHead, crop_classes, crop_key, load_heads, restrict
+from app.services.inference_backends import InferenceBackend, create_backend
+from app.services.model_registry import (
+    Deployment, ModelManifest, ModelRegistry, PLANTVILLAGE_CLASSES, RegistryError,
+)
 
-try:
-    import tensorflow as tf
-except ImportError:
-    tf = None
+logger = logging.getLogger(__name__)
+# One line per image/batch; sampled by default (settings.LOG_SAMPLING)
+inference_logger = logging.getLogger(f"{__name__}.inference")
 
 try:
     from app.config import settings
-    MODEL_PATH = settings.DISEASE_MODEL_PATH
+    BACKEND = settings.INFERENCE_BACKEND
+    MODEL_PATHS = {
+        "keras": settings.DISEASE_MODEL_PATH,
+        "tflite": settings.TFLITE_MODEL_PATH,
+        "onnx": settings.ONNX_MODEL_PATH,
+    }
+    REGISTRY_DIR = settings.MODEL_REGISTRY_DIR
+    RETIRE_GRACE_SECONDS = settings.MODEL_RETIRE_GRACE_SECONDS
+    INFERENCE_THREADS = settings.INFERENCE_THREADS
+    BATCH_SIZE = settings.INFERENCE_BATCH_SIZE
+    BATCH_MAX_DELAY_MS = settings.INFERENCE_BATCH_MAX_DELAY_MS
 except Exception:
-    MODEL_PATH = os.path.join(os.path.dirname(__file__), '../../ai-models/trained_models/disease_model.h5')
+    BACKEND = "keras"
+    MODEL_PATHS = {"keras": os.path.join(os.path.dirname(__file__), '../../ai-models/trained_models/disease_model.h5')}
+    REGISTRY_DIR = os.path.join(os.path.dirname(__file__), '../../ai-models/registry')
+    RETIRE_GRACE_SECONDS = 30.0
+    INFERENCE_THREADS = 0
+    BATCH_SIZE = 8
+    BATCH_MAX_DELAY_MS = 5.0
+
+INPUT_SIZE = (256, 256)
+
+
+def canonical_name(label: str) -> str:
+    """PlantVillage label → disease name stored in the DB ("Apple___Black_rot" → "Black rot")."""
+    return label.split("___")[-1].replace("_", " ")
+
+
+class Prediction(NamedTuple):
+    class_index: int
+    disease_name: str
+    confidence: float
+    model_version: str = "stub"
+    # float16 penultimate-layer features, when the model's backend exposes them
+    embedding: Optional[np.ndarray] = None
+    # Placeholder answer of a service without a model; not a real scan result
+    fallback: bool = False
+
+
+STUB_PREDICTION = Prediction(0, "Apple scab", 0.98, fallback=True)
+
+# (stage, progress) reported while the model loads
+LOAD_STAGES = {
+    "idle": 0.0,
+    "resolving model": 0.05,
+    "importing runtime": 0.1,
+    "loading weights": 0.5,
+    "warming up": 0.8,
+    "ready": 1.0,
+}
+
+
+class LoadedModel:
+    """
+    One model version ready to serve: backend, class list, batcher and input buffer.
+    With `heads` the backend is a feature backbone and each crop has its own head.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        backend: Optional[InferenceBackend],
+        classes: Sequence[str] = PLANTVILLAGE_CLASSES,
+        mode: str = "REAL",
+        manifest: Optional[ModelManifest] = None,
+        heads: Optional[Dict[str, CropHead]] = None,
+    ):
+        self.version = version
+        self.backend = backend
+        self.classes = list(classes)
+        self.mode = mode
+        self.manifest = manifest
+        self.heads = heads
+        if heads:
+            self.crop_class_ids = {name: head.class_ids for name, head in heads.items() if name != ALL_CROPS}
+        else:
+            self.crop_class_ids = crop_classes(self.classes)
+        self.input_size = getattr(backend, "input_size", None) or INPUT_SIZE
+        self.loaded_at = time.time()
+        self.in_flight = 0
+        self.retired = False
+        self._lock = threading.Lock()
+        self.batcher = MicroBatcher(
+            self.predict_batch,
+            max_batch_size=BATCH_SIZE,
+            max_delay_ms=BATCH_MAX_DELAY_MS,
+            name=f"inference-batcher[{version}]",
+        )
+        # float32 input buffer, only touched by the batcher thread
+        self._batch_buffer = preprocessing.allocate_batch(self.batcher.max_batch_size, self.input_size)
+
+    @property
+    def serving(self) -> bool:
+        """False for the stub fallbacks, which answer without running a model."""
+        return self.backend is not None and self.mode == "REAL"
+
+    @property
+    def backend_name(self) -> str:
+        return getattr(self.backend, "name", BACKEND) if self.backend is not None else BACKEND
+
+    @property
+    def crops(self) -> List[str]:
+        return sorted(self.crop_class_ids)
+
+    def resolve_crop(self, hint: Optional[str]) -> Optional[str]:
+        """Normalised crop key, or None when absent or unknown to this version (scores every class)."""
+        if not hint:
+            return None
+        key = crop_key(hint)
+        return key if key in self.crop_class_ids else None
+
+    def predict_batch(self, items: List[Tuple[np.ndarray, Optional[str]]]) -> List[Prediction]:
+        """Run one forward pass over (decoded HxWx3 uint8 array, crop) pairs at model input size."""
+        start_time = time.time()
+        batch = preprocessing.normalize_into([image for image, _ in items], self._batch_buffer)
+        # Probabilities and features come out of the same forward pass
+        outputs, features = self.backend.forward(batch)
+
+        if self.heads:
+            results = self._run_heads(outputs, [crop for _, crop in items])
+        else:
+            results = []
+            for i, (row, (_, crop)) in enumerate(zip(outputs, items)):
+                class_ids = self.crop_class_ids.get(crop) if crop else None
+                embedding = features[i].astype(np.float16) if features is not None else None
+                results.append(self._prediction(restrict(row, class_ids), class_ids, embedding))
+
+        dura = (time.time() - start_time) * 1000
+        inference_logger.info("Inference batch of %d in %.2fms", len(items), dura)
+        return results
+
+    def _run_heads(self, features: np.ndarray, crops: List[Optional[str]]) -> List[Prediction]:
+        # Backbone features were computed once for the batch; each head only sees its own rows
+        rows_by_head: Dict[str, List[int]] = {}
+        for row, crop in enumerate(crops):
+            rows_by_head.setdefault(crop if crop in self.heads else ALL_CROPS, []).append(row)
+        results: List[Optional[Prediction]] = [None] * len(crops)
+        for name, rows in rows_by_head.items():
+            head = self.heads[name]
+            for row, scores in zip(rows, head.scores(features[rows])):
+                results[row] = self._prediction(scores, head.class_ids, features[row].astype(np.float16))
+        return results
+
+    def _prediction(self, scores: np.ndarray, class_ids: Optional[np.ndarray],
+                    embedding: Optional[np.ndarray] = None) -> Prediction:
+        """`scores` are probabilities over `class_ids` (or every class when None)."""
+        best = int(np.argmax(scores))
+        idx = int(class_ids[best]) if class_ids is not None else best
+        raw_label = self.classes[idx] if idx < len(self.classes) else "Unknown"
+        clean_name = canonical_name(raw_label)
+        return Prediction(idx, clean_name, float(scores[best]), self.version, embedding)
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def retire(self, grace_seconds: float, drain_timeout: float = 60.0):
+        """Close once requests that checked out this version before the swap are done."""
+        time.sleep(grace_seconds)
+        deadline = time.monotonic() + drain_timeout
+        while self.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.retired = True
+        self.batcher.close()
+        self.backend = None  # let the runtime free the weights
+        logger.info(f"Model {self.version} retired")
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "mode": self.mode,
+            "backend": self.backend_name,
+            "classes": len(self.classes),
+            "input_size": list(self.input_size),
+            "heads": sorted(self.heads) if self.heads else None,
+            "crops": self.crops,
+            "loaded_at": self.loaded_at,
+            "in_flight": self.in_flight,
+            "metadata": dict(self.manifest.metadata) if self.manifest else {},
+        }
 
 
 class MLService:
-    def __init__(self):
-        self.model = None
-        self.mode = "STUB"
-        # Standard PlantVillage 38 Classes (Alphabetical Order)
-        self.classes = [
-            "Apple___Apple_scab",
-            "Apple___Black_rot",
-            "Apple___Cedar_apple_rust",
-            "Apple___healthy",
-            "Blueberry___healthy",
-            "Cherry___Powdery_mildew",
-            "Cherry___healthy",
-            "Corn___Cercospora_leaf_spot Gray_leaf_spot",
-            "Corn___Common_rust",
-            "Corn___Northern_Leaf_Blight",
-            "Corn___healthy",
-            "Grape___Black_rot",
-            "Grape___Esca_(Black_Measles)",
-            "Grape___Leaf_blight_(Isariopsis_Leaf_Spot)",
-            "Grape___healthy",
-            "Orange___Haunglongbing_(Citrus_greening)",
-            "Peach___Bacterial_spot",
-            "Peach___healthy",
-            "Pepper,_bell___Bacterial_spot",
-            "Pepper,_bell___healthy",
-            "Potato___Early_blight",
-            "Potato___Late_blight",
-            "Potato___healthy",
-            "Raspberry___healthy",
-            "Soybean___healthy",
-            "Squash___Powdery_mildew",
-            "Strawberry___Leaf_scorch",
-            "Strawberry___healthy",
-            "Tomato___Bacterial_spot",
-            "Tomato___Early_blight",
-            "Tomato___Late_blight",
-            "Tomato___Leaf_Mold",
-            "Tomato___Septoria_leaf_spot",
-            "Tomato___Spider_mites Two-spotted_spider_mite",
-            "Tomato___Target_Spot",
-            "Tomato___Tomato_Yellow_Leaf_Curl_Virus",
-            "Tomato___Tomato_mosaic_virus",
-            "Tomato___healthy"
-        ]
-        self._initialize_model()
+    def __init__(self, registry: ModelRegistry = None):
+        self.registry = registry or ModelRegistry(REGISTRY_DIR, BACKEND, MODEL_PATHS)
+        self.active = LoadedModel("stub", None, mode="LOADING")
+        self.canary: Optional[LoadedModel] = None
+        self.canary_percent = 0.0
+        self.load_stage = "idle"
+        self.startup_timings = {}
+        self.reloads = 0
+        self.reload_failures = 0
+        self._load_started_at = None
+        self._loader = None
+        self._loader_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._model_listeners = []
+
+    # The active model, for callers that do not care about canaries
+    @property
+    def model(self) -> Optional[InferenceBackend]:
+        return self.active.backend
+
+    @property
+    def mode(self) -> str:
+        return self.active.mode
+
+    @property
+    def model_version(self) -> str:
+        return self.active.version
+
+    @property
+    def classes(self) -> List[str]:
+        return self.active.classes
+
+    @property
+    def input_size(self) -> Tuple[int, int]:
+        return self.active.input_size
+
+    @property
+    def batcher(self) -> MicroBatcher:
+        return self.active.batcher
+
+    @property
+    def backend_name(self) -> str:
+        return self.active.backend_name
+
+    @property
+    def ready(self) -> bool:
+        """True once loading finished (with the real model or the stub fallback)."""
+        return self._ready.is_set()
+
+    def start_loading(self):
+        """Load the model on a background thread; safe to call more than once."""
+        with self._loader_lock:
+            if self._loader is not None:
+                return
+            self._load_started_at = time.perf_counter()
+            self._loader = threading.Thread(target=self._initialize_model, name="model-loader", daemon=True)
+            self._loader.start()
+
+    def load(self, timeout: float = None) -> bool:
+        """Blocking load for scripts and tools. Returns `ready`."""
+        self.start_loading()
+        return self._ready.wait(timeout)
+
+    def readiness(self) -> dict:
+        started = self._load_started_at
+        return {
+            "ready": self.ready,
+            "stage": self.load_stage,
+            "progress": LOAD_STAGES.get(self.load_stage, 0.0),
+            "loading_for_s": round(time.perf_counter() - started, 3) if started and not self.ready else None,
+            "timings_ms": dict(self.startup_timings),
+        }
+
+    def _set_stage(self, stage: str):
+        self.load_stage = stage
+        logger.info(f"Model loader: {stage}")
+
+    def _timed(self, name: str, fn):
+        start_time = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.startup_timings[name] = round((time.perf_counter() - start_time) * 1000, 2)
 
     def _initialize_model(self):
-        model_path = os.path.abspath(MODEL_PATH)
-        if tf and os.path.exists(model_path):
+        self._set_stage("resolving model")
+        active, canary, percent = self.active, None, 0.0
+        try:
+            deployment = self.registry.deployment()
+            active = self._load_version(deployment.active, self._set_stage, self._timed)
+        except FileNotFoundError:
+            active = LoadedModel("stub", None, mode="STUB (Not Found)")
+        except Exception as e:
+            logger.error(f"Failed to load model: {e}")
+            active = LoadedModel("stub", None, mode="STUB (Load Error)")
+        else:
+            if deployment.canary is not None:
+                try:
+                    canary, percent = self._load_version(deployment.canary), deployment.canary_percent
+                except Exception as e:
+                    logger.error(f"Failed to load canary {deployment.canary.version}, serving active only: {e}")
+        self._swap(active, canary, percent)
+
+        self.startup_timings["total"] = round((time.perf_counter() - self._load_started_at) * 1000, 2)
+        self._set_stage("ready")
+        logger.info(f"Model ready ({self.mode}) after {self.startup_timings['total']:.2f}ms")
+        self._ready.set()
+        self._notify_model_change()
+
+    def _load_version(self, manifest: ModelManifest, set_stage=None, timed=None) -> LoadedModel:
+        """Load and warm up one version; nothing is swapped here."""
+        set_stage = set_stage or (lambda stage: None)
+        timed = timed or (lambda name, fn: fn())
+        backend = create_backend(manifest.backend, manifest.path, num_threads=INFERENCE_THREADS)
+        set_stage("importing runtime")
+        timed("import_runtime", backend.import_runtime)
+        set_stage("loading weights")
+        timed("load_weights", backend.load)
+        # Trace/allocate every batch size now, not on the first farmer's request
+        set_stage("warming up")
+        timed("warm_up", lambda: backend.warm_up(BATCH_SIZE))
+        heads = load_heads(manifest.heads_path, len(manifest.classes)) if manifest.heads_path else None
+        logger.info(f"REAL model loaded ({backend.name}): {manifest.version} from {manifest.path}"
+                    + (f" with {len(heads)} crop heads" if heads else ""))
+        return LoadedModel(manifest.version, backend, manifest.classes, manifest=manifest, heads=heads)
+
+    def activate(self, backend: InferenceBackend, version: str, classes: Sequence[str] = PLANTVILLAGE_CLASSES):
+        """Serve an already loaded backend, e.g. a benchmark stand-in; replaces any canary."""
+        self._swap(LoadedModel(version, backend, classes), None, 0.0)
+        self._ready.set()
+        self._notify_model_change()
+
+    def _swap(self, active: LoadedModel, canary: Optional[LoadedModel], canary_percent: float):
+        with self._swap_lock:
+            previous = {id(model): model for model in (self.active, self.canary) if model is not None}
+            # Readers pick self.active / self.canary up by reference: old or new, never half
+            self.active, self.canary, self.canary_percent = active, canary, canary_percent
+            for model in (active, canary):
+                if model is not None:
+                    previous.pop(id(model), None)
+        for model in previous.values():
+            threading.Thread(
+                target=model.retire, args=(RETIRE_GRACE_SECONDS,), name=f"retire[{model.version}]", daemon=True
+            ).start()
+
+    def sync_registry(self) -> bool:
+        """
+        Bring the served versions in line with the registry; blocking, call off the loop.
+        Unchanged versions are kept as they are. Returns True if anything was swapped.
+        """
+        try:
+            deployment: Deployment = self.registry.deployment()
+        except FileNotFoundError:
+            return False  # keep serving whatever is loaded
+        except RegistryError as e:
+            self.reload_failures += 1
+            logger.error(f"Model registry unreadable, still serving {self.model_version}: {e}")
+            return False
+        current = {model.version: model for model in (self.active, self.canary) if model is not None and model.serving}
+        wanted = [deployment.active, deployment.canary]
+        if (
+            [m.version if m else None for m in wanted]
+            == [self.active.version, self.canary.version if self.canary else None]
+            and deployment.canary_percent == self.canary_percent
+        ):
+            return False
+        try:
+            loaded = [
+                None if manifest is None else current.get(manifest.version) or self._load_version(manifest)
+                for manifest in wanted
+            ]
+        except Exception as e:
+            self.reload_failures += 1
+            logger.error(f"Model reload failed, still serving {self.model_version}: {e}")
+            return False
+        self._swap(loaded[0], loaded[1], deployment.canary_percent)
+        self.reloads += 1
+        logger.info(
+            f"Serving model {self.model_version}"
+            + (f" with canary {self.canary.version} at {self.canary_percent:g}%" if self.canary else "")
+        )
+        self._notify_model_change()
+        return True
+
+    async def watch_registry(self, interval_seconds: float):
+        """Background task: pick up new versions / canary changes from the registry."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if not self.ready:
+                continue
             try:
-                start_time = time.time()
-                self.model = tf.keras.models.load_model(model_path)
-                logger.info(f"REAL model loaded: {model_path} in {(time.time() - start_time)*1000:.2f}ms")
-                self.mode = "REAL"
+                await asyncio.to_thread(self.sync_registry)
             except Exception as e:
-                logger.error(f"Failed to load model: {e}")
-                self.mode = "STUB (Load Error)"
-        else:
-            self.mode = "STUB (Not Found)"
+                logger.error(f"Model registry check failed: {e}")
 
-    def predict(self, image: Image.Image):
-        start_time = time.time()
-        # Preprocessing: Match 256x256 required by the sourced model
-        img = image.convert("RGB").resize((256, 256))
-        
-        if self.model and self.mode == "REAL":
+    def select(self, routing_key=None) -> LoadedModel:
+        """
+        The model for one request. With a canary, `routing_key` (the user id)
+        decides, so the same farmer keeps seeing the same version.
+        """
+        canary = self.canary
+        if canary is not None and routing_key is not None:
+            if zlib.crc32(str(routing_key).encode()) % 10000 < self.canary_percent * 100:
+                return canary
+        return self.active
+
+    @contextmanager
+    def checkout(self, routing_key=None) -> Iterator[LoadedModel]:
+        """
+        select() and hold the model until the block exits, so a hot swap
+        does not retire it under a request that is still uploading or
+        queued. Call it once the upload has been read.
+        """
+        model = self.select(routing_key)
+        model.acquire()
+        try:
+            yield model
+        finally:
+            model.release()
+
+    def on_model_change(self, callback):
+        """Register a callback run after the model is (re)loaded, e.g. cache invalidation."""
+        self._model_listeners.append(callback)
+
+    def _notify_model_change(self):
+        for callback in self._model_listeners:
             try:
-                img_array = np.array(img).astype('float32') / 255.0
-                img_array = np.expand_dims(img_array, axis=0)
-                
-                predictions = self.model.predict(img_array, verbose=0)
-                idx = np.argmax(predictions[0])
-                confidence = float(predictions[0][idx])
-                raw_label = self.classes[idx] if idx < len(self.classes) else "Unknown"
-                
-                clean_name = raw_label.split("___")[-1].replace("_", " ")
-                dura = (time.time() - start_time) * 1000
-                logger.info(f"Inference: {clean_name} ({confidence:.2%}) in {dura:.2f}ms")
-                return clean_name, confidence
+                callback()
             except Exception as e:
-                logger.error(f"Inference Error: {e}")
+                logger.error(f"Model change listener failed: {e}")
+
+    def classify(self, image: preprocessing.ImageSource, model: LoadedModel = None, crop: str = None) -> Prediction:
+        """
+        Classify one image (PIL Image or encoded bytes) with `model` (default: active).
+        `crop` is a key from model.resolve_crop(). Pass a lazily opened image so
+        JPEG draft decoding can kick in.
+        """
+        model = model or self.active
+        if model.retired:
+            # Held past the drain timeout; answer with the current version rather than the stub
+            model = self.select()
+        start_time = time.time()
+        model.acquire()
+        try:
+            # Preprocessing: Match the input size of the loaded model (256x256 for the sourced one)
+            timings = {}
+            img_array = preprocessing.decode(image, model.input_size, timings)
+            metrics.observe_stages(timings)
+
+            if model.serving:
+                # Blocks until the batcher has run the batch this image landed in,
+                # which also keeps this thread's decode buffer alive until then.
+                # Inference errors propagate: a loaded model must never answer
+                # with the stub (it would be cached and recorded as a real scan).
+                with metrics.stage_timer("inference"):
+                    prediction = model.batcher.submit((img_array, crop)).result()
+
+                dura = (time.time() - start_time) * 1000
+                inference_logger.info("Inference: %s (%.2f%%) in %.2fms",
+                                      prediction.disease_name, prediction.confidence * 100, dura)
+                return prediction
+        finally:
+            model.release()
+
+        # Fallback (no model loaded)
+        inference_logger.info("Using Stub Fallback")
+        return STUB_PREDICTION
+
+    def predict(self, image: preprocessing.ImageSource) -> Tuple[str, float]:
+        prediction = self.classify(image)
+        return prediction.disease_name, prediction.confidence
+
+    def stats(self) -> dict:
+        canary = self.canary
+        return {
+            "mode": self.mode,
+            "backend": self.backend_name,
+            "model_version": self.model_version,
+            "loading": self.readiness(),
+            "active": self.active.info(),
+            "canary": dict(canary.info(), percent=self.canary_percent) if canary else None,
+            "registry": {
+                "root": self.registry.root,
+                "versions": self.registry.versions(),
+                "reloads": self.reloads,
+                "reload_failures": self.reload_failures,
+            },
+            "batching": self.batcher.stats(),
+        }
 
-        # Fallback
-        logger.info("Using Stub Fallback")
-        return "Apple scab", 0.98
+    def close(self):
+        for model in (self.active, self.canary):
+            if model is not None:
+                model.batcher.close()
 
 ml_service = MLService()
@@ -0,0 +1,163 @@
+"""
+Model Registry
+Versioned disease models on disk, so a retrained model ships by dropping a
+directory and flipping a pointer, not by redeploying:
+
+    MODEL_REGISTRY_DIR/
+      registry.json           {"active": "2024-06-v2",
+                               "canary": {"version": "2024-07-v3", "percent": 10}}
+      2024-06-v2/manifest.json
+      2024-06-v2/disease_model.onnx
+      ...
+
+manifest.json: {"backend": "onnx", "file": "disease_model.onnx",
+"classes": [...], ...}. `classes` defaults to the PlantVillage list. With
+"heads": "heads.npz" the file is a feature backbone and the classes come
+from per-crop heads (see app.services.crop_heads). Any other keys are kept
+as metadata and shown in /stats.
+
+Every worker polls the registry (MODEL_REGISTRY_POLL_SECONDS) and swaps
+models in place (see MLService.sync_registry). Without registry.json the
+single model from INFERENCE_BACKEND / *_MODEL_PATH is served as before,
+versioned by file name, mtime and size, so replacing that file also hot-reloads.
+"""
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Standard PlantVillage 38 Classes (Alphabetical Order)
+PLANTVILLAGE_CLASSES = (
+    "Apple___Apple_scab",
+    "Apple___Black_rot",
+    "Apple___Cedar_apple_rust",
+    "Apple___healthy",
+    "Blueberry___healthy",
+    "Cherry___Powdery_mildew",
+    "Cherry___healthy",
+    "Corn___Cercospora_leaf_spot Gray_leaf_spot",
+    "Corn___Common_rust",
+    "Corn___Northern_Leaf_Blight",
+    "Corn___healthy",
+    "Grape___Black_rot",
+    "Grape___Esca_(Black_Measles)",
+    "Grape___Leaf_blight_(Isariopsis_Leaf_Spot)",
+    "Grape___healthy",
+    "Orange___Haunglongbing_(Citrus_greening)",
+    "Peach___Bacterial_spot",
+    "Peach___healthy",
+    "Pepper,_bell___Bacterial_spot",
+    "Pepper,_bell___healthy",
+    "Potato___Early_blight",
+    "Potato___Late_blight",
+    "Potato___healthy",
+    "Raspberry___healthy",
+    "Soybean___healthy",
+    "Squash___Powdery_mildew",
+    "Strawberry___Leaf_scorch",
+    "Strawberry___healthy",
+    "Tomato___Bacterial_spot",
+    "Tomato___Early_blight",
+    "Tomato___Late_blight",
+    "Tomato___Leaf_Mold",
+    "Tomato___Septoria_leaf_spot",
+    "Tomato___Spider_mites Two-spotted_spider_mite",
+    "Tomato___Target_Spot",
+    "Tomato___Tomato_Yellow_Leaf_Curl_Virus",
+    "Tomato___Tomato_mosaic_virus",
+    "Tomato___healthy",
+)
+
+
+class RegistryError(Exception):
+    """registry.json or a manifest is missing or malformed."""
+
+
+@dataclass(frozen=True)
+class ModelManifest:
+    version: str
+    backend: str
+    path: str  # absolute path of the model file
+    classes: Tuple[str, ...] = PLANTVILLAGE_CLASSES
+    metadata: Dict = field(default_factory=dict, compare=False)
+    heads_path: Optional[str] = None  # backbone + crop heads instead of one classifier
+
+
+@dataclass(frozen=True)
+class Deployment:
+    """What should be serving: the active model and an optional canary."""
+    active: ModelManifest
+    canary: Optional[ModelManifest] = None
+    canary_percent: float = 0.0
+
+
+class ModelRegistry:
+    def __init__(self, root: str, default_backend: str, default_paths: Dict[str, str]):
+        self.root = os.path.abspath(root)
+        self.default_backend = default_backend.lower()
+        self.default_paths = default_paths
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, "registry.json")
+
+    def deployment(self) -> Deployment:
+        """Read the current pointers. Raises RegistryError if they cannot be resolved."""
+        if not os.path.exists(self.index_path):
+            return Deployment(self.legacy_manifest())
+        index = _read_json(self.index_path)
+        if "active" not in index:
+            raise RegistryError(f"{self.index_path} has no 'active' version")
+        active = self.manifest(index["active"])
+        canary = index.get("canary") or {}
+        percent = float(canary.get("percent", 0))
+        if not canary.get("version") or percent <= 0 or canary["version"] == active.version:
+            return Deployment(active)
+        return Deployment(active, self.manifest(canary["version"]), min(percent, 100.0))
+
+    def manifest(self, version: str) -> ModelManifest:
+        directory = os.path.join(self.root, version)
+        data = _read_json(os.path.join(directory, "manifest.json"))
+        try:
+            backend, filename = data.pop("backend"), data.pop("file")
+        except KeyError as e:
+            raise RegistryError(f"Manifest for {version} is missing {e}")
+        classes = tuple(data.pop("classes", PLANTVILLAGE_CLASSES))
+        path = os.path.join(directory, filename)
+        heads = data.pop("heads", None)
+        heads_path = os.path.join(directory, heads) if heads else None
+        for required in (path, heads_path):
+            if required and not os.path.exists(required):
+                raise RegistryError(f"Model file for {version} not found: {required}")
+        return ModelManifest(version, backend.lower(), path, classes, data, heads_path)
+
+    def legacy_manifest(self) -> ModelManifest:
+        """The single configured model file; RegistryError if it does not exist."""
+        model_path = self.default_paths.get(self.default_backend)
+        if model_path is None:
+            raise RegistryError(f"Unknown inference backend '{self.default_backend}'")
+        model_path = os.path.abspath(model_path)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(model_path)
+        file_stat = os.stat(model_path)
+        version = f"{os.path.basename(model_path)}@{int(file_stat.st_mtime)}-{file_stat.st_size}"
+        return ModelManifest(version, self.default_backend, model_path)
+
+    def versions(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, "manifest.json"))
+        )
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise RegistryError(f"Cannot read {path}: {e}")
@@ -0,0 +1,162 @@
+"""
+Prediction Cache
+Content-addressed cache for model predictions, so a farmer re-submitting the
+same photo over a flaky connection does not pay for decode + inference again.
+
+Keys are `sha256(upload bytes):model_version[:crop]` (the digest is also stored with
+the scan history). Entries are evicted LRU once
+either the entry or byte budget is exceeded, and expire after a TTL.
+Concurrent misses for the same key share one in-flight computation.
+
+All methods must be called from the event loop thread.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from app.config import settings
+
+_MISSING = object()
+
+
+def content_hash(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+
+def cache_key(digest: str, model_version: str, crop: Optional[str] = None) -> str:
+    return f"{digest}:{model_version}:{crop}" if crop else f"{digest}:{model_version}"
+
+
+def _approx_size(value: Any) -> int:
+    arrays = []
+
+    def default(obj):
+        if isinstance(obj, np.ndarray):  # e.g. a prediction's embedding
+            arrays.append(obj.nbytes)
+            return None
+        return str(obj)
+
+    return len(json.dumps(value, ensure_ascii=False, default=default)) + sum(arrays)
+
+
+class PredictionCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, max_bytes: int):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        # key -> (expires_at, size, value)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any, size: Optional[int] = None):
+        if not self.enabled:
+            return
+        size = _approx_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Return the cached value for `key`, or run `compute` once for all
+        concurrent callers asking for the same key and cache its result
+        (unless `cacheable(result)` is false). Errors are shared with the
+        waiters but not cached.
+        """
+        value = self.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        # Run as its own task so one client disconnecting does not cancel the
+        # work other callers are waiting on.
+        task = asyncio.ensure_future(self._compute(key, compute, cacheable))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # mark retrieved
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    def clear(self):
+        """Drop everything, e.g. after the model changes."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                       cacheable: Optional[Callable[[Any], bool]]) -> Any:
+        try:
+            value = await compute()
+            if cacheable is None or cacheable(value):
+                self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+prediction_cache = PredictionCache(
+    max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PREDICTION_CACHE_TTL_SECONDS,
+    max_bytes=settings.PREDICTION_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,132 @@
+"""
+Image Preprocessing
+Turns uploaded photos into model input with as little work as possible:
+
+1. JPEG draft mode lets libjpeg do DCT scaling (1/2, 1/4, 1/8) while decoding,
+   so a 12MP phone photo is decoded at roughly 500x380 instead of 4032x3024.
+2. One resize straight to the model resolution.
+3. Pixels land in preallocated buffers: a uint8 HxWx3 buffer per worker
+   thread, then a float32 batch buffer owned by whoever runs the forward pass.
+   Normalisation writes into that buffer directly, so no float64 or
+   intermediate arrays are created.
+
+Clients can also send pixels already at the model resolution (RawPixels):
+they are read straight into the worker buffer with no decode or resize.
+
+This module only depends on NumPy and Pillow so it can be imported by tools
+and benchmarks without application settings.
+"""
+import io
+import threading
+import time
+from typing import BinaryIO, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+
+class RawPixels:
+    """Row-major uint8 RGB at exactly the model resolution (HxWx3, no header)."""
+
+    __slots__ = ("source",)
+
+    def __init__(self, source: Union[bytes, bytearray, memoryview, BinaryIO]):
+        self.source = source
+
+
+# File objects (e.g. a spooled upload) are read in place, not copied
+ImageSource = Union[bytes, bytearray, memoryview, BinaryIO, Image.Image, RawPixels]
+
+_SCALE = np.float32(1.0 / 255.0)
+_local = threading.local()
+
+
+def open_image(source: ImageSource) -> Image.Image:
+    """Open lazily; pixel data is not decoded until `decode_into`."""
+    if isinstance(source, Image.Image):
+        return source
+    if hasattr(source, "read"):
+        return Image.open(source)
+    return Image.open(io.BytesIO(source))
+
+
+def decode_into(source: ImageSource, out: np.ndarray, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """
+    Decode `source` as RGB at out's (height, width) and copy it into `out`.
+    `out` must be a uint8 array of shape (height, width, 3).
+    If `timings` is given, "decode" and "resize" durations (seconds) are stored in it.
+    """
+    if isinstance(source, RawPixels):
+        return _read_raw_into(source.source, out, timings)
+    start_time = time.perf_counter()
+    height, width = out.shape[:2]
+    image = open_image(source)
+
+    # Only effective before the image is loaded; a no-op for PNG/WebP.
+    if image.format == "JPEG":
+        image.draft("RGB", (width, height))
+    image.load()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    decoded_at = time.perf_counter()
+
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.BICUBIC)
+    np.copyto(out, np.asarray(image))
+
+    if timings is not None:
+        timings["decode"] = decoded_at - start_time
+        timings["resize"] = time.perf_counter() - decoded_at
+    return out
+
+
+def _read_raw_into(source, out: np.ndarray, timings: Optional[Dict[str, float]]) -> np.ndarray:
+    start_time = time.perf_counter()
+    flat = out.reshape(-1)  # view; `out` is contiguous
+    if hasattr(source, "readinto"):
+        n = source.readinto(flat)
+    else:
+        n = len(source)
+        if n == flat.size:
+            flat[:] = np.frombuffer(source, dtype=np.uint8)
+    if n != flat.size:
+        height, width = out.shape[:2]
+        raise ValueError(f"Expected {height}x{width}x3 uint8 ({flat.size} bytes), got {n} bytes")
+    if timings is not None:
+        timings["decode"] = time.perf_counter() - start_time
+    return out
+
+
+def worker_buffer(size: Tuple[int, int]) -> np.ndarray:
+    """
+    uint8 (height, width, 3) buffer owned by the calling thread.
+    Contents are overwritten by the next decode on the same thread, so the
+    caller must be done with it (e.g. inference has finished) before reusing.
+    """
+    width, height = size
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None or buffer.shape[:2] != (height, width):
+        buffer = np.empty((height, width, 3), dtype=np.uint8)
+        _local.buffer = buffer
+    return buffer
+
+
+def decode(source: ImageSource, size: Tuple[int, int], timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Decode into this thread's reusable uint8 buffer (see `worker_buffer`)."""
+    return decode_into(source, worker_buffer(size), timings)
+
+
+def normalize_into(images: Sequence[np.ndarray], out: np.ndarray) -> np.ndarray:
+    """
+    Scale uint8 images to float32 [0, 1] in the first len(images) rows of `out`.
+    Returns the filled slice, ready to feed to the model.
+    """
+    batch = out[:len(images)]
+    for row, image in zip(batch, images):
+        np.multiply(image, _SCALE, out=row, dtype=np.float32)
+    return batch
+
+
+def allocate_batch(batch_size: int, size: Tuple[int, int]) -> np.ndarray:
+    width, height = size
+    return np.empty((batch_size, height, width, 3), dtype=np.float32)
@@ -0,0 +1,210 @@
+"""
+Scan History Writer
+Write-behind buffer for the `scans` table, so recording a detection adds no
+database round trip to the request.
+
+`record()` only appends to a bounded in-memory queue. A single worker thread
+drains it and writes rows in bulk whenever `flush_rows` are waiting or
+`flush_interval` seconds have passed since the first unwritten row. PostgreSQL
+(psycopg2) gets a COPY, everything else one executemany INSERT. When the buffer
+is full, new rows are dropped and counted rather than blocking detection.
+
+`close()` flushes what is left; call it on shutdown.
+"""
+import csv
+import io
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.core.stats import LatencyTracker
+from app.database import engine
+from app.models.scan import Scan
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+COLUMNS = (
+    "user_id", "class_index", "disease_name", "confidence", "model_version",
+    "created_at", "latitude", "longitude", "image_sha256",
+)
+
+
+class ScanWriter:
+    def __init__(
+        self,
+        max_buffer: int = 10000,
+        flush_rows: int = 500,
+        flush_interval_s: float = 2.0,
+        name: str = "scan-writer",
+    ):
+        self.max_buffer = max(1, int(max_buffer))
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = max(0.0, float(flush_interval_s))
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.max_buffer)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        # Stats
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self._flush_latency = LatencyTracker()
+
+    def record(
+        self,
+        user_id: int,
+        class_index: int,
+        disease_name: str,
+        confidence: float,
+        model_version: str,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        image_sha256: Optional[str] = None,
+    ) -> bool:
+        """Queue one scan row without blocking. Returns False if it was dropped."""
+        row = {
+            "user_id": user_id,
+            "class_index": class_index,
+            "disease_name": disease_name,
+            "confidence": confidence,
+            "model_version": model_version,
+            "created_at": datetime.utcnow(),
+            "latitude": latitude,
+            "longitude": longitude,
+            "image_sha256": image_sha256,
+        }
+        return self._enqueue(row)
+
+    def _enqueue(self, row: Any) -> bool:
+        if self._closed:
+            self.dropped += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"{self.name}: buffer full, {self.dropped} rows dropped so far")
+            return False
+        self.recorded += 1
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything buffered and stop the worker."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            # Blocking put: the stop marker must not be lost to a full buffer
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(f"{self.name}: did not finish flushing within {timeout}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffer_depth": self._queue.qsize(),
+            "buffer_capacity": self.max_buffer,
+            "flush_rows": self.flush_rows,
+            "flush_interval_s": self.flush_interval,
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "flush_time": self._flush_latency.snapshot(),
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            rows = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                rows.append(entry)
+            self._flush(rows)
+
+        # Shutdown: whatever arrived before close()
+        leftover = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP:
+                leftover.append(entry)
+        for offset in range(0, len(leftover), self.flush_rows):
+            self._flush(leftover[offset:offset + self.flush_rows])
+
+    def _flush(self, rows: List[dict]):
+        start_time = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+                    _copy_rows(conn, rows)
+                else:
+                    conn.execute(insert(Scan), rows)
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"{self.name}: failed to write {len(rows)} scans: {e}")
+            return
+        finally:
+            self._flush_latency.record(time.perf_counter() - start_time)
+        self.flushes += 1
+        self.written += len(rows)
+
+
+def _copy_rows(conn, rows: List[dict]):
+    """COPY ... FROM STDIN (CSV); empty unquoted fields load as NULL."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row[column] is None else row[column] for column in COLUMNS])
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {Scan.__tablename__} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+scan_writer = ScanWriter(
+    max_buffer=settings.SCAN_BUFFER_SIZE,
+    flush_rows=settings.SCAN_FLUSH_ROWS,
+    flush_interval_s=settings.SCAN_FLUSH_INTERVAL_SECONDS,
+)
@@ -0,0 +1,85 @@
+"""
+Compiled Inference Benchmark
+Compares the old `model.predict(batch)` call with the Keras backend's
+compiled fixed-signature path (see KerasBackend.warm_up) for every batch
+bucket, plus the first-call (cold) latency each one pays.
+
+Usage (from backend/):
+    python benchmarks/bench_compiled_inference.py \\
+        --model ../ai-models/trained_models/disease_model.h5 [--max-batch-size 8] [--iterations 200]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.inference_backends import KerasBackend, batch_buckets  # noqa: E402
+
+
+def percentiles(samples_ms) -> dict:
+    ordered = sorted(samples_ms)
+    return {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))], 3),
+    }
+
+
+def timed(fn, batch, iterations: int) -> dict:
+    start = time.perf_counter()
+    fn(batch)
+    cold_ms = (time.perf_counter() - start) * 1000
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(batch)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"cold_ms": round(cold_ms, 3), **percentiles(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="Path to the Keras .h5 model")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    backend = KerasBackend(os.path.abspath(args.model), num_threads=args.threads)
+    backend.load()
+    width, height = backend.input_size or (256, 256)
+    rng = np.random.default_rng(0)
+
+    # The old path first, so its numbers are not helped by the compiled traces
+    batches = {size: rng.random((size, height, width, 3), dtype=np.float32)
+               for size in batch_buckets(args.max_batch_size)}
+    results = []
+    for size, batch in batches.items():
+        results.append({"batch_size": size, "model_predict": timed(
+            lambda x: backend.model.predict(x, verbose=0), batch, args.iterations)})
+
+    start = time.perf_counter()
+    warm_up = backend.warm_up(args.max_batch_size)
+    warm_up_ms = (time.perf_counter() - start) * 1000
+    for row in results:
+        row["compiled"] = timed(backend.predict, batches[row["batch_size"]], args.iterations)
+        row["speedup_p50"] = round(row["model_predict"]["p50_ms"] / row["compiled"]["p50_ms"], 2)
+        print(f"batch {row['batch_size']:>3}  predict p50 {row['model_predict']['p50_ms']:8.2f}ms "
+              f"p99 {row['model_predict']['p99_ms']:8.2f}ms | compiled p50 {row['compiled']['p50_ms']:8.2f}ms "
+              f"p99 {row['compiled']['p99_ms']:8.2f}ms  x{row['speedup_p50']}")
+
+    print(json.dumps({
+        "model": args.model,
+        "warm_up_ms": round(warm_up_ms, 1),
+        "warm_up_per_bucket_ms": warm_up,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
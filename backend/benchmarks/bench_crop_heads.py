@@ -0,0 +1,159 @@
+"""
+Crop Head Benchmark
+Per-request cost and accuracy of crop-routed heads against the full model:
+
+1. head cost (always): softmax head over synthetic backbone features for the
+   full 38-class "all" head vs each crop head, plus the score restriction
+   a single-classifier model applies for a crop hint
+2. real model (--version-dir + --data-dir): backbone latency per image, then
+   accuracy of the "all" head (no hint) vs the photo's crop head (hinted),
+   overall and per crop
+
+The backbone dominates per-request latency; heads only change the last
+matrix multiply. What routing buys is accuracy within a crop (no cross-crop
+confusions) and room to add crops without a larger model.
+
+--data-dir uses PlantVillage folder names (Tomato___Late_blight/*.jpg);
+labels missing from the version's class list are skipped.
+
+Usage (from backend/):
+    python benchmarks/bench_crop_heads.py [--features 1280] [--repeat 2000]
+    python benchmarks/bench_crop_heads.py --version-dir ../ai-models/registry/2024-06-heads \\
+        --data-dir ./labelled_leaves [--limit 50]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services import preprocessing  # noqa: E402
+from app.services.crop_heads import ALL_CROPS, crop_classes, crop_key, heads_from_dense, load_heads, restrict  # noqa: E402
+from app.services.ml_service import INPUT_SIZE  # noqa: E402
+from app.services.model_registry import PLANTVILLAGE_CLASSES, ModelRegistry  # noqa: E402
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def time_us(fn: Callable, repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {"p50_us": round(statistics.median(samples), 2), "p99_us": round(samples[int(len(samples) * 0.99) - 1], 2)}
+
+
+def head_cost(features_dim: int, batch: int, repeat: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    weight = rng.standard_normal((features_dim, len(PLANTVILLAGE_CLASSES)), dtype=np.float32) * 0.05
+    bias = np.zeros(len(PLANTVILLAGE_CLASSES), dtype=np.float32)
+    heads = heads_from_dense(weight, bias, PLANTVILLAGE_CLASSES)
+    features = rng.random((batch, features_dim), dtype=np.float32)
+
+    results = {"features": features_dim, "batch": batch, "heads": {}}
+    for name, head in sorted(heads.items(), key=lambda item: -item[1].class_ids.size):
+        results["heads"][name] = {"classes": int(head.class_ids.size), **time_us(lambda: head.scores(features), repeat)}
+
+    probs = heads[ALL_CROPS].scores(features)[0].copy()
+    tomato = crop_classes(PLANTVILLAGE_CLASSES)["tomato"]
+    results["restrict_tomato"] = time_us(lambda: restrict(probs, tomato), repeat)
+    return results
+
+
+def real_model(version_dir: str, data_dir: str, limit: int) -> dict:
+    from app.services.inference_backends import create_backend
+
+    version_dir = os.path.abspath(version_dir)
+    manifest = ModelRegistry(os.path.dirname(version_dir), "onnx", {}).manifest(os.path.basename(version_dir))
+    if not manifest.heads_path:
+        raise SystemExit(f"{version_dir} has no heads; export one with scripts/export_model.py --formats onnx-heads")
+    backend = create_backend(manifest.backend, manifest.path)
+    backend.load()
+    heads = load_heads(manifest.heads_path, len(manifest.classes))
+    classes = list(manifest.classes)
+
+    width, height = backend.input_size or INPUT_SIZE
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    buffer = preprocessing.allocate_batch(1, (width, height))
+    backbone_ms, full_us, crop_us = [], [], []
+    totals: Dict[str, Dict[str, int]] = {}
+
+    for label in sorted(os.listdir(data_dir)):
+        folder = os.path.join(data_dir, label)
+        crop = crop_key(label)
+        if label not in classes or crop not in heads or not os.path.isdir(folder):
+            continue
+        target = classes.index(label)
+        names = [name for name in sorted(os.listdir(folder)) if name.lower().endswith(IMAGE_SUFFIXES)][:limit]
+        for name in names:
+            with open(os.path.join(folder, name), "rb") as f:
+                preprocessing.decode_into(f, image)
+            start = time.perf_counter()
+            features = backend.predict(preprocessing.normalize_into([image], buffer))
+            backbone_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            full = heads[ALL_CROPS].class_ids[int(np.argmax(heads[ALL_CROPS].scores(features)[0]))]
+            full_us.append((time.perf_counter() - start) * 1e6)
+            start = time.perf_counter()
+            hinted = heads[crop].class_ids[int(np.argmax(heads[crop].scores(features)[0]))]
+            crop_us.append((time.perf_counter() - start) * 1e6)
+
+            counts = totals.setdefault(crop, {"images": 0, "full_correct": 0, "hinted_correct": 0})
+            counts["images"] += 1
+            counts["full_correct"] += int(full == target)
+            counts["hinted_correct"] += int(hinted == target)
+
+    images = sum(counts["images"] for counts in totals.values())
+    if not images:
+        raise SystemExit(f"No labelled images in {data_dir} match {manifest.version}'s classes")
+
+    def accuracy(key: str, counts: dict) -> float:
+        return round(counts[key] / counts["images"], 4)
+
+    overall = {key: sum(counts[key] for counts in totals.values()) for key in ("images", "full_correct", "hinted_correct")}
+    return {
+        "version": manifest.version,
+        "images": images,
+        "backbone_ms_p50": round(statistics.median(backbone_ms), 3),
+        "full_head_us_p50": round(statistics.median(full_us), 2),
+        "crop_head_us_p50": round(statistics.median(crop_us), 2),
+        "accuracy_full": accuracy("full_correct", overall),
+        "accuracy_hinted": accuracy("hinted_correct", overall),
+        "per_crop": {
+            crop: {"images": counts["images"], "full": accuracy("full_correct", counts),
+                   "hinted": accuracy("hinted_correct", counts)}
+            for crop, counts in sorted(totals.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=1280, help="Backbone feature width (MobileNetV2: 1280)")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--version-dir", help="Registry version with a backbone + heads.npz")
+    parser.add_argument("--data-dir", help="Labelled photos, one folder per PlantVillage class")
+    parser.add_argument("--limit", type=int, default=50, help="Images per class")
+    args = parser.parse_args()
+
+    results = {"head_cost": head_cost(args.features, args.batch, args.repeat, args.seed)}
+    for name, row in results["head_cost"]["heads"].items():
+        print(f"{name:>14}  {row['classes']:3d} classes  p50 {row['p50_us']:8.2f}us  p99 {row['p99_us']:8.2f}us")
+    if args.version_dir and args.data_dir:
+        results["real_model"] = real_model(args.version_dir, args.data_dir, args.limit)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
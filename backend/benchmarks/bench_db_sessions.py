@@ -0,0 +1,126 @@
+"""
+Sync vs Async Session Benchmark
+Runs the auth cache-miss query (user by id) from many concurrent coroutines,
+once through the old path (sync SessionLocal called inside `async def`, as
+the handlers used to) and once through AsyncSession, and reports:
+
+- queries per second
+- event-loop lag p50/p99 (a ticker that should wake every 5ms; with blocking
+  sessions it cannot run while a query is in flight)
+- async pool checkout wait and peak utilisation
+
+Point DATABASE_URL at the real PostgreSQL to get representative numbers;
+the SQLite default only checks that everything runs.
+
+Usage (from backend/):
+    DATABASE_URL=postgresql://... python benchmarks/bench_db_sessions.py [--concurrency 50] [--queries 2000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-only")
+os.environ.setdefault("DEBUG", "false")  # no SQL echo
+
+from sqlalchemy import select  # noqa: E402
+
+from app.core.stats import LatencyTracker  # noqa: E402
+from app.database import Base, SessionLocal, async_engine, async_session, engine, pool_stats  # noqa: E402
+from app.models.user import User  # noqa: E402
+
+TICK_SECONDS = 0.005
+
+
+def seed(users: int) -> list:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        existing = db.query(User).filter(User.email.like("bench-%")).count()
+        db.add_all(
+            User(email=f"bench-{i}@example.com", hashed_password="x")
+            for i in range(existing, users)
+        )
+        db.commit()
+        return [row.id for row in db.query(User.id).filter(User.email.like("bench-%")).limit(users)]
+    finally:
+        db.close()
+
+
+async def sync_lookup(user_id: int):
+    db = SessionLocal()
+    try:
+        return db.query(User.id, User.email).filter(User.id == user_id).first()
+    finally:
+        db.close()
+
+
+async def async_lookup(user_id: int):
+    async with async_session() as db:
+        return (await db.execute(select(User.id, User.email).where(User.id == user_id))).first()
+
+
+async def measure(lookup, user_ids: list, concurrency: int, queries: int) -> dict:
+    lag = LatencyTracker(window=100000)
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            expected = time.perf_counter() + TICK_SECONDS
+            await asyncio.sleep(TICK_SECONDS)
+            lag.record(max(0.0, time.perf_counter() - expected))
+
+    remaining = iter(range(queries))
+
+    async def worker():
+        for i in remaining:
+            await lookup(user_ids[i % len(user_ids)])
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+
+    snapshot = lag.snapshot()
+    return {
+        "queries_per_second": round(queries / elapsed, 1),
+        "loop_lag_p50_ms": snapshot["p50_ms"],
+        "loop_lag_p99_ms": snapshot["p99_ms"],
+        "loop_lag_max_ms": snapshot["max_ms"],
+    }
+
+
+async def run(args) -> dict:
+    user_ids = seed(args.users)
+    results = {
+        "sync_session_in_async_handler": await measure(sync_lookup, user_ids, args.concurrency, args.queries),
+        "async_session": await measure(async_lookup, user_ids, args.concurrency, args.queries),
+    }
+    results["async_pool"] = pool_stats()
+    await async_engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for name in ("sync_session_in_async_handler", "async_session"):
+        row = results[name]
+        print(f"{name:>30}  {row['queries_per_second']:9.1f} q/s  "
+              f"loop lag p99 {row['loop_lag_p99_ms']:.2f}ms")
+    print(json.dumps({"database": engine.dialect.name, "concurrency": args.concurrency, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
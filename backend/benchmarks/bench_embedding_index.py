@@ -0,0 +1,167 @@
+"""
+Embedding Index Benchmark
+Similar-case search latency and recall as the embedding log grows:
+
+1. appends synthetic clustered embeddings to a fresh float16 log in
+   --append-chunk batches. Like real CNN features they vary along far fewer
+   directions than they have dimensions (--intrinsic-dim), and photos of
+   the same disease/field sit close together (--clusters)
+2. at each --checkpoints size, waits for the background (re)training, then
+   runs --queries searches (perturbed copies of stored vectors, i.e. the
+   same leaf photographed again) and reports p50/p99 latency, recall@k
+   against exact brute force over the log, and how often the stored
+   original comes back first (duplicate_found)
+3. times an incremental append + sync of --append-chunk rows on the final
+   index
+
+Usage (from backend/):
+    python benchmarks/bench_embedding_index.py [--checkpoints 10000 100000 1000000] [--dim 1280]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/krishi-bench.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-only")
+
+from app.services.embeddings import META_DTYPE, EmbeddingLog, NeighbourIndex  # noqa: E402
+
+
+class ClusteredEmbeddings:
+    def __init__(self, dim: int, intrinsic_dim: int, clusters: int, spread: float, seed: int):
+        self.rng = np.random.default_rng(seed)
+        self.centres = self.rng.standard_normal((clusters, intrinsic_dim), dtype=np.float32)
+        self.mixing = self.rng.standard_normal((intrinsic_dim, dim), dtype=np.float32) / np.sqrt(intrinsic_dim)
+        self.spread = spread
+        self.intrinsic_dim = intrinsic_dim
+        self.dim = dim
+
+    def sample(self, count: int):
+        labels = self.rng.integers(0, len(self.centres), count)
+        latent = self.centres[labels] + self.spread * self.rng.standard_normal((count, self.intrinsic_dim), dtype=np.float32)
+        vectors = latent @ self.mixing + 0.05 * self.rng.standard_normal((count, self.dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        meta = np.zeros(count, dtype=META_DTYPE)
+        meta["image"] = self.rng.integers(0, 2 ** 63, count, dtype=np.uint64)
+        meta["class_index"] = labels % 38
+        meta["confidence"] = 0.9
+        meta["created_at"] = int(time.time())
+        return vectors, meta
+
+
+def exact_neighbours(log: EmbeddingLog, queries: np.ndarray, k: int) -> np.ndarray:
+    vectors, _ = log.view()
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(vectors), 65536):
+        scores = vectors[start:start + 65536].astype(np.float32) @ queries.T  # (chunk, queries)
+        merged_scores = np.concatenate([best_scores, scores.T], axis=1)
+        merged_ids = np.concatenate([best_ids, np.arange(start, start + len(scores))[None].repeat(len(queries), 0)], axis=1)
+        top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_ids = np.take_along_axis(merged_ids, top, axis=1)
+    return best_ids
+
+
+def wait_trained(index: NeighbourIndex, rows: int, timeout: float = 1800) -> float:
+    start = time.perf_counter()
+    index.sync()
+    while index.stats()["training"] or not index.ready or index.stats()["indexed"] < rows:
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("index training did not finish")
+        time.sleep(0.2)
+        index.sync()
+    return time.perf_counter() - start
+
+
+def measure(index: NeighbourIndex, log: EmbeddingLog, data: ClusteredEmbeddings, queries: int, k: int) -> dict:
+    stored, _ = log.view()
+    picks = data.rng.choice(len(stored), queries, replace=False)
+    probes = stored[np.sort(picks)].astype(np.float32)
+    probes += 0.02 * data.rng.standard_normal(probes.shape, dtype=np.float32)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+
+    latencies, found = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        ids, _ = index.search(probe, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids)
+    truth = exact_neighbours(log, probes, k)
+    recall = np.mean([len(set(f.tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)])
+    duplicates = np.mean([len(f) and f[0] == original for f, original in zip(found, np.sort(picks))])
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        f"recall_at_{k}": round(float(recall), 4),
+        "duplicate_found": round(float(duplicates), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoints", nargs="+", type=int, default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=1280, help="Backbone feature width (MobileNetV2: 1280)")
+    parser.add_argument("--intrinsic-dim", type=int, default=48)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=0.5, help="Spread around each cluster centre")
+    parser.add_argument("--search-dim", type=int, default=64)
+    parser.add_argument("--project-min", type=int, default=4096)
+    parser.add_argument("--ivf-min", type=int, default=65536)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--append-chunk", type=int, default=50000)
+    parser.add_argument("--dir", help="Log directory (default: a temporary one, removed afterwards)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    directory = args.dir or tempfile.mkdtemp(prefix="krishi-embeddings-")
+    data = ClusteredEmbeddings(args.dim, args.intrinsic_dim, args.clusters, args.spread, args.seed)
+    log = EmbeddingLog.open(directory, args.dim)
+    index = NeighbourIndex(log, "bench", args.search_dim, args.project_min, args.ivf_min, args.nprobe)
+    results = {"dim": args.dim, "search_dim": args.search_dim, "nprobe": args.nprobe, "checkpoints": []}
+    try:
+        append_seconds = 0.0
+        for target in sorted(args.checkpoints):
+            while log.count() < target:
+                vectors, meta = data.sample(min(args.append_chunk, target - log.count()))
+                start = time.perf_counter()
+                log.append(vectors, meta, skip_known_images=False)
+                append_seconds += time.perf_counter() - start
+            build_seconds = wait_trained(index, target)
+            row = {"vectors": target, **index.stats(), "build_wait_s": round(build_seconds, 1),
+                   **measure(index, log, data, args.queries, args.k)}
+            del row["searches"], row["training"]
+            results["checkpoints"].append(row)
+            print(f"{target:>9} vectors  {row['kind']:>5}  p50 {row['p50_ms']:7.3f}ms  p99 {row['p99_ms']:7.3f}ms  "
+                  f"recall@{args.k} {row[f'recall_at_{args.k}']:.3f}  duplicate found {row['duplicate_found']:.3f}")
+        results["append_rows_per_s"] = round(log.count() / append_seconds) if append_seconds else None
+
+        vectors, meta = data.sample(args.append_chunk)
+        start = time.perf_counter()
+        log.append(vectors, meta, skip_known_images=False)
+        index.sync()
+        results["incremental_append_sync_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        results["incremental_rows"] = args.append_chunk
+        results["log_bytes"] = os.path.getsize(log.vectors_path) + os.path.getsize(log.meta_path)
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
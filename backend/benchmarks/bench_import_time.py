@@ -0,0 +1,90 @@
+"""
+API Import-Time Budget
+Imports app.main in a fresh interpreter under `python -X importtime` and
+reports the total import cost plus the most expensive modules. Heavy ML
+runtimes must not show up here: the model is loaded in the background
+after startup (see MLService.start_loading).
+
+Exits non-zero when the import exceeds --budget-ms or a forbidden module
+(tensorflow, onnxruntime, tflite_runtime) is imported, so it can run in CI.
+
+Usage (from backend/):
+    python benchmarks/bench_import_time.py [--budget-ms 1500] [--runs 3] [--top 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FORBIDDEN = ("tensorflow", "onnxruntime", "tflite_runtime", "keras")
+
+
+def import_once(module: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+    env.setdefault("SECRET_KEY", "benchmark-only")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    # "import time: self [us] | cumulative | imported package"
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = {
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        }
+    target = modules[module]
+    return {"total_ms": target["cumulative_ms"], "modules": modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters; the median is reported")
+    parser.add_argument("--top", type=int, default=15, help="Most expensive packages to list")
+    args = parser.parse_args()
+
+    runs = [import_once(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(run["total_ms"] for run in runs)
+    modules = runs[-1]["modules"]
+
+    # self time summed per top-level package (fastapi, sqlalchemy, app, ...)
+    per_package = {}
+    for name, info in modules.items():
+        package = name.split(".")[0]
+        per_package[package] = per_package.get(package, 0.0) + info["self_ms"]
+    top_level = sorted(per_package.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    forbidden = sorted(name for name in modules if name.split(".")[0] in FORBIDDEN)
+
+    for name, ms in top_level:
+        print(f"{ms:9.1f}ms  {name}")
+    print(f"import {args.module}: {total_ms:.1f}ms (budget {args.budget_ms:.0f}ms)")
+    if forbidden:
+        print(f"forbidden modules imported: {', '.join(forbidden[:10])}")
+
+    report = {
+        "module": args.module,
+        "total_ms": round(total_ms, 1),
+        "runs_ms": [round(run["total_ms"], 1) for run in runs],
+        "budget_ms": args.budget_ms,
+        "top_packages": [{"package": name, "self_ms": round(ms, 1)} for name, ms in top_level],
+        "forbidden": forbidden,
+    }
+    print(json.dumps(report, indent=2))
+    if forbidden or total_ms > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
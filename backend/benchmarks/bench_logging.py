@@ -0,0 +1,149 @@
+"""
+Logging Overhead Benchmark
+Time a detection spends on its log lines, before and after the queued logging:
+
+- sync: the previous setup. JsonFormatter + StreamHandler on the root logger,
+  eager f-strings, so every line is formatted and written on the request
+- queue: lazy %-style calls into the bounded queue; a listener thread
+  formats and writes
+- queue_sampled: as queue, with the default LOG_SAMPLING
+
+Each simulated request emits the lines a single-image detection logs
+(inference batch, inference result, detection success with extra fields)
+and the caller-side time per request is reported, along with records
+written, dropped and sampled out.
+
+--sink-latency-ms slows every write down (a blocked stderr pipe or a slow log
+shipper): the sync setup stalls requests, the queue drops records instead.
+
+Usage (from backend/):
+    python benchmarks/bench_logging.py [--requests 20000] [--sink-latency-ms 0.5] [--queue-size 10000]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/krishi-bench.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-only")
+
+from app.config import settings  # noqa: E402
+from app.core.logging_config import RequestIdFilter, json_handler, queued_handler, request_id_ctx  # noqa: E402
+
+ML_LOGGER = "app.services.ml_service"
+DETECT_LOGGER = "app.api.endpoints.detect"
+
+
+class Sink(io.TextIOBase):
+    """Counts lines; optionally sleeps on every write."""
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return len(text)
+
+
+def eager_request(ml: logging.Logger, detect: logging.Logger, email: str):
+    dura = 12.3456
+    ml.info(f"Inference batch of {1} in {dura:.2f}ms")
+    ml.info(f"Inference: {'Tomato___Late_blight'} ({0.9731:.2%}) in {dura:.2f}ms")
+    detect.info(f"Detection successful for {email}", extra={
+        "disease": "Tomato___Late_blight", "confidence": 0.9731, "crop": "tomato", "user_email": email,
+    })
+
+
+def lazy_request(ml: logging.Logger, detect: logging.Logger, email: str):
+    dura = 12.3456
+    ml.info("Inference batch of %d in %.2fms", 1, dura)
+    ml.info("Inference: %s (%.2f%%) in %.2fms", "Tomato___Late_blight", 97.31, dura)
+    detect.info("Detection successful for %s", email, extra={
+        "disease": "Tomato___Late_blight", "confidence": 0.9731, "crop": "tomato", "user_email": email,
+    })
+
+
+def run(mode: str, requests: int, sink: Sink, queue_size: int, sampling: Dict[str, float]) -> dict:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    ml = logging.getLogger(ML_LOGGER)
+    detect = logging.getLogger(DETECT_LOGGER)
+    for logger in (ml, detect):
+        logger.filters.clear()
+
+    listener = None
+    if mode == "sync":
+        handler = json_handler(sink)
+        for logger in (ml, detect):
+            logger.addFilter(RequestIdFilter())
+        emit: Callable = eager_request
+    else:
+        handler, listener = queued_handler(json_handler(sink), queue_size, sampling)
+        listener.start()
+        ml = logging.getLogger(f"{ML_LOGGER}.inference")
+        emit = lazy_request
+    root.addHandler(handler)
+
+    samples = []
+    started = time.perf_counter()
+    for i in range(requests):
+        request_id_ctx.set(str(uuid.uuid4()))
+        start = time.perf_counter()
+        emit(ml, detect, f"farmer{i % 100}@example.com")
+        samples.append((time.perf_counter() - start) * 1e6)
+    elapsed = time.perf_counter() - started
+
+    drain_start = time.perf_counter()
+    if listener:
+        listener.stop()
+    drain_ms = (time.perf_counter() - drain_start) * 1000
+    root.removeHandler(handler)
+
+    samples.sort()
+    row = {
+        "mode": mode,
+        "per_request_us_p50": round(statistics.median(samples), 2),
+        "per_request_us_p99": round(samples[int(len(samples) * 0.99) - 1], 2),
+        "per_request_us_mean": round(statistics.fmean(samples), 2),
+        "requests_per_s": round(requests / elapsed),
+        "lines_written": sink.lines,
+    }
+    if listener:
+        sampler = handler.filters[0]
+        row.update({"dropped": handler.dropped, "sampled_out": sampler.sampled_out, "drain_ms": round(drain_ms, 1)})
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sink-latency-ms", type=float, default=0.0, help="Added to every write")
+    parser.add_argument("--queue-size", type=int, default=settings.LOG_QUEUE_SIZE)
+    args = parser.parse_args()
+
+    results = {"requests": args.requests, "sink_latency_ms": args.sink_latency_ms, "queue_size": args.queue_size,
+               "sampling": settings.LOG_SAMPLING, "modes": []}
+    for mode, sampling in (("sync", {}), ("queue", {}), ("queue_sampled", settings.LOG_SAMPLING)):
+        run(mode, min(args.requests, 1000), Sink(0.0), args.queue_size, sampling)  # warm-up
+        row = run(mode, args.requests, Sink(args.sink_latency_ms / 1000), args.queue_size, sampling)
+        results["modes"].append(row)
+        print(f"{mode:>14}  p50 {row['per_request_us_p50']:8.2f}us  p99 {row['per_request_us_p99']:8.2f}us  "
+              f"lines {row['lines_written']:>6}  dropped {row.get('dropped', 0):>6}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
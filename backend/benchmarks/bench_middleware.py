@@ -0,0 +1,151 @@
+"""
+Request Middleware Benchmark
+Per-request overhead of the request ID / timing middleware, called straight
+through ASGI (no server, no sockets) so only the middleware stack differs:
+
+- none: the bare app
+- base_http: the previous LoggingMiddleware (Starlette BaseHTTPMiddleware,
+  reproduced below), which runs the app in a separate task and re-streams
+  the body through a memory channel
+- pure_asgi: RequestContextMiddleware
+
+Routes: a small JSON response, and a streamed response of --chunks chunks.
+Both middlewares report to the same no-op metrics sink.
+
+Usage (from backend/):
+    python benchmarks/bench_middleware.py [--requests 20000] [--chunks 32]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/krishi-bench.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-only")
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.core.logging_config import RequestContextMiddleware, _route_template, request_id_ctx  # noqa: E402
+
+
+def discard(method: str, route: str, status: int, seconds: float):
+    pass
+
+
+class BaseHTTPLoggingMiddleware(BaseHTTPMiddleware):
+    """The previous LoggingMiddleware, minus its comments."""
+
+    async def dispatch(self, request: Request, call_next):
+        request_id = str(uuid.uuid4())
+        request_id_ctx.set(request_id)
+        request.state.request_id = request_id
+        start_time = time.time()
+        try:
+            response = await call_next(request)
+        except Exception:
+            discard(request.method, _route_template(request.scope), 500, time.time() - start_time)
+            raise
+        process_time = time.time() - start_time
+        discard(request.method, _route_template(request.scope), response.status_code, process_time)
+        response.headers["X-Process-Time"] = str(round(process_time, 4))
+        response.headers["X-Request-ID"] = request_id
+        return response
+
+
+def build_app(chunks: int, middleware: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/detect/input")
+    async def small():
+        return {"width": 224, "height": 224, "channels": 3}
+
+    @app.get("/api/detect/stream")
+    async def stream():
+        async def lines():
+            for i in range(chunks):
+                yield b'{"index": %d, "success": true}\n' % i
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    if middleware == "base_http":
+        app.add_middleware(BaseHTTPLoggingMiddleware)
+    elif middleware == "pure_asgi":
+        app.add_middleware(RequestContextMiddleware, observe=discard)
+    return app
+
+
+async def call(app, path: str) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    chunks = 0
+    body_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        # Like a server: the (empty) body once, then disconnect after the response
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal chunks
+        if message["type"] == "http.response.body":
+            chunks += bool(message.get("body"))
+            if not message.get("more_body"):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return chunks
+
+
+async def measure(app, path: str, requests: int) -> dict:
+    for _ in range(min(requests, 500)):
+        await call(app, path)
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await call(app, path)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {"p50_us": round(statistics.median(samples), 1), "p99_us": round(samples[int(len(samples) * 0.99) - 1], 1),
+            "mean_us": round(statistics.fmean(samples), 1)}
+
+
+async def run(args) -> dict:
+    results = {"requests": args.requests, "chunks": args.chunks, "routes": {}}
+    for route in ("/api/detect/input", "/api/detect/stream"):
+        rows = {}
+        for middleware in ("none", "base_http", "pure_asgi"):
+            app = build_app(args.chunks, middleware)
+            rows[middleware] = await measure(app, route, args.requests)
+        for middleware in ("base_http", "pure_asgi"):
+            rows[middleware]["overhead_us_p50"] = round(rows[middleware]["p50_us"] - rows["none"]["p50_us"], 1)
+        results["routes"][route] = rows
+        for middleware, row in rows.items():
+            print(f"{route:>20}  {middleware:>9}  p50 {row['p50_us']:7.1f}us  p99 {row['p99_us']:7.1f}us", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--chunks", type=int, default=32, help="Body chunks of the streamed route")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Password Hashing Throughput Benchmark
+Measures login throughput (bcrypt verifications per second) through a
+BoundedExecutor as the worker count grows from 1 to the number of cores,
+to pick PASSWORD_HASH_WORKERS for a node.
+
+Usage (from backend/):
+    python benchmarks/bench_password_hash.py [--rounds 12] [--logins 48]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import wait
+
+import bcrypt
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-only")
+
+from app.core.executor import BoundedExecutor  # noqa: E402
+
+
+def run(workers: int, logins: int, stored_hash: bytes, password: bytes) -> dict:
+    executor = BoundedExecutor(max_workers=workers, max_queue=logins, name=f"bench-{workers}")
+    start = time.perf_counter()
+    futures = [executor.submit(bcrypt.checkpw, password, stored_hash) for _ in range(logins)]
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    stats = executor.stats()
+    return {
+        "workers": workers,
+        "logins_per_second": round(logins / elapsed, 2),
+        "p50_wait_ms": stats["wait_time"]["p50_ms"],
+        "p99_wait_ms": stats["wait_time"]["p99_ms"],
+        "mean_hash_ms": stats["run_time"]["mean_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost")
+    parser.add_argument("--logins", type=int, default=48, help="Concurrent logins per measurement")
+    args = parser.parse_args()
+
+    password = b"strong_test_password_123"
+    stored_hash = bcrypt.hashpw(password, bcrypt.gensalt(rounds=args.rounds))
+    cores = os.cpu_count() or 1
+
+    worker_counts = sorted({1, 2, max(1, cores // 2), cores, cores * 2})
+    results = [run(workers, args.logins, stored_hash, password) for workers in worker_counts]
+    for row in results:
+        print(f"workers={row['workers']:>3}  {row['logins_per_second']:8.2f} logins/s  "
+              f"p99 wait {row['p99_wait_ms']:.1f}ms")
+    print(json.dumps({"cores": cores, "bcrypt_rounds": args.rounds, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
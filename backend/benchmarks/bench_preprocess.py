@@ -0,0 +1,96 @@
+"""
+Preprocessing Micro-Benchmark
+Compares the original decode path (full decode -> convert -> resize ->
+astype/255) against app.services.preprocessing (JPEG draft decode, one resize,
+normalisation into a reused float32 batch buffer) on typical phone photo sizes.
+
+Usage (from backend/):
+    python benchmarks/bench_preprocess.py [--repeat 20] [--size 256]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services import preprocessing  # noqa: E402
+
+PHONE_SIZES = {
+    "app_compressed_1024": (1024, 768),
+    "2mp": (1600, 1200),
+    "8mp": (3264, 2448),
+    "12mp": (4032, 3024),
+}
+
+
+def synthetic_jpeg(width: int, height: int, quality: int = 90) -> bytes:
+    """Leaf-ish green gradient with noise, so the JPEG does not compress to nothing."""
+    rng = np.random.default_rng(width * height)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x * 80 // width), 120 + (y * 100 // height), (x + y) * 60 // (width + height)], axis=-1)
+    noise = rng.integers(0, 40, size=(height, width, 3))
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def legacy_path(data: bytes, size):
+    image = Image.open(io.BytesIO(data))
+    img = image.convert("RGB").resize(size)
+    img_array = np.array(img).astype("float32") / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def new_path(data: bytes, size, batch_buffer):
+    decoded = preprocessing.decode(data, size)
+    return preprocessing.normalize_into([decoded], batch_buffer)
+
+
+def timeit(fn, repeat: int):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--size", type=int, default=256, help="Model input resolution (square)")
+    args = parser.parse_args()
+
+    size = (args.size, args.size)
+    batch_buffer = preprocessing.allocate_batch(1, size)
+    results = {}
+    for label, (width, height) in PHONE_SIZES.items():
+        data = synthetic_jpeg(width, height)
+        legacy = timeit(lambda: legacy_path(data, size), args.repeat)
+        new = timeit(lambda: new_path(data, size, batch_buffer), args.repeat)
+        diff = np.abs(legacy_path(data, size)[0] - new_path(data, size, batch_buffer)[0]).mean()
+        results[label] = {
+            "resolution": f"{width}x{height}",
+            "jpeg_kb": round(len(data) / 1024, 1),
+            "legacy": legacy,
+            "draft": new,
+            "speedup": round(legacy["median_ms"] / new["median_ms"], 2),
+            "mean_abs_pixel_diff": round(float(diff), 4),
+        }
+        print(f"{label:>20}  legacy {legacy['median_ms']:8.2f}ms  draft {new['median_ms']:8.2f}ms  "
+              f"x{results[label]['speedup']}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
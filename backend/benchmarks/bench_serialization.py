@@ -0,0 +1,145 @@
+"""
+Detection Response Serialization Benchmark
+Per-response cost of building the /api/detect body, for every class of the
+model with catalog entries shaped like the seeded ones (Hindi name, severity,
+a few treatment steps), three ways:
+
+- response_model: the dict validated through DetectionResponse and
+  jsonable_encoder, then JSONResponse (FastAPI's default for a returned dict)
+- dict: the dict straight into JSONResponse (the previous endpoint code)
+- precomputed: static members serialized once per disease by the knowledge
+  index, prediction fields joined in per request (EncodedJSONResponse)
+
+Each mode includes the knowledge_lookup and serialization stage timers the
+endpoint runs; their own cost is reported as the stage_timers row. All three
+produce the same JSON; the precomputed bytes are checked against the dict
+path before timing.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--repeat 20000]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/krishi-bench.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-only")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.core import metrics  # noqa: E402
+from app.api.endpoints.detect import EncodedJSONResponse, _encode_response  # noqa: E402
+from app.schemas.disease import DetectionResponse  # noqa: E402
+from app.services.disease_index import DiseaseEntry, DiseaseIndex, disease_catalog  # noqa: E402
+from app.services.ml_service import LoadedModel, Prediction, canonical_name  # noqa: E402
+from app.services.model_registry import PLANTVILLAGE_CLASSES  # noqa: E402
+
+TREATMENT = (
+    "Remove and destroy infected leaves.",
+    "Spray Mancozeb 75% WP @ 2.5g/liter at 10-day intervals.",
+    "Avoid overhead irrigation; water early in the day.",
+    "Rotate with non-host crops next season.",
+)
+
+
+def install_catalog() -> DiseaseIndex:
+    entries = [
+        DiseaseEntry(
+            name=canonical_name(label),
+            name_hi=f"रोग {i} ({canonical_name(label)})",
+            severity=("LOW", "MEDIUM", "HIGH")[i % 3],
+            treatment_steps=TREATMENT[: 2 + i % 3],
+        )
+        for i, label in enumerate(PLANTVILLAGE_CLASSES)
+    ]
+    entries = list({entry.name: entry for entry in entries}.values())
+    disease_catalog._index = DiseaseIndex(entries, PLANTVILLAGE_CLASSES, version=1)
+    return disease_catalog.index
+
+
+def response_dict(prediction: Prediction, crop, model: LoadedModel) -> dict:
+    with metrics.stage_timer("knowledge_lookup"):
+        entry, _ = disease_catalog.for_class(model.version, model.classes, prediction.class_index)
+    return {
+        "success": True,
+        "disease_name": prediction.disease_name,
+        "confidence": prediction.confidence,
+        "disease_name_hi": entry.name_hi,
+        "severity": entry.severity,
+        "treatment": {"steps": list(entry.treatment_steps)},
+        "model_version": prediction.model_version,
+        "crop": crop,
+    }
+
+
+def time_us(fn: Callable, predictions, repeat: int) -> Dict[str, float]:
+    samples = []
+    for i in range(repeat):
+        prediction = predictions[i % len(predictions)]
+        start = time.perf_counter()
+        fn(prediction)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {"p50_us": round(statistics.median(samples), 2), "p99_us": round(samples[int(len(samples) * 0.99) - 1], 2),
+            "mean_us": round(statistics.fmean(samples), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    index = install_catalog()
+    model = LoadedModel("2024-06-v2", None)  # class list only; never runs
+    predictions = [
+        Prediction(i, canonical_name(label), 0.5 + (i * 0.0137) % 0.5, "2024-06-v2")
+        for i, label in enumerate(PLANTVILLAGE_CLASSES)
+    ]
+    crop = "tomato"
+    for prediction in predictions:
+        expected = JSONResponse(response_dict(prediction, crop, model)).body
+        if _encode_response(prediction, crop, model) != expected:
+            raise SystemExit(f"precomputed response differs for {prediction.disease_name}")
+
+    def response_model(prediction: Prediction):
+        content = response_dict(prediction, crop, model)
+        with metrics.stage_timer("serialization"):
+            return JSONResponse(jsonable_encoder(DetectionResponse.model_validate(content)))
+
+    def plain_dict(prediction: Prediction):
+        content = response_dict(prediction, crop, model)
+        with metrics.stage_timer("serialization"):
+            return JSONResponse(content)
+
+    def empty_timers(prediction: Prediction):
+        with metrics.stage_timer("knowledge_lookup"):
+            pass
+        with metrics.stage_timer("serialization"):
+            pass
+
+    modes = {
+        "response_model": response_model,
+        "dict": plain_dict,
+        "precomputed": lambda p: EncodedJSONResponse(_encode_response(p, crop, model)),
+        "stage_timers": empty_timers,
+    }
+    results = {"classes": len(predictions), "diseases": len(index.by_name), "repeat": args.repeat,
+               "body_bytes_mean": round(statistics.fmean(len(_encode_response(p, crop, model)) for p in predictions)),
+               "modes": {}}
+    for name, fn in modes.items():
+        time_us(fn, predictions, min(args.repeat, 2000))  # warm-up
+        results["modes"][name] = time_us(fn, predictions, args.repeat)
+        row = results["modes"][name]
+        print(f"{name:>15}  p50 {row['p50_us']:7.2f}us  p99 {row['p99_us']:7.2f}us", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Upload Memory Benchmark
+Peak memory while many large uploads are ingested at once:
+
+1. ingestion only: the old path (`await file.read()` then `io.BytesIO`) vs
+   read_upload() (chunked hash, decoder reads the spooled file), for
+   --concurrency uploads of the same size held at the same time
+2. end to end: /api/detect in-process at --concurrency, reporting peak
+   traced Python memory per in-flight request and the process RSS
+   high-water mark (Pillow's decode buffers are only visible in RSS)
+
+tracemalloc sees bytes/bytearray/NumPy allocations, which is where upload
+copies live.
+
+Usage (from backend/):
+    python benchmarks/bench_upload_memory.py [--concurrency 32] [--size-mb 4.5]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+_workdir = tempfile.mkdtemp(prefix="krishi-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/bench.db")
+os.environ.setdefault("SECRET_KEY", "benchmark-only")
+os.environ.setdefault("DEBUG", "false")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ["RATE_LIMIT_BACKEND"] = "memory"
+os.environ["RATE_LIMIT_DETECT_PER_MINUTE"] = os.environ["RATE_LIMIT_DETECT_BURST"] = "1000000"
+os.environ["PREDICTION_CACHE_MAX_ENTRIES"] = "0"
+
+import numpy as np  # noqa: E402
+from fastapi import UploadFile  # noqa: E402
+from PIL import Image  # noqa: E402
+from starlette.datastructures import Headers  # noqa: E402
+
+from app.core.uploads import read_upload  # noqa: E402
+
+MB = 1024 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024  # Starlette's multipart spool threshold
+
+
+def noisy_png(target_bytes: int, seed: int) -> bytes:
+    """Random pixels barely compress, so the PNG lands close to `target_bytes`."""
+    side = int((target_bytes / 3) ** 0.5)
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(side, side, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def spooled_upload(data: bytes) -> UploadFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    spool.write(data)
+    spool.seek(0)
+    return UploadFile(spool, size=len(data), filename="leaf.png", headers=Headers({"content-type": "image/png"}))
+
+
+async def ingest_buffered(upload: UploadFile):
+    contents = await upload.read()
+    return Image.open(io.BytesIO(contents)), contents
+
+
+async def ingest_streamed(upload: UploadFile):
+    ingested = await read_upload(upload)
+    return Image.open(ingested.file), ingested
+
+
+async def ingestion_peak(ingest, data: bytes, concurrency: int) -> dict:
+    uploads = [spooled_upload(data) for _ in range(concurrency)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = await asyncio.gather(*(ingest(upload) for upload in uploads))  # all alive at once, like in-flight requests
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    for upload in uploads:
+        upload.file.close()
+    return {
+        "peak_mb": round(peak / MB, 2),
+        "per_upload_mb": round(peak / concurrency / MB, 3),
+        "seconds": round(elapsed, 3),
+    }
+
+
+async def end_to_end(data: bytes, concurrency: int, rounds: int) -> dict:
+    import httpx
+    from app.main import app
+    from app.services.ml_service import ml_service
+
+    async with app.router.lifespan_context(app):
+        ml_service.load()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+            account = {"email": "upload-bench@example.com", "password": "benchmark-password-123"}
+            await client.post("/api/auth/register", json=account)
+            token = (await client.post("/api/auth/login", json=account)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            tracemalloc.start()
+            statuses = []
+            start = time.perf_counter()
+            for _ in range(rounds):
+                responses = await asyncio.gather(*(
+                    client.post("/api/detect", files={"file": ("leaf.png", data, "image/png")}, headers=headers)
+                    for _ in range(concurrency)
+                ))
+                statuses += [r.status_code for r in responses]
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            return {
+                "requests": len(statuses),
+                "ok": statuses.count(200),
+                "seconds": round(elapsed, 2),
+                "peak_traced_mb": round(peak / MB, 2),
+                # The in-process client's encoded bodies are traced too (at least this much)
+                "client_bodies_mb": round(concurrency * len(data) / MB, 2),
+                "rss_high_water_growth_mb": round((rss_after - rss_before) / 1024, 1),
+            }
+
+
+async def run(args) -> dict:
+    data = noisy_png(int(args.size_mb * MB), args.seed)
+    results = {"upload_mb": round(len(data) / MB, 2), "concurrency": args.concurrency}
+    results["ingestion_buffered"] = await ingestion_peak(ingest_buffered, data, args.concurrency)
+    results["ingestion_streamed"] = await ingestion_peak(ingest_streamed, data, args.concurrency)
+    results["end_to_end"] = await end_to_end(data, args.concurrency, args.rounds)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--size-mb", type=float, default=4.5, help="Upload size (must stay under MAX_UPLOAD_SIZE)")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    results = asyncio.run(run(args))
+    for name in ("ingestion_buffered", "ingestion_streamed"):
+        row = results[name]
+        print(f"{name:>20}  peak {row['peak_mb']:8.2f}MB  per upload {row['per_upload_mb']:7.3f}MB")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
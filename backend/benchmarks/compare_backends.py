@@ -0,0 +1,165 @@
+"""
+Inference Backend Comparison
+Runs the same inputs through each inference backend (each in its own
+process, so memory numbers are not polluted by the others) and reports:
+
+- load time and resident memory added by loading the model
+- batch-1 latency p50/p99 and batch-N throughput
+- top-1 agreement with the Keras reference
+
+Usage (from backend/):
+    python benchmarks/compare_backends.py \\
+        --model keras=../ai-models/trained_models/disease_model.h5 \\
+        --model tflite=../ai-models/trained_models/disease_model_int8.tflite \\
+        --model onnx=../ai-models/trained_models/disease_model_int8.onnx \\
+        --images-dir ./calibration_leaves --output backends.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from queue import Empty
+
+import numpy as np
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+from app.services import preprocessing  # noqa: E402
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_inputs(images_dir: str, count: int, size) -> np.ndarray:
+    batch = preprocessing.allocate_batch(count, size)
+    decoded = []
+    if images_dir:
+        names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+        for name in names[:count]:
+            with open(os.path.join(images_dir, name), "rb") as f:
+                decoded.append(preprocessing.decode(f.read(), size).copy())
+    rng = np.random.default_rng(0)
+    while len(decoded) < count:
+        decoded.append(rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8))
+    return preprocessing.normalize_into(decoded, batch)
+
+
+def run_backend(name: str, path: str, args, queue):
+    sys.path.insert(0, BACKEND_ROOT)
+    from app.services.inference_backends import create_backend
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    backend = create_backend(name, path, num_threads=args.threads)
+    backend.load()
+    load_s = time.perf_counter() - start
+    size = backend.input_size or (256, 256)
+    inputs = load_inputs(args.images_dir, args.samples, size)
+
+    backend.warm_up(args.batch_size)
+    single = []
+    for i in range(args.iterations):
+        sample = inputs[i % len(inputs):][:1]
+        t0 = time.perf_counter()
+        backend.predict(sample)
+        single.append((time.perf_counter() - t0) * 1000)
+
+    batch = inputs[:args.batch_size]
+    t0 = time.perf_counter()
+    rounds = max(1, args.iterations // args.batch_size)
+    for _ in range(rounds):
+        backend.predict(batch)
+    throughput = rounds * len(batch) / (time.perf_counter() - t0)
+
+    top1 = []
+    for offset in range(0, len(inputs), args.batch_size):
+        top1.extend(int(i) for i in np.argmax(backend.predict(inputs[offset:offset + args.batch_size]), axis=1))
+
+    single.sort()
+    queue.put({
+        "backend": name,
+        "model_path": path,
+        "load_s": round(load_s, 3),
+        "rss_mb": round(rss_mb() - baseline, 1),
+        "p50_ms": round(statistics.median(single), 3),
+        "p99_ms": round(single[min(len(single) - 1, int(0.99 * len(single)))], 3),
+        f"throughput_batch{args.batch_size}_ips": round(throughput, 2),
+        "top1": top1,
+    })
+
+
+def collect(proc, queue, name: str, timeout: float) -> dict:
+    """The worker's result; raises if it crashes or runs past `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1.0)
+        except Empty:
+            pass
+        if proc.exitcode is not None:
+            try:
+                return queue.get(timeout=1.0)  # the result may land just after the exit
+            except Empty:
+                raise RuntimeError(f"{name} worker exited with code {proc.exitcode} without a result")
+        if time.monotonic() > deadline:
+            proc.terminate()
+            raise RuntimeError(f"{name} worker timed out after {timeout:g}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", action="append", required=True, metavar="BACKEND=PATH")
+    parser.add_argument("--images-dir", help="Real leaf images for agreement (random inputs otherwise)")
+    parser.add_argument("--samples", type=int, default=64)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds allowed per backend")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for spec in args.model:
+        name, path = spec.split("=", 1)
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_backend, args=(name, path, args, queue))
+        proc.start()
+        try:
+            results.append(collect(proc, queue, name, args.timeout))
+        except RuntimeError as e:
+            print(f"{name}: {e}", file=sys.stderr)
+        proc.join()
+    if not results:
+        raise SystemExit("No backend produced results")
+
+    reference = next((r["top1"] for r in results if r["backend"] == "keras"), results[0]["top1"])
+    for row in results:
+        agree = sum(a == b for a, b in zip(row.pop("top1"), reference))
+        row["top1_agreement"] = round(agree / len(reference), 4)
+        print(f"{row['backend']:>7}  p50 {row['p50_ms']:8.2f}ms  p99 {row['p99_ms']:8.2f}ms  "
+              f"{row[f'throughput_batch{args.batch_size}_ips']:8.1f} img/s  rss +{row['rss_mb']}MB  "
+              f"agree {row['top1_agreement']:.2%}")
+
+    report = json.dumps({"batch_size": args.batch_size, "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+In-Process Load & Benchmark Suite
+Starts the API in this process (lifespan included) against a throwaway SQLite
+database and drives it through httpx's ASGI transport, so runs are
+reproducible on any machine without a server, Postgres or TensorFlow.
+
+- model: `stub` is a deterministic fake (output derived from the pixels,
+  optional fixed compute time) plugged in behind the real batching path;
+  `real` uses whatever INFERENCE_BACKEND / model path is configured
+- images: synthetic leaves (seeded) in realistic phone sizes and JPEG/PNG/WebP
+- scenarios: health, register, login, detect at the given concurrency
+
+Unless --keep-cache is given, every detect upload is made unique (a few
+trailing bytes the decoders ignore) and the prediction cache is off, so each
+request pays for its own decode and inference instead of sharing a cached or
+in-flight result.
+
+Writes a JSON report with throughput, p50/p95/p99 per scenario and the
+per-stage detection timings (from the Prometheus histograms). Pass
+--compare to diff against an earlier report.
+
+Usage (from backend/):
+    python benchmarks/load_suite.py --concurrency 16 --requests 400 --output load.json
+    python benchmarks/load_suite.py --scenarios detect --sizes 640x480 4032x3024 --compare load.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+SCENARIOS = ("health", "register", "login", "detect")
+# "raw": what a preprocessing client sends (uint8 RGB already at the model resolution)
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "raw": (None, "application/vnd.krishinet.rgb8"),
+}
+PASSWORD = "benchmark-password-123"
+
+
+# ======================
+# Synthetic inputs
+# ======================
+
+def synthetic_leaf(rng: np.random.Generator, size: Tuple[int, int]) -> Image.Image:
+    """A green leaf on soil with brown lesions and sensor noise; content varies with the seed."""
+    width, height = size
+    background = rng.integers(60, 110, size=3)
+    image = Image.new("RGB", size, tuple(int(c) for c in background))
+    draw = ImageDraw.Draw(image)
+    leaf_color = (int(rng.integers(30, 80)), int(rng.integers(110, 180)), int(rng.integers(20, 70)))
+    draw.ellipse([width * 0.1, height * 0.15, width * 0.9, height * 0.85], fill=leaf_color)
+    for _ in range(int(rng.integers(3, 25))):
+        x, y = rng.uniform(0.2, 0.8) * width, rng.uniform(0.25, 0.75) * height
+        r = rng.uniform(0.005, 0.04) * width
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(int(rng.integers(90, 140)), int(rng.integers(50, 90)), 20))
+    pixels = np.asarray(image, dtype=np.int16)
+    pixels = pixels + rng.normal(0, 6, size=pixels.shape).astype(np.int16)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def build_images(sizes: List[Tuple[int, int]], formats: List[str], per_combo: int, seed: int,
+                 model_size: Tuple[int, int] = (256, 256)) -> List[dict]:
+    rng = np.random.default_rng(seed)
+    images = []
+    for size in sizes:
+        for fmt in formats:
+            pil_format, content_type = FORMATS[fmt]
+            for i in range(per_combo):
+                leaf = synthetic_leaf(rng, size)
+                if pil_format is None:
+                    data = leaf.resize(model_size, Image.BICUBIC).tobytes()
+                else:
+                    buffer = io.BytesIO()
+                    leaf.save(buffer, pil_format, quality=85)
+                    data = buffer.getvalue()
+                images.append({
+                    "name": f"leaf_{size[0]}x{size[1]}_{i}.{fmt}",
+                    "content_type": content_type,
+                    "data": data,
+                })
+    return images
+
+
+def unique_upload(image: dict, i: int) -> bytes:
+    """The image's bytes with a different sha256 for request `i`."""
+    tag = i.to_bytes(4, "little")
+    if image["content_type"] == FORMATS["raw"][1]:
+        return image["data"][:-len(tag)] + tag  # overwrites the last pixels; the size is fixed
+    return image["data"] + tag  # JPEG/PNG/WebP decoders stop at the end of the image
+
+
+class DeterministicModel:
+    """Stands in for an inference backend: same pixels, same answer."""
+
+    def __init__(self, classes: int, latency_ms: float):
+        self.classes = classes
+        self.latency = latency_ms / 1000.0
+        self.name = "bench-stub"
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if self.latency:
+            time.sleep(self.latency)
+        means = batch.reshape(len(batch), -1, 3).mean(axis=1)  # (n, 3)
+        indices = (means * 1000).astype(np.int64).sum(axis=1) % self.classes
+        out = np.full((len(batch), self.classes), 0.1 / (self.classes - 1), dtype=np.float32)
+        out[np.arange(len(batch)), indices] = 0.9
+        return out
+
+    def forward(self, batch: np.ndarray):
+        return self.predict(batch), None  # no features: nothing for the embedding log
+
+
+# ======================
+# Measurement
+# ======================
+
+def summarize(latencies: List[float], statuses: Counter, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3) if ordered else 0.0
+
+    return {
+        "requests": len(ordered),
+        "errors": sum(count for code, count in statuses.items() if code >= 400),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+async def drive(make_request: Callable[[int], "asyncio.Future"], total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                status = (await make_request(i)).status_code
+            except Exception:
+                status = 599
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def stage_histograms() -> Dict[str, dict]:
+    """Cumulative buckets, sum and count per detection stage."""
+    from app.core.metrics import registry
+
+    stages: Dict[str, dict] = {}
+    for family in registry.collect():
+        if family.name != "krishi_detection_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = stages.setdefault(sample.labels["stage"], {"buckets": {}, "sum": 0.0, "count": 0.0})
+            if sample.name.endswith("_bucket"):
+                stage["buckets"][float(sample.labels["le"])] = sample.value
+            elif sample.name.endswith("_sum"):
+                stage["sum"] = sample.value
+            elif sample.name.endswith("_count"):
+                stage["count"] = sample.value
+    return stages
+
+
+def stage_report(before: Dict[str, dict], after: Dict[str, dict]) -> Dict[str, dict]:
+    """Per-stage mean and bucket-interpolated percentiles for observations made in between."""
+    report = {}
+    for stage, end in after.items():
+        start = before.get(stage, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        count = end["count"] - start["count"]
+        if count <= 0:
+            continue
+        buckets = sorted((le, end["buckets"][le] - start["buckets"].get(le, 0.0)) for le in end["buckets"])
+
+        def quantile(q: float) -> float:
+            rank, lower, seen = q * count, 0.0, 0.0
+            for le, cumulative in buckets:
+                if cumulative >= rank:
+                    if le == float("inf"):
+                        return lower
+                    in_bucket = cumulative - seen
+                    fraction = (rank - seen) / in_bucket if in_bucket else 1.0
+                    return lower + (le - lower) * fraction
+                lower, seen = le, cumulative
+            return lower
+
+        report[stage] = {
+            "count": int(count),
+            "mean_ms": round((end["sum"] - start["sum"]) / count * 1000, 3),
+            "p50_ms": round(quantile(0.50) * 1000, 3),
+            "p95_ms": round(quantile(0.95) * 1000, 3),
+            "p99_ms": round(quantile(0.99) * 1000, 3),
+        }
+    return report
+
+
+# ======================
+# Scenarios
+# ======================
+
+async def register_users(client, prefix: str, count: int, concurrency: int) -> dict:
+    return await drive(
+        lambda i: client.post("/api/auth/register", json={"email": f"{prefix}{i}@example.com", "password": PASSWORD}),
+        count, concurrency,
+    )
+
+
+async def run_suite(args) -> dict:
+    import httpx
+    from app.main import app
+    from app.services.ml_service import ml_service
+    from app.services.prediction_cache import prediction_cache
+
+    # After importing app.main, whose setup_logging() resets the level: measure the service, not log I/O
+    logging.getLogger().setLevel(logging.WARNING)
+    results: Dict[str, dict] = {}
+
+    async with app.router.lifespan_context(app):
+        ml_service.load()
+        images = build_images(args.sizes, args.formats, args.images_per_combo, args.seed, ml_service.input_size)
+        args.avg_upload_kb = round(sum(len(image["data"]) for image in images) / len(images) / 1024, 1)
+        if args.model == "stub":
+            ml_service.activate(DeterministicModel(len(ml_service.classes), args.model_latency_ms), "bench-stub")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            # Accounts for login/detect; not part of any measurement
+            await register_users(client, "user", args.users, args.concurrency)
+            tokens = []
+            for i in range(args.users):
+                response = await client.post("/api/auth/login", json={"email": f"user{i}@example.com", "password": PASSWORD})
+                tokens.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+            for scenario in args.scenarios:
+                total = args.auth_requests if scenario in ("register", "login") else args.requests
+                if scenario == "health":
+                    request = lambda i: client.get("/health")  # noqa: E731
+                elif scenario == "register":
+                    prefix = f"new{int(time.time())}-"
+                    request = lambda i: client.post(  # noqa: E731
+                        "/api/auth/register", json={"email": f"{prefix}{i}@example.com", "password": PASSWORD})
+                elif scenario == "login":
+                    request = lambda i: client.post(  # noqa: E731
+                        "/api/auth/login", json={"email": f"user{i % args.users}@example.com", "password": PASSWORD})
+                else:
+                    def request(i):
+                        image = images[i % len(images)]
+                        data = unique_upload(image, i) if args.disable_cache else image["data"]
+                        return client.post(
+                            "/api/detect",
+                            files={"file": (image["name"], data, image["content_type"])},
+                            headers=tokens[i % len(tokens)],
+                        )
+
+                if args.disable_cache:
+                    prediction_cache.clear()
+                before = stage_histograms()
+                results[scenario] = await drive(request, total, args.concurrency)
+                if scenario == "detect":
+                    results[scenario]["stages"] = stage_report(before, stage_histograms())
+                row = results[scenario]
+                print(f"{scenario:>9}  {row['throughput_rps']:8.1f} req/s  p50 {row['p50_ms']:8.2f}ms  "
+                      f"p95 {row['p95_ms']:8.2f}ms  p99 {row['p99_ms']:8.2f}ms  errors {row['errors']}")
+    return results
+
+
+def compare(current: dict, previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)["results"]
+    print(f"\nvs {previous_path}:")
+    for scenario, row in current.items():
+        old = previous.get(scenario)
+        if not old:
+            continue
+        deltas = []
+        for key in ("throughput_rps", "p50_ms", "p99_ms"):
+            if old.get(key):
+                deltas.append(f"{key} {(row[key] - old[key]) / old[key]:+.1%}")
+        print(f"{scenario:>9}  " + "  ".join(deltas))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400, help="Requests for health/detect")
+    parser.add_argument("--auth-requests", type=int, default=64, help="Requests for register/login (bcrypt bound)")
+    parser.add_argument("--users", type=int, default=16, help="Accounts shared by login/detect")
+    parser.add_argument("--model", choices=("stub", "real"), default="stub")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="Fixed compute per stub batch")
+    parser.add_argument("--sizes", nargs="+", type=parse_size,
+                        default=[(640, 480), (1600, 1200), (4032, 3024)], help="WIDTHxHEIGHT")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["jpeg", "png", "webp"])
+    parser.add_argument("--images-per-combo", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-cache", dest="disable_cache", action="store_false",
+                        help="Send repeated images as they are and let the prediction cache serve them")
+    parser.add_argument("--database-url", help="Default: a fresh SQLite file in a temp dir")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--output", default="load_report.json")
+    parser.add_argument("--compare", help="Earlier report to diff against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="krishi-bench-")
+    os.environ.setdefault("DATABASE_URL", args.database_url or f"sqlite:///{workdir}/bench.db")
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+    os.environ["DEBUG"] = "false"
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Measure the service, not the per-user limits
+    os.environ["RATE_LIMIT_BACKEND"] = "memory"
+    os.environ["RATE_LIMIT_DETECT_PER_MINUTE"] = os.environ["RATE_LIMIT_DETECT_BURST"] = "1000000"
+    os.environ.setdefault("HEALTH_PROBE_INTERVAL_SECONDS", "1")
+    if args.disable_cache:
+        os.environ["PREDICTION_CACHE_MAX_ENTRIES"] = "0"
+    os.chdir(BACKEND_ROOT)
+
+    results = asyncio.run(run_suite(args))
+    report = {
+        "generated_at": time.time(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "scenarios": args.scenarios,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "auth_requests": args.auth_requests,
+            "model": args.model,
+            "model_latency_ms": args.model_latency_ms,
+            "sizes": [f"{w}x{h}" for w, h in args.sizes],
+            "formats": args.formats,
+            "avg_upload_kb": args.avg_upload_kb,
+            "prediction_cache": not args.disable_cache,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
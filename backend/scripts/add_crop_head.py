@@ -0,0 +1,173 @@
+"""
+Crop Head Training
+Adds crops (e.g. saffron, walnut and rice for J&K) to a backbone + heads
+model version without retraining or growing the backbone: the photos are
+run through the frozen backbone once, and a softmax head per crop is fitted
+on those features with NumPy.
+
+Training photos go in one folder per class, named like PlantVillage labels:
+
+    jk_leaves/Saffron___Corm_rot/*.jpg
+    jk_leaves/Saffron___healthy/*.jpg
+    jk_leaves/Walnut___Anthracnose/*.jpg
+    jk_leaves/Rice___Blast/*.jpg
+    ...
+
+The result is a new registry version (backbone file copied, classes
+extended, one head per crop in the data, existing heads kept). Ship it with
+registry.json like any other version, ideally as a canary first. The "all"
+head is unchanged, so the new crops' classes are only predicted for
+requests that send the matching `crop` hint.
+
+Usage (from backend/):
+    python scripts/add_crop_head.py --base ../ai-models/registry/2024-06-heads \\
+        --data-dir ./jk_leaves --out ../ai-models/registry/2024-08-jk
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services import preprocessing  # noqa: E402
+from app.services.crop_heads import CropHead, crop_key, load_heads, save_heads  # noqa: E402
+from app.services.inference_backends import create_backend  # noqa: E402
+from app.services.ml_service import INPUT_SIZE  # noqa: E402
+from app.services.model_registry import ModelRegistry  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+logger = logging.getLogger("add_crop_head")
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def labelled_images(data_dir: str) -> Dict[str, List[str]]:
+    """"Crop___Disease" folder name → image paths."""
+    labelled = {}
+    for label in sorted(os.listdir(data_dir)):
+        folder = os.path.join(data_dir, label)
+        if not os.path.isdir(folder):
+            continue
+        if "___" not in label:
+            raise SystemExit(f"Class folder '{label}' must be named Crop___Disease")
+        paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                 if name.lower().endswith(IMAGE_SUFFIXES)]
+        if paths:
+            labelled[label] = paths
+    return labelled
+
+
+def extract_features(backend, paths: List[str], batch_size: int) -> np.ndarray:
+    """Backbone features for each image, preprocessed exactly like the API does."""
+    width, height = backend.input_size or INPUT_SIZE
+    images = np.empty((batch_size, height, width, 3), dtype=np.uint8)
+    buffer = preprocessing.allocate_batch(batch_size, (width, height))
+    blocks = []
+    for start in range(0, len(paths), batch_size):
+        chunk = paths[start:start + batch_size]
+        for row, path in zip(images, chunk):
+            with open(path, "rb") as f:
+                preprocessing.decode_into(f, row)
+        blocks.append(np.array(backend.predict(preprocessing.normalize_into(images[:len(chunk)], buffer))))
+    return np.concatenate(blocks).astype(np.float32)
+
+
+def fit_softmax(features: np.ndarray, labels: np.ndarray, num_classes: int,
+                epochs: int, lr: float, l2: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Full-batch gradient descent on cross-entropy; heads are tiny, so this takes seconds."""
+    weight = np.zeros((features.shape[1], num_classes), dtype=np.float32)
+    bias = np.zeros(num_classes, dtype=np.float32)
+    targets = np.eye(num_classes, dtype=np.float32)[labels]
+    for _ in range(epochs):
+        logits = features @ weight + bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        grad = (probs - targets) / len(features)
+        weight -= lr * (features.T @ grad + l2 * weight)
+        bias -= lr * grad.sum(axis=0)
+    return weight, bias
+
+
+def split(count: int, val_fraction: float, rng) -> Tuple[np.ndarray, np.ndarray]:
+    order = rng.permutation(count)
+    n_val = int(round(count * val_fraction)) if count > 1 else 0
+    return order[n_val:], order[:n_val]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", required=True, help="Registry version dir with a backbone + heads.npz")
+    parser.add_argument("--data-dir", required=True, help="One folder of photos per Crop___Disease class")
+    parser.add_argument("--out", required=True, help="New registry version dir to create")
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    base = os.path.abspath(args.base)
+    manifest = ModelRegistry(os.path.dirname(base), "onnx", {}).manifest(os.path.basename(base))
+    if not manifest.heads_path:
+        raise SystemExit(f"{base} is not a backbone + heads version (no 'heads' in its manifest)")
+    if os.path.exists(args.out):
+        raise SystemExit(f"{args.out} already exists")
+
+    backend = create_backend(manifest.backend, manifest.path)
+    backend.load()
+    classes = list(manifest.classes)
+    heads = load_heads(manifest.heads_path, len(classes))
+
+    by_crop: Dict[str, List[str]] = {}
+    labelled = labelled_images(args.data_dir)
+    for label in labelled:
+        by_crop.setdefault(crop_key(label), []).append(label)
+        if label not in classes:
+            classes.append(label)
+
+    rng = np.random.default_rng(args.seed)
+    report = {}
+    for crop, labels in sorted(by_crop.items()):
+        features, targets = [], []
+        for position, label in enumerate(labels):
+            features.append(extract_features(backend, labelled[label], args.batch_size))
+            targets.append(np.full(len(labelled[label]), position))
+        features, targets = np.concatenate(features), np.concatenate(targets)
+
+        train, val = split(len(features), args.val_fraction, rng)
+        weight, bias = fit_softmax(features[train], targets[train], len(labels), args.epochs, args.lr, args.l2)
+        head = CropHead(crop, weight, bias, np.asarray([classes.index(label) for label in labels]))
+        accuracy = float(np.mean(np.argmax(head.scores(features[val]), axis=1) == targets[val])) if len(val) else None
+        if crop in heads:
+            logger.warning(f"Replacing existing '{crop}' head")
+        heads[crop] = head
+        report[crop] = {"classes": labels, "images": len(features), "val_accuracy": accuracy}
+        logger.info(f"{crop}: {len(labels)} classes, {len(features)} images, val accuracy {accuracy}")
+
+    os.makedirs(args.out)
+    shutil.copy2(manifest.path, os.path.join(args.out, os.path.basename(manifest.path)))
+    save_heads(os.path.join(args.out, "heads.npz"), heads)
+    out_manifest = {
+        **manifest.metadata,
+        "backend": manifest.backend,
+        "file": os.path.basename(manifest.path),
+        "heads": "heads.npz",
+        "classes": classes,
+        "base_version": manifest.version,
+        "crops_added": report,
+    }
+    with open(os.path.join(args.out, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(out_manifest, f, indent=2)
+    logger.info(f"Wrote registry version {args.out} with heads: {', '.join(sorted(heads))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Model Export & Quantization
+Converts the Keras disease model (.h5) into the formats served by the
+tflite and onnx inference backends (see app/services/inference_backends.py).
+
+The tflite and onnx files have two outputs, class probabilities and the
+penultimate-layer features (the final Dense layer's input), so detections
+also record embeddings for similar-case search.
+
+Formats:
+    tflite-fp16   float16 weights, float32 I/O
+    tflite-int8   full-integer INT8 kernels, float32 I/O (needs calibration images)
+    onnx          float32 ONNX (needs tf2onnx)
+    onnx-int8     static INT8 QDQ ONNX (needs tf2onnx + onnxruntime, calibration images)
+    onnx-heads    registry version dir: float32 ONNX feature backbone (the model
+                  without its final Dense layer) + per-crop heads.npz + manifest.json
+                  (see app/services/crop_heads.py; add crops with scripts/add_crop_head.py)
+
+Usage (from backend/):
+    python scripts/export_model.py --model ../ai-models/trained_models/disease_model.h5 \\
+        --formats tflite-fp16 tflite-int8 onnx onnx-int8 --calibration-dir ./calibration_leaves
+
+Calibration images should be real leaf photos (a few hundred covering all
+classes). Without them random inputs are used, which gives poor INT8 scales.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Iterator, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services import preprocessing  # noqa: E402
+from app.services.crop_heads import heads_from_dense, save_heads  # noqa: E402
+from app.services.inference_backends import with_features  # noqa: E402
+from app.services.model_registry import PLANTVILLAGE_CLASSES  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+logger = logging.getLogger("export_model")
+
+FORMATS = ("tflite-fp16", "tflite-int8", "onnx", "onnx-int8", "onnx-heads")
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def calibration_batches(calibration_dir: str, size, limit: int) -> List[np.ndarray]:
+    """float32 (1, H, W, 3) samples, preprocessed exactly like the API does."""
+    buffer = preprocessing.allocate_batch(1, size)
+    samples = []
+    if calibration_dir:
+        for name in sorted(os.listdir(calibration_dir)):
+            if not name.lower().endswith(IMAGE_SUFFIXES):
+                continue
+            with open(os.path.join(calibration_dir, name), "rb") as f:
+                decoded = preprocessing.decode(f.read(), size)
+            samples.append(preprocessing.normalize_into([decoded], buffer).copy())
+            if len(samples) >= limit:
+                break
+    if not samples:
+        logger.warning("No calibration images found; using random inputs. INT8 accuracy will suffer.")
+        rng = np.random.default_rng(0)
+        samples = [rng.random((1, size[1], size[0], 3), dtype=np.float32) for _ in range(min(limit, 32))]
+    logger.info(f"Using {len(samples)} calibration samples")
+    return samples
+
+
+def export_tflite(model, out_path: str, int8: bool, samples: List[np.ndarray]):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if int8:
+        def representative() -> Iterator[List[np.ndarray]]:
+            for sample in samples:
+                yield [sample]
+
+        converter.representative_dataset = representative
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        converter.target_spec.supported_types = [tf.float16]
+
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+    logger.info(f"Wrote {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB)")
+
+
+def export_onnx(model, out_path: str, size):
+    import tensorflow as tf
+    import tf2onnx
+
+    signature = [tf.TensorSpec([None, size[1], size[0], 3], tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=out_path)
+    logger.info(f"Wrote {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB)")
+
+
+def quantize_onnx(float_path: str, out_path: str, samples: List[np.ndarray]):
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = ort.InferenceSession(float_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._samples = iter(samples)
+
+        def get_next(self):
+            sample = next(self._samples, None)
+            return None if sample is None else {input_name: sample}
+
+    quantize_static(
+        float_path, out_path, Reader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    logger.info(f"Wrote {out_path} ({os.path.getsize(out_path) / 1e6:.1f} MB)")
+
+
+def export_heads_version(model, out_dir: str, size, source: str):
+    import tensorflow as tf
+
+    dense = next(layer for layer in reversed(model.layers) if isinstance(layer, tf.keras.layers.Dense))
+    weight, bias = dense.get_weights()
+    if weight.shape[1] != len(PLANTVILLAGE_CLASSES):
+        raise SystemExit(f"Final Dense layer has {weight.shape[1]} outputs, expected {len(PLANTVILLAGE_CLASSES)}")
+    backbone = tf.keras.Model(model.inputs, dense.input)
+
+    os.makedirs(out_dir, exist_ok=True)
+    export_onnx(backbone, os.path.join(out_dir, "backbone.onnx"), size)
+    heads = heads_from_dense(weight, bias, PLANTVILLAGE_CLASSES)
+    save_heads(os.path.join(out_dir, "heads.npz"), heads)
+    manifest = {
+        "backend": "onnx",
+        "file": "backbone.onnx",
+        "heads": "heads.npz",
+        "classes": list(PLANTVILLAGE_CLASSES),
+        "source": source,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Wrote registry version {out_dir} ({len(heads)} heads, {weight.shape[0]} features)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="Path to the Keras .h5 model")
+    parser.add_argument("--out-dir", help="Output directory (default: next to the model)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--calibration-dir", help="Directory of representative leaf images")
+    parser.add_argument("--calibration-limit", type=int, default=300)
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(args.model)
+    size = (int(model.input_shape[2]), int(model.input_shape[1]))
+    classifier = with_features(tf, model)
+    out_dir = args.out_dir or os.path.dirname(os.path.abspath(args.model))
+    stem = os.path.splitext(os.path.basename(args.model))[0]
+    os.makedirs(out_dir, exist_ok=True)
+
+    samples = []
+    if {"tflite-int8", "onnx-int8"} & set(args.formats):
+        samples = calibration_batches(args.calibration_dir, size, args.calibration_limit)
+
+    if "tflite-fp16" in args.formats:
+        export_tflite(classifier, os.path.join(out_dir, f"{stem}_fp16.tflite"), int8=False, samples=samples)
+    if "tflite-int8" in args.formats:
+        export_tflite(classifier, os.path.join(out_dir, f"{stem}_int8.tflite"), int8=True, samples=samples)
+
+    onnx_path = os.path.join(out_dir, f"{stem}.onnx")
+    if {"onnx", "onnx-int8"} & set(args.formats):
+        export_onnx(classifier, onnx_path, size)
+    if "onnx-int8" in args.formats:
+        quantize_onnx(onnx_path, os.path.join(out_dir, f"{stem}_int8.onnx"), samples)
+    if "onnx-heads" in args.formats:
+        export_heads_version(model, os.path.join(out_dir, f"{stem}-heads"), size, os.path.basename(args.model))
+
+
+if __name__ == "__main__":
+    main()
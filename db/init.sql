@@ -22,3 +22,21 @@ CREATE TABLE crops (
     name VARCHAR(100) NOT NULL,
     optimal_conditions TEXT
 );
+
+CREATE TABLE scans (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    class_index INTEGER NOT NULL,
+    disease_name VARCHAR NOT NULL,
+    confidence FLOAT NOT NULL,
+    model_version VARCHAR NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    latitude FLOAT,
+    longitude FLOAT,
+    image_sha256 VARCHAR(64)
+);
+
+CREATE INDEX ix_scans_user_id ON scans (user_id);
+CREATE INDEX ix_scans_disease_name ON scans (disease_name);
+CREATE INDEX ix_scans_created_at ON scans (created_at);
+CREATE INDEX ix_scans_image_sha256 ON scans (image_sha256);
@@ -19,6 +19,7 @@ except ImportError as e:
 
 def verify_model():
     print(f"Checking model at: {os.path.abspath('../ai-models/trained_models/disease_model.h5')}")
+    ml_service.load()  # the service loads lazily; block until it is done
     print(f"Current ML Mode: {ml_service.mode}")
     
     if ml_service.mode != "REAL":